@@ -0,0 +1,18 @@
+"""Add (user_id, timestamp, id) index to chat_history table"""
+from sqlalchemy import create_engine, text
+from config import settings
+
+engine = create_engine(settings.database_url)
+
+with engine.connect() as conn:
+    try:
+        # Composite index used by the keyset-paginated history API
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_chat_history_user_timestamp_id
+            ON chat_history (user_id, timestamp, id)
+        """))
+        conn.commit()
+        print("✅ Added (user_id, timestamp, id) index to chat_history table")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print("Note: Index might already exist")
@@ -0,0 +1,22 @@
+"""Add conversation_id column to chat_history table"""
+from sqlalchemy import create_engine, text
+from config import settings
+
+engine = create_engine(settings.database_url)
+
+with engine.connect() as conn:
+    try:
+        # Add conversation_id column (server-held conversations)
+        conn.execute(text("""
+            ALTER TABLE chat_history 
+            ADD COLUMN IF NOT EXISTS conversation_id VARCHAR
+        """))
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_chat_history_conversation_id
+            ON chat_history (conversation_id)
+        """))
+        conn.commit()
+        print("✅ Added conversation_id column to chat_history table")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print("Note: Column might already exist")
@@ -0,0 +1,18 @@
+"""Add history_cleared_before column to users table"""
+from sqlalchemy import create_engine, text
+from config import settings
+
+engine = create_engine(settings.database_url)
+
+with engine.connect() as conn:
+    try:
+        # Add history_cleared_before column (soft-delete watermark for chat history)
+        conn.execute(text("""
+            ALTER TABLE users 
+            ADD COLUMN IF NOT EXISTS history_cleared_before TIMESTAMP
+        """))
+        conn.commit()
+        print("✅ Added history_cleared_before column to users table")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print("Note: Column might already exist")
@@ -1,183 +1,688 @@
 """
-AI Service - Handles all AI-related functionality using Google Gemini API
+AI Service - Handles all AI-related functionality (Google Gemini by default, see llm_providers.py)
 """
 
-from typing import List, Dict
+from typing import List, Dict, Optional
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import asyncio
+import functools
+import queue
+import hashlib
 import json
-import google.generativeai as genai
+import sqlite3
+import threading
+import time
 from config import settings
+from streaming import iterate_in_thread
+from conversation import ContextWindow, estimate_tokens
+from llm_providers import build_provider, has_tier
+from resilience import (
+    QUOTA, REJECTED, TRANSIENT, AdaptiveLimiter, CircuitBreaker, Hedger, LatencyTracker, RetryPolicy,
+    ServiceUnavailable, classify_error
+)
+from prompts import get_system_prompt
+from database import SessionLocal
+from question_bank import QuestionBank
+from prewarm import CacheWarmer, PopularityTracker, load_configured_inputs
+from metrics import AICallMetrics
+from generation_profiles import GenerationProfiles
+from routing import ModelRouter
+from dsa_library import demo_solutions
+from mock_tests import (
+    QuestionStreamParser, build_prompt, dedupe_questions, demo_questions, number_questions, parse_questions
+)
+
+
+class ResponseCache:
+    """Two-tier cache for AI responses: a bounded in-memory LRU in front of a SQLite file.
+    
+    The memory tier answers hot keys without I/O; the SQLite tier survives restarts
+    and refills the memory tier on a hit. Every entry carries its own expiry time;
+    expired entries are kept for stale_seconds more so they can still be served
+    (get_stale) while the upstream is down.
+    """
+    
+    def __init__(self, path: str, max_entries: int = 512, stale_seconds: int = 7 * 24 * 3600):
+        self.max_entries = max_entries
+        self.stale_seconds = stale_seconds
+        self._memory = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS ai_responses ("
+                "key TEXT PRIMARY KEY, endpoint TEXT, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS ix_ai_responses_expires ON ai_responses (expires_at)")
+            self._db.commit()
+            self.purge_expired()
+    
+    @staticmethod
+    def make_key(prompt: str, config: Dict) -> str:
+        """Build a cache key from the normalized prompt and the generation config"""
+        normalized = " ".join(prompt.split()).lower()
+        payload = json.dumps({"prompt": normalized, "config": config}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def _count(self, endpoint: str, field: str):
+        counters = self._stats.setdefault(
+            endpoint or "default", {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stale_hits": 0}
+        )
+        counters[field] += 1
+    
+    def get(self, key: str, endpoint: str = None) -> Optional[str]:
+        """Return a cached response, or None if it is missing or expired"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] > now:
+                self._memory.move_to_end(key)
+                self._count(endpoint, "memory_hits")
+                return entry[1]
+            
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM ai_responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    self._store_in_memory(key, row[0], row[1])
+                    self._count(endpoint, "disk_hits")
+                    return row[0]
+            
+            self._count(endpoint, "misses")
+            return None
+    
+    def peek(self, key: str) -> Optional[tuple]:
+        """(expires_at, value) of a cached entry, expired or not, without counting a hit or miss"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                return entry
+            if self._db is not None:
+                row = self._db.execute("SELECT expires_at, value FROM ai_responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    return row[0], row[1]
+            return None
+    
+    def get_stale(self, key: str, endpoint: str = None) -> Optional[str]:
+        """Return a response even if it has expired (fallback while the upstream is unavailable)"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._count(endpoint, "stale_hits")
+                return entry[1]
+            if self._db is not None:
+                row = self._db.execute("SELECT value FROM ai_responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._count(endpoint, "stale_hits")
+                    return row[0]
+            return None
+    
+    def set(self, key: str, value: str, ttl: int, endpoint: str = None):
+        """Store a response in both tiers for ttl seconds"""
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._store_in_memory(key, value, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO ai_responses (key, endpoint, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, endpoint, value, expires_at)
+                )
+                self._db.commit()
+    
+    def _store_in_memory(self, key: str, value: str, expires_at: float):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+    
+    def purge_expired(self) -> int:
+        """Drop rows past their stale window from the SQLite tier, returns number of rows removed"""
+        if self._db is None:
+            return 0
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM ai_responses WHERE expires_at <= ?", (time.time() - self.stale_seconds,)
+            )
+            self._db.commit()
+            return cursor.rowcount
+    
+    def stats(self) -> Dict:
+        """Hit/miss counters per endpoint plus tier sizes"""
+        with self._lock:
+            endpoints = {}
+            for endpoint, counters in self._stats.items():
+                hits = counters["memory_hits"] + counters["disk_hits"]
+                total = hits + counters["misses"]
+                endpoints[endpoint] = dict(counters, hit_rate=round(hits / total, 3) if total else 0.0)
+            return {
+                "memory_entries": len(self._memory),
+                "max_memory_entries": self.max_entries,
+                "persistent": self._db is not None,
+                "endpoints": endpoints
+            }
+
+
+class _StreamFlight:
+    """Shared state of one in-flight upstream stream"""
+    
+    def __init__(self, factory):
+        self.factory = factory
+        self.source = None
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.pulling = False
+        self.subscribers = 0
+        self.cond = threading.Condition()
+
+
+class SingleFlight:
+    """Coalesces concurrent identical AI calls so they share one upstream request.
+    
+    The first caller for a key (the leader) runs the call; callers that arrive while
+    it is in flight wait for and receive the same result. Streams work the same way:
+    a late joiner first replays the chunks already emitted, then follows the live stream.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}    # key -> Future
+        self._streams = {}  # key -> _StreamFlight
+        self._stats = {"calls": 0, "coalesced_calls": 0, "streams": 0, "coalesced_streams": 0}
+    
+    def do(self, key: str, func):
+        """Run func() once per key at a time and share its result (or exception)"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self._stats["calls"] += 1
+            else:
+                self._stats["coalesced_calls"] += 1
+        
+        if not leader:
+            return future.result()
+        
+        try:
+            result = func()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+    
+    def stream(self, key: str, factory):
+        """Iterate the stream produced by factory(), shared with concurrent callers of the same key"""
+        with self._lock:
+            flight = self._streams.get(key)
+            if flight is None:
+                flight = _StreamFlight(factory)
+                self._streams[key] = flight
+                self._stats["streams"] += 1
+            else:
+                self._stats["coalesced_streams"] += 1
+            flight.subscribers += 1
+        return self._follow(key, flight)
+    
+    def _follow(self, key: str, flight: _StreamFlight):
+        index = 0
+        try:
+            while True:
+                with flight.cond:
+                    # Wait until there is an unseen chunk, the stream ended, or nobody is pulling
+                    while index >= len(flight.chunks) and not flight.done and flight.pulling:
+                        flight.cond.wait()
+                    if index < len(flight.chunks):
+                        chunk = flight.chunks[index]
+                        index += 1
+                    elif flight.done:
+                        if flight.error is not None:
+                            raise flight.error
+                        return
+                    else:
+                        flight.pulling = True
+                        chunk = None
+                
+                if chunk is not None:
+                    yield chunk
+                    continue
+                
+                # This subscriber pulls the next chunk from upstream on behalf of everyone
+                self._pull(key, flight)
+        finally:
+            with self._lock:
+                flight.subscribers -= 1
+                abandoned = flight.subscribers == 0 and not flight.done
+                if (abandoned or flight.done) and self._streams.get(key) is flight:
+                    del self._streams[key]
+            if abandoned and flight.source is not None and hasattr(flight.source, "close"):
+                flight.source.close()
+    
+    def _pull(self, key: str, flight: _StreamFlight):
+        chunk, done, error = None, False, None
+        try:
+            if flight.source is None:
+                flight.source = iter(flight.factory())
+            chunk = next(flight.source)
+        except StopIteration:
+            done = True
+        except Exception as e:
+            done, error = True, e
+        
+        if done:
+            with self._lock:
+                if self._streams.get(key) is flight:
+                    del self._streams[key]
+        with flight.cond:
+            if chunk is not None:
+                flight.chunks.append(chunk)
+            flight.done = done
+            flight.error = error
+            flight.pulling = False
+            flight.cond.notify_all()
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls), streams_in_flight=len(self._streams))
+
 
 class AIService:
+    # Cache lifetime (seconds) for endpoints whose output depends only on the prompt.
+    # Endpoints not listed here are never cached.
+    CACHE_TTLS = {
+        "explain_topic": 7 * 24 * 3600,
+        "generate_notes": 7 * 24 * 3600,
+        "interview_prep": 3 * 24 * 3600,
+        "project_guidance": 7 * 24 * 3600,
+        "generate_study_plan": 24 * 3600,
+        "solve_previous_year": 30 * 24 * 3600,
+    }
+    
+
     def __init__(self):
-        # Initialize Gemini API
-        if settings.gemini_api_key and settings.gemini_api_key != "your-gemini-api-key-here":
-            genai.configure(api_key=settings.gemini_api_key)
-            # Use gemini-flash-latest for fast responses
-            self.model = genai.GenerativeModel('gemini-flash-latest')
+        # Dedicated pool for blocking SDK calls so async routes never block the event loop
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.ai_executor_workers,
+            thread_name_prefix="ai-service"
+        )
+        
+        self.profiles = GenerationProfiles(settings.ai_generation_profiles)
+        self.cache = ResponseCache(settings.ai_cache_path, settings.ai_cache_max_entries)
+        self.flights = SingleFlight()
+        self.limiter = AdaptiveLimiter(
+            initial_limit=settings.ai_concurrency_initial,
+            min_limit=settings.ai_concurrency_min,
+            max_limit=settings.ai_concurrency_max,
+            latency_threshold=settings.ai_concurrency_latency_threshold_seconds
+        )
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.ai_breaker_failure_threshold,
+            reset_timeout=settings.ai_breaker_reset_seconds
+        )
+        self.retry = RetryPolicy(
+            max_attempts=settings.ai_retry_attempts,
+            base_delay=settings.ai_retry_base_delay_seconds,
+            max_delay=settings.ai_retry_max_delay_seconds
+        )
+        self.latencies = LatencyTracker()
+        self.metrics = AICallMetrics(settings.ai_metrics_log_path)
+        # Hedges run on their own pool so a backup request never waits behind the calls it backs up
+        self._hedge_executor = ThreadPoolExecutor(
+            max_workers=settings.ai_executor_workers,
+            thread_name_prefix="ai-hedge"
+        )
+        # Shards of large mock tests; separate from _executor, whose workers wait on them
+        self._shard_executor = ThreadPoolExecutor(
+            max_workers=settings.ai_executor_workers,
+            thread_name_prefix="ai-shard"
+        )
+        self.hedger = Hedger(
+            self._hedge_executor,
+            self.latencies,
+            [name.strip() for name in settings.ai_hedge_endpoints.split(",") if name.strip()],
+            percent=settings.ai_hedge_percentile,
+            min_delay=settings.ai_hedge_min_delay_seconds
+        )
+        self.question_bank = QuestionBank(
+            SessionLocal,
+            self._executor,
+            self._generate_questions,
+            min_pool=settings.question_bank_min_pool,
+            refill_size=settings.question_bank_refill_size,
+            serve_multiple=settings.question_bank_serve_multiple
+        )
+        # Request counts of cacheable prompts, used to pick what the off-peak job pre-warms
+        self.popularity = PopularityTracker()
+        self._warming = threading.local()
+        self.warmer = CacheWarmer(
+            self,
+            load_configured_inputs(settings.ai_prewarm_file),
+            top_n=settings.ai_prewarm_top_n,
+            max_calls=settings.ai_prewarm_max_calls,
+            pause=settings.ai_prewarm_pause_seconds,
+            refresh_within=settings.ai_prewarm_refresh_within_hours * 3600,
+            hours=settings.ai_prewarm_hours
+        )
+        self.context_window = ContextWindow(
+            budget_tokens=settings.chat_context_token_budget,
+            summary_tokens=settings.chat_summary_token_budget
+        )
+        
+        # Initialize the provider chain (Gemini, OpenAI, Anthropic, ... in configured order),
+        # plus chains for the fast / large tiers when they have models of their own
+        shared = {}
+        self.provider = build_provider(settings, "standard", shared)
+        self.tier_providers = {}
+        for tier in ("fast", "large"):
+            if settings.ai_model_routing and has_tier(settings, tier):
+                chain = build_provider(settings, tier, shared)
+                if chain is not None:
+                    self.tier_providers[tier] = chain
+        self.router = ModelRouter(
+            self.profiles,
+            self.tier_providers,
+            enabled=settings.ai_model_routing,
+            fast_max_prompt_tokens=settings.ai_route_fast_max_prompt_tokens,
+            large_plans=[plan.strip() for plan in settings.ai_route_large_plans.split(",") if plan.strip()],
+            slow_p95_seconds=settings.ai_route_slow_p95_seconds
+        )
+        if self.provider is not None:
             self.use_ai = True
-            print("✅ Gemini AI initialized successfully")
+            print(f"✅ AI providers initialized: {self.provider.name}")
         else:
             self.use_ai = False
-            print("⚠️ Gemini API key not configured, using demo mode")
+            print("⚠️ No AI provider API key configured, using demo mode")
+    
+    @property
+    def model_name(self) -> str:
+        return self.provider.name if self.provider is not None else "demo"
+    
+    def _provider(self, tier: str = "standard"):
+        """Provider chain serving a model tier (the standard chain unless the tier has its own)"""
+        return self.tier_providers.get(tier) or self.provider
+    
+    def _run_in_executor(self, func, *args, **kwargs):
+        """Run a blocking AIService call on the dedicated executor and return an awaitable"""
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+    
+    def shutdown(self):
+        """Release executor threads (called on application shutdown)"""
+        self.warmer.stop()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._hedge_executor.shutdown(wait=False, cancel_futures=True)
+        self._shard_executor.shutdown(wait=False, cancel_futures=True)
+    
+    def forget_conversation(self, user_id: int):
+        """Drop cached conversation state (summary, provider chat session) for a user"""
+        self.context_window.forget(user_id)
+        if self.provider is not None:
+            self.provider.forget_session(user_id)
+        for provider in self.tier_providers.values():
+            provider.forget_session(user_id)
+    
+    def get_stats(self) -> Dict:
+        """Runtime statistics for the admin dashboard"""
+        return {
+            "use_ai": self.use_ai,
+            "model": self.model_name,
+            "provider": self.provider.stats() if self.provider is not None else None,
+            "tier_providers": {tier: provider.stats() for tier, provider in self.tier_providers.items()},
+            "routing": self.router.stats(),
+            "cache": dict(self.cache.stats(), ttls=self.CACHE_TTLS),
+            "single_flight": self.flights.stats(),
+            "limiter": self.limiter.stats(),
+            "circuit_breaker": self.breaker.stats(),
+            "retries": self.retry.stats(),
+            "hedging": self.hedger.stats(),
+            "latency": self.latencies.stats(),
+            "generation_profiles": self.profiles.stats(),
+            "question_bank": self.question_bank.stats(),
+            "prewarm": dict(self.warmer.stats(), **self.popularity.stats())
+        }
+    
+    def _request_key(self, prompt: str, system: str = None, history: List = None, session_key=None,
+                     endpoint: str = None, tier: str = "standard") -> str:
+        """Identity of an upstream request, shared by the cache and request coalescing"""
+        if system or history:
+            prompt = "\x00".join([system or "", *(f"{role}: {content}" for role, content in history or []), prompt])
+        provider = self._provider(tier)
+        model = provider.name if provider is not None else "demo"
+        return ResponseCache.make_key(prompt, {"model": model, "session": session_key,
+                                               **self.profiles.config(endpoint)})
+    
+    @staticmethod
+    def _request_text(prompt: str, system: str = None, history: List = None) -> str:
+        """Everything sent upstream for a request, for size and token accounting"""
+        if not system and not history:
+            return prompt
+        return "\n".join([system or "", *(content for _, content in history or []), prompt])
+    
+    def _admit(self):
+        """Pass the circuit breaker and take a concurrency slot, or raise ServiceUnavailable"""
+        if not self.breaker.allow():
+            raise ServiceUnavailable("AI service is recovering from repeated failures")
+        if not self.limiter.acquire(settings.ai_limiter_queue_timeout_seconds):
+            self.breaker.cancel()
+            raise ServiceUnavailable("AI service is at capacity")
+    
+    def _finish(self, success: Optional[bool], latency: Optional[float] = None):
+        """Report the outcome of an admitted call to the limiter and breaker; None is neutral"""
+        self.limiter.release(success, latency)
+        if success is None:
+            self.breaker.cancel()
+        elif success:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+    
+    def _attempt(self, prompt: str, system: str = None, history: List = None,
+                 session_key=None, endpoint: str = None, tier: str = "standard") -> str:
+        """Single upstream call through the provider chain of a tier; raises on failure"""
+        self._admit()
+        provider = self._provider(tier)
+        started = time.monotonic()
+        success = False
+        text = error_class = None
+        try:
+            text = provider.generate(prompt, system, history, self.profiles.config(endpoint), session_key)
+            success = True
+            self.latencies.record(endpoint, time.monotonic() - started)
+            self.router.record(tier, time.monotonic() - started)
+            return text
+        except ServiceUnavailable:
+            # Shed by the local quota scheduler: the upstream was never asked
+            success = None
+            error_class = REJECTED
+            raise
+        except Exception as e:
+            error_class = classify_error(e)
+            if error_class not in (TRANSIENT, QUOTA):
+                # A bad request or blocked prompt says nothing about the upstream's health
+                success = None
+            raise
+        finally:
+            latency = time.monotonic() - started
+            self._finish(success, latency)
+            self.metrics.record_call(endpoint, latency, self._request_text(prompt, system, history), text,
+                                     error_class, provider.name, tier=tier)
+    
+    def _call_model(self, prompt: str, system: str = None, history: List = None,
+                    session_key=None, endpoint: str = None, tier: str = "standard") -> str:
+        """Upstream call with retries on transient errors and, for slow calls, a hedged backup"""
+        attempt = lambda: self._attempt(prompt, system, history, session_key, endpoint, tier)
+        return self.retry.call(lambda: self.hedger.call(attempt, endpoint))
+    
+    def _call_model_stream(self, prompt: str, system: str = None, history: List = None,
+                           session_key=None, endpoint: str = None, tier: str = "standard"):
+        """Upstream streaming call through the provider chain; yields text chunks and raises on failure.
+        
+        Transient errors are retried only until the first chunk was sent, since the
+        client cannot un-see partial output.
+        """
+        attempt = 1
+        while True:
+            self._admit()
+            provider = self._provider(tier)
+            success, started, error_class = None, False, None
+            parts, began, served_by = [], time.monotonic(), None
+            try:
+                for chunk in provider.stream(prompt, system, history, self.profiles.config(endpoint), session_key):
+                    started = True
+                    # A failover chain tags its chunks with the provider actually streaming them
+                    served_by = getattr(chunk, "model", None) or served_by
+                    parts.append(chunk)
+                    yield chunk
+                success = True
+                self.router.record(tier, time.monotonic() - began)
+                return
+            except Exception as e:
+                error_class = classify_error(e)
+                success = False if error_class in (TRANSIENT, QUOTA) else None
+                if started or not self.retry.retryable(e, attempt):
+                    raise
+            finally:
+                # A stream abandoned by its client is neither a success nor an upstream failure
+                self._finish(success)
+                self.metrics.record_call(endpoint, time.monotonic() - began, self._request_text(prompt, system, history),
+                                         "".join(parts) if started or success else None,
+                                         error_class, served_by or provider.name, streamed=True, tier=tier)
+            time.sleep(self.retry.backoff(attempt))
+            attempt += 1
+    
+    @staticmethod
+    def _unavailable_message(error: Exception) -> str:
+        """User-facing text returned in place of an answer when the upstream call failed"""
+        return f"⚠️ AI service temporarily unavailable. Error: {str(error)[:100]}\n\nPlease try again in a moment."
+    
+    def _route(self, prompt: str, endpoint: str = None, plan: str = None) -> str:
+        """Model tier for a request, sized by the new message (system prompt and history are similar for all turns)"""
+        return self.router.route(endpoint, estimate_tokens(prompt), plan)
+    
+    def _generate(self, prompt: str, endpoint: str = None, system: str = None,
+                  history: List = None, session_key=None, plan: str = None) -> str:
+        """Generate a response, served from cache when the endpoint allows it; raises on failure"""
+        tier = self._route(prompt, endpoint, plan)
+        key = self._request_key(prompt, system, history, session_key, endpoint, tier)
+        ttl = self.CACHE_TTLS.get(endpoint)
+        warming = getattr(self._warming, "state", None)
+        if ttl and warming is None:
+            if not system and not history:
+                self.popularity.record(endpoint, prompt)
+            cached = self.cache.get(key, endpoint)
+            self.metrics.record_cache(endpoint, "miss" if cached is None else "hit")
+            if cached is not None:
+                return cached
+        elif ttl:
+            # Pre-warming refreshes entries before they expire, but leaves recent ones alone
+            entry = self.cache.peek(key)
+            if entry is not None and entry[0] - time.time() > warming["refresh_within"]:
+                return entry[1]
+        
+        def call():
+            if warming is not None:
+                warming["upstream_calls"] += 1
+            text = self._call_model(prompt, system, history, session_key, endpoint, tier)
+            # Only successful responses are cached; errors below are returned as text
+            if ttl:
+                self.cache.set(key, text, ttl, endpoint)
+            return text
+        
+        try:
+            # Identical prompts already in flight share the same upstream call
+            return self.flights.do(key, call)
+        except Exception as e:
+            if warming is not None:
+                warming["error"] = warming["error"] or e
+            # While the upstream is failing, an expired cached answer beats an error message
+            stale = self.cache.get_stale(key, endpoint) if ttl else None
+            if stale is None:
+                raise
+            self.metrics.record_cache(endpoint, "stale")
+            return stale
+    
+    def warm(self, func, refresh_within: float) -> Dict:
+        """Run func (a public method or _generate call) in pre-warm mode.
+        
+        Requests made by func are not counted as popular, skip entries that stay fresh for
+        more than refresh_within seconds, and report upstream calls and the first error in
+        the returned state instead of only as answer text.
+        """
+        state = {"refresh_within": refresh_within, "upstream_calls": 0, "error": None}
+        self._warming.state = state
+        try:
+            func()
+        except Exception as e:
+            state["error"] = state["error"] or e
+        finally:
+            self._warming.state = None
+        return state
     
-    def _generate_response(self, prompt: str) -> str:
-        """Generate response using Gemini AI"""
+    def _generate_response(self, prompt: str, endpoint: str = None, system: str = None,
+                           history: List = None, session_key=None, plan: str = None) -> str:
+        """Generate response using the configured AI provider, returning errors as readable text"""
         if not self.use_ai:
             return "[Demo Mode] Configure GEMINI_API_KEY in .env file to enable AI responses."
         
         try:
-            # Set generation config
-            generation_config = {
-                "temperature": 0.7,
-                "top_p": 0.95,
-                "top_k": 40,
-                "max_output_tokens": 2048,
-            }
-            
-            response = self.model.generate_content(
-                prompt,
-                generation_config=generation_config
-            )
-            return response.text
+            return self._generate(prompt, endpoint, system, history, session_key, plan)
         except Exception as e:
-            error_msg = str(e)
-            print(f"Error generating AI response: {error_msg}")
+            print(f"Error generating AI response: {e}")
             # Return a helpful error message instead of crashing
-            return f"⚠️ AI service temporarily unavailable. Error: {error_msg[:100]}\n\nPlease try again in a moment."
+            return self._unavailable_message(e)
     
-    def _generate_response_stream(self, prompt: str):
+    def _generate_response_stream(self, prompt: str, endpoint: str = None, system: str = None,
+                                  history: List = None, session_key=None, plan: str = None):
         """Generate streaming response using Gemini AI (word by word like ChatGPT)"""
         if not self.use_ai:
             yield "[Demo Mode] Configure GEMINI_API_KEY in .env file to enable AI responses."
             return
         
         try:
-            # Set generation config
-            generation_config = {
-                "temperature": 0.7,
-                "top_p": 0.95,
-                "top_k": 40,
-                "max_output_tokens": 2048,
-            }
-            
-            response = self.model.generate_content(
-                prompt,
-                generation_config=generation_config,
-                stream=True
-            )
-            
-            for chunk in response:
-                if chunk.text:
-                    yield chunk.text
+            # Identical prompts already streaming share one upstream stream
+            tier = self._route(prompt, endpoint, plan)
+            key = self._request_key(prompt, system, history, session_key, endpoint, tier)
+            stream = lambda: self._call_model_stream(prompt, system, history, session_key, endpoint, tier)
+            for chunk in self.flights.stream(key, stream):
+                yield chunk
         except Exception as e:
-            error_msg = str(e)
-            print(f"Error generating streaming AI response: {error_msg}")
-            yield f"⚠️ AI service temporarily unavailable. Error: {error_msg[:100]}\n\nPlease try again in a moment."
+            print(f"Error generating streaming AI response: {e}")
+            yield self._unavailable_message(e)
     
-    def chat_completion(self, messages: List[Dict]) -> str:
-        """Generate chat completion response for engineering students with conversation context"""
+    def _prepare_chat(self, messages: List[Dict], user_id: Optional[int], language: str):
+        """Split a conversation into (system prompt, earlier turns, new message) for a chat session"""
+        summary, turns = self.context_window.build(messages, user_id)
         
-        # Build context-aware prompt with conversation history
-        system_context = """You are CodeCampus AI, a helpful AI assistant for engineering students in India.
-
-Your expertise:
-- Campus placement preparation (TCS, Infosys, Wipro, Amazon, Microsoft, Google)
-- Data Structures & Algorithms (DSA) for coding interviews
-- Resume building with ATS optimization
-- Mock interview preparation
-- Company-specific interview tips
-- Technical skills roadmap
-- Core CS subjects (OS, DBMS, Networks, OOP)
-- General academic help (any subject, any topic)
-- Study notes and explanations
-- Homework and assignment help
-
-Response Style (IMPORTANT):
-- Write like ChatGPT - natural, conversational paragraphs
-- NO bullet points (*) or lists unless specifically asked
-- Use normal sentences and paragraphs like a human conversation
-- Keep responses SHORT and CONCISE (2-4 short paragraphs for simple questions)
-- Only give detailed explanations when specifically asked
-- Don't ask multiple follow-up questions unless necessary
-- Get straight to the point - no long introductions
-- Use emojis sparingly (1-2 per response maximum)
-- Write in a friendly, helpful tone like talking to a friend
-
-Content Guidelines:
-- Help with ANY topic the student asks about (not just placement prep)
-- If asked about history, science, math, or any subject - answer it!
-- Focus on placement preparation when relevant
-- Provide actionable, practical advice
-- Include company names and package ranges when relevant
-- Use Indian context (LPA, campus placements, service vs product companies)
-- Be encouraging and supportive but brief
-- Remember previous messages in the conversation and maintain context
-"""
-        
-        # Build conversation history (skip the initial assistant greeting if present)
-        conversation_history = ""
-        for msg in messages:
-            if msg['role'] == 'user':
-                conversation_history += f"\n\nStudent: {msg['content']}"
-            elif msg['role'] == 'assistant' and not msg['content'].startswith("Hello! I'm your AI"):
-                conversation_history += f"\n\nAssistant: {msg['content']}"
+        system = get_system_prompt("chat", language)
+        if summary:
+            system = f"{system}\n\nSummary of the earlier conversation:\n{summary}"
         
-        full_prompt = f"{system_context}\n\nConversation History:{conversation_history}\n\nProvide a helpful, contextual response:"
-        
-        return self._generate_response(full_prompt)
+        if turns and turns[-1][0] == 'user':
+            return system, turns[:-1], turns[-1][1]
+        return system, turns, "Provide a helpful, contextual response:"
+    
+    def chat_completion(self, messages: List[Dict], user_id: Optional[int] = None, language: str = "english",
+                        plan: str = None) -> str:
+        """Generate chat completion response for engineering students with conversation context"""
+        system, history, message = self._prepare_chat(messages, user_id, language)
+        return self._generate_response(message, endpoint="chat", system=system, history=history,
+                                       session_key=user_id, plan=plan)
     
-    def chat_completion_stream(self, messages: List[Dict]):
+    def chat_completion_stream(self, messages: List[Dict], user_id: Optional[int] = None, language: str = "english",
+                               plan: str = None):
         """Generate streaming chat completion response with conversation context (word by word like ChatGPT)"""
-        
-        # Build context-aware prompt with conversation history
-        system_context = """You are CodeCampus AI, a helpful AI assistant for engineering students in India.
-
-Your expertise:
-- Campus placement preparation (TCS, Infosys, Wipro, Amazon, Microsoft, Google)
-- Data Structures & Algorithms (DSA) for coding interviews
-- Resume building with ATS optimization
-- Mock interview preparation
-- Company-specific interview tips
-- Technical skills roadmap
-- Core CS subjects (OS, DBMS, Networks, OOP)
-- General academic help (any subject, any topic)
-- Study notes and explanations
-- Homework and assignment help
-
-Response Style (IMPORTANT):
-- Write like ChatGPT - natural, conversational paragraphs
-- NO bullet points (*) or lists unless specifically asked
-- Use normal sentences and paragraphs like a human conversation
-- Keep responses SHORT and CONCISE (2-4 short paragraphs for simple questions)
-- Only give detailed explanations when specifically asked
-- Don't ask multiple follow-up questions unless necessary
-- Get straight to the point - no long introductions
-- Use emojis sparingly (1-2 per response maximum)
-- Write in a friendly, helpful tone like talking to a friend
-
-Content Guidelines:
-- Help with ANY topic the student asks about (not just placement prep)
-- If asked about history, science, math, or any subject - answer it!
-- Focus on placement preparation when relevant
-- Provide actionable, practical advice
-- Include company names and package ranges when relevant
-- Use Indian context (LPA, campus placements, service vs product companies)
-- Be encouraging and supportive but brief
-- Remember previous messages in the conversation and maintain context
-"""
-        
-        # Build conversation history (skip the initial assistant greeting if present)
-        conversation_history = ""
-        for msg in messages:
-            if msg['role'] == 'user':
-                conversation_history += f"\n\nStudent: {msg['content']}"
-            elif msg['role'] == 'assistant' and not msg['content'].startswith("Hello! I'm your AI"):
-                conversation_history += f"\n\nAssistant: {msg['content']}"
-        
-        full_prompt = f"{system_context}\n\nConversation History:{conversation_history}\n\nProvide a helpful, contextual response:"
-        
-        return self._generate_response_stream(full_prompt)
-
+        system, history, message = self._prepare_chat(messages, user_id, language)
+        return self._generate_response_stream(message, endpoint="chat", system=system, history=history,
+                                              session_key=user_id, plan=plan)
     
     def explain_topic(self, topic: str, subject: str, level: str) -> Dict:
         """Generate topic explanation for placement preparation"""
@@ -195,7 +700,7 @@ Include:
 
 Format the response for easy understanding."""
 
-        explanation = self._generate_response(prompt)
+        explanation = self._generate_response(prompt, endpoint="explain_topic")
         
         return {
             "explanation": explanation,
@@ -218,7 +723,7 @@ Include:
 
 Make it placement-focused and easy to revise."""
 
-        notes = self._generate_response(prompt)
+        notes = self._generate_response(prompt, endpoint="generate_notes")
         
         return {
             "notes": notes,
@@ -242,7 +747,7 @@ Provide:
 
 Make it easy to understand for placement preparation."""
 
-        answer = self._generate_response(prompt)
+        answer = self._generate_response(prompt, endpoint="solve_doubt")
         
         return {
             "answer": answer,
@@ -251,89 +756,120 @@ Make it easy to understand for placement preparation."""
         }
     
     def generate_mock_test(self, subject: str, topic: str, difficulty: str, num_questions: int) -> Dict:
-        """Generate mock test questions for placement preparation"""
-        prompt = f"""Generate EXACTLY {num_questions} multiple choice questions for campus placement aptitude test.
-
-Subject: {subject}
-Topic: {topic}
-Difficulty: {difficulty}
-
-IMPORTANT: Generate ALL {num_questions} questions. Do not generate less.
-
-For each question provide:
-1. Clear question text
-2. Four options (A, B, C, D)
-3. Correct answer index (0-3)
-4. Detailed explanation
-
-Focus on aptitude questions commonly asked in placement exams.
-
-Return in JSON format with ALL {num_questions} questions:
-{{
-  "questions": [
-    {{
-      "id": 1,
-      "question": "...",
-      "options": ["Option A", "Option B", "Option C", "Option D"],
-      "correctAnswer": 0,
-      "explanation": "..."
-    }},
-    ... (continue for all {num_questions} questions)
-  ]
-}}
-
-CRITICAL: The questions array MUST contain exactly {num_questions} questions."""
-
-        response = self._generate_response(prompt)
+        """Generate mock test questions for placement preparation
         
-        # Try to parse JSON response
-        try:
-            # Extract JSON from response if it's wrapped in markdown
-            if "```json" in response:
-                json_str = response.split("```json")[1].split("```")[0].strip()
-            elif "```" in response:
-                json_str = response.split("```")[1].split("```")[0].strip()
-            else:
-                json_str = response
-            
-            data = json.loads(json_str)
-            questions = data.get("questions", [])
-            
-            # If we didn't get enough questions, generate more
-            if len(questions) < num_questions:
-                print(f"Warning: Only got {len(questions)} questions, expected {num_questions}")
-                # Generate additional questions to reach the target
-                for i in range(len(questions), num_questions):
-                    questions.append({
-                        "id": i+1,
-                        "question": f"Sample {topic} question {i+1}",
-                        "options": ["Option A", "Option B", "Option C", "Option D"],
-                        "correctAnswer": 0,
-                        "explanation": "This is a sample question."
-                    })
-        except Exception as e:
-            print(f"Error parsing mock test response: {e}")
-            # Fallback to demo questions
-            questions = [
-                {
-                    "id": i+1,
-                    "question": f"Sample question {i+1} on {topic}",
-                    "options": ["Option A", "Option B", "Option C", "Option D"],
-                    "correctAnswer": 0,
-                    "explanation": "This is a sample question."
-                }
-                for i in range(num_questions)
-            ]
+        Tests are sampled from the question bank when its pool is large enough. Otherwise
+        they are generated in shards of settings.mock_test_shard_size questions that run
+        concurrently, then de-duplicated across shards, renumbered and stored in the bank.
+        """
+        error = None
+        if self.use_ai:
+            questions = self.question_bank.sample(subject, topic, difficulty, num_questions)
+            if not questions:
+                questions, error = self._generate_questions(subject, topic, difficulty, num_questions)
+                self.question_bank.add(subject, topic, difficulty, questions)
+        else:
+            questions = demo_questions(topic, num_questions)
         
-        return {
+        result = {
             "subject": subject,
             "topic": topic,
             "difficulty": difficulty,
-            "questions": questions[:num_questions],  # Ensure we don't exceed requested number
-            "totalQuestions": len(questions[:num_questions]),
-            "timeLimit": num_questions * 2,
+            "questions": questions,
+            "totalQuestions": len(questions),
+            "timeLimit": len(questions) * 2,
             "companies": ["TCS", "Infosys", "Amazon", "Microsoft", "Wipro"]
         }
+        if not questions and error is not None:
+            result["error"] = self._unavailable_message(error)
+        return result
+    
+    def _generate_shard(self, subject: str, topic: str, difficulty: str, count: int, shard: int, shards: int) -> List[Dict]:
+        prompt = build_prompt(subject, topic, difficulty, count, shard, shards)
+        return parse_questions(self._generate(prompt, endpoint="generate_mock_test"))
+    
+    def _generate_questions(self, subject: str, topic: str, difficulty: str, num_questions: int):
+        """Return (questions, last error); short tests come back short rather than padded"""
+        size = max(1, settings.mock_test_shard_size)
+        questions, seen, error = [], [], None
+        offset = 0
+        # One round of shards, then a single top-up round for failed shards and duplicates
+        for _ in range(2):
+            missing = num_questions - len(questions)
+            if missing <= 0:
+                break
+            counts = [min(size, missing - start) for start in range(0, missing, size)]
+            futures = [
+                self._shard_executor.submit(self._generate_shard, subject, topic, difficulty,
+                                            count, offset + index, offset + len(counts))
+                for index, count in enumerate(counts)
+            ]
+            for future in futures:
+                try:
+                    questions.extend(dedupe_questions(future.result(), seen))
+                except Exception as e:
+                    print(f"Error generating mock test shard: {e}")
+                    error = e
+            offset += len(counts)
+        
+        if len(questions) < num_questions:
+            print(f"Warning: Only got {len(questions)} questions, expected {num_questions}")
+        return number_questions(questions[:num_questions]), error
+    
+    def generate_mock_test_stream(self, subject: str, topic: str, difficulty: str, num_questions: int):
+        """Yield mock test questions one by one, each as soon as it has been generated
+        
+        Bank hits are yielded at once. Otherwise all shards stream concurrently through
+        an incremental JSON parser and questions are yielded in arrival order, numbered
+        and de-duplicated. There is no top-up round, so a stream may end short.
+        """
+        if not self.use_ai:
+            yield from demo_questions(topic, num_questions)
+            return
+        banked = self.question_bank.sample(subject, topic, difficulty, num_questions)
+        if banked:
+            yield from banked
+            return
+        
+        size = max(1, settings.mock_test_shard_size)
+        counts = [min(size, num_questions - start) for start in range(0, num_questions, size)]
+        arrivals = queue.Queue()
+        stop = threading.Event()
+        shard_done = object()
+        
+        def run_shard(index: int, count: int):
+            parser = QuestionStreamParser()
+            prompt = build_prompt(subject, topic, difficulty, count, index, len(counts))
+            # Failures come back as plain text, which the parser skips
+            stream = self._generate_response_stream(prompt, endpoint="generate_mock_test")
+            try:
+                for chunk in stream:
+                    if stop.is_set():
+                        return
+                    for question in parser.feed(chunk):
+                        arrivals.put(question)
+            finally:
+                stream.close()
+                arrivals.put(shard_done)
+        
+        for index, count in enumerate(counts):
+            self._shard_executor.submit(run_shard, index, count)
+        
+        questions, seen, pending = [], [], len(counts)
+        try:
+            while pending and len(questions) < num_questions:
+                item = arrivals.get()
+                if item is shard_done:
+                    pending -= 1
+                    continue
+                for question in dedupe_questions([item], seen):
+                    questions.append(question)
+                    yield dict(question, id=len(questions))
+        finally:
+            # Client gone or test complete: let the remaining shards wind down
+            stop.set()
+            if questions:
+                self.question_bank.add(subject, topic, difficulty, questions)
     
     def solve_previous_year(self, question: str, subject: str) -> Dict:
         """Solve previous year placement question"""
@@ -351,7 +887,7 @@ Provide:
 
 Make it detailed and easy to understand."""
 
-        solution = self._generate_response(prompt)
+        solution = self._generate_response(prompt, endpoint="solve_previous_year")
         
         return {
             "question": question,
@@ -386,7 +922,7 @@ Focus on:
 
 Make it realistic and achievable for engineering students."""
 
-        plan = self._generate_response(prompt)
+        plan = self._generate_response(prompt, endpoint="generate_study_plan")
         
         return {
             "examDate": exam_date,
@@ -441,7 +977,7 @@ Provide:
         }
         
         prompt = prompts.get(task, prompts["explain"])
-        result = self._generate_response(prompt)
+        result = self._generate_response(prompt, endpoint="explain_code")
         
         return {
             "original": code,
@@ -451,7 +987,7 @@ Provide:
             "suggestions": ["Review the analysis above for detailed suggestions"]
         }
     
-    def dsa_hint(self, problem: str) -> Dict:
+    def dsa_hint(self, problem: str, plan: str = None) -> Dict:
         """Provide complete DSA problem solution with code and explanation"""
         
         # Check if AI is available
@@ -492,11 +1028,14 @@ Provide a COMPLETE solution with:
 
 Format it clearly with markdown headers and code blocks. Make it easy to understand for placement preparation."""
 
-        response = self._generate_response(prompt)
-        
-        # If API quota exceeded, return demo solution
-        if "exceeded your current quota" in response.lower() or "429" in response:
-            return self._get_demo_dsa_solution(problem)
+        try:
+            response = self._generate(prompt, endpoint="dsa_hint", plan=plan)
+        except Exception as e:
+            # Circuit open, at capacity or out of quota: answer instantly from the offline library
+            if isinstance(e, ServiceUnavailable) or classify_error(e) == QUOTA:
+                return self._get_demo_dsa_solution(problem)
+            print(f"Error generating AI response: {e}")
+            response = self._unavailable_message(e)
         
         return {
             "problem": problem,
@@ -506,468 +1045,7 @@ Format it clearly with markdown headers and code blocks. Make it easy to underst
     
     def _get_demo_dsa_solution(self, problem: str) -> Dict:
         """Return demo DSA solution when API is unavailable"""
-        
-        problem_lower = problem.lower()
-        
-        # Pascal's Triangle
-        if "pascal" in problem_lower:
-            solution = """# 🔺 Pascal's Triangle - Complete Solution
-
-## 1. Python Code Solution
-
-```python
-def generate_pascals_triangle(numRows):
-    \"\"\"
-    Generate Pascal's Triangle with numRows rows
-    Time: O(numRows²), Space: O(numRows²)
-    \"\"\"
-    if numRows == 0:
-        return []
-    
-    triangle = [[1]]  # First row is always [1]
-    
-    for i in range(1, numRows):
-        row = [1]  # Every row starts with 1
-        
-        # Calculate middle elements
-        for j in range(1, i):
-            # Sum of two elements from previous row
-            row.append(triangle[i-1][j-1] + triangle[i-1][j])
-        
-        row.append(1)  # Every row ends with 1
-        triangle.append(row)
-    
-    return triangle
-
-
-# Test Examples
-print(generate_pascals_triangle(5))
-# Output:
-# [
-#   [1],
-#   [1, 1],
-#   [1, 2, 1],
-#   [1, 3, 3, 1],
-#   [1, 4, 6, 4, 1]
-# ]
-```
-
-## 2. Why This Code Works - Simple Explanation
-
-### The Pattern 🔺
-```
-Row 0:           1
-Row 1:         1   1
-Row 2:       1   2   1
-Row 3:     1   3   3   1
-Row 4:   1   4   6   4   1
-```
-
-### Key Observations:
-1. **First and last elements** are always `1`
-2. **Middle elements** = sum of two numbers above it
-3. **Row i** has `i+1` elements
-
-### The Algorithm:
-**Step 1:** Start with first row `[1]`
-
-**Step 2:** For each new row:
-- Start with `1`
-- Calculate middle: `previous[j-1] + previous[j]`
-- End with `1`
-
-**Step 3:** Add row to triangle
-
-## 3. Step-by-Step Example
-
-Building 4 rows:
-
-```
-Row 0: [1]
-       ↓
-Row 1: [1, 1]
-       ↓  ↓
-Row 2: [1, 2, 1]
-          ↓ ↓
-       (1+1=2)
-
-Row 3: [1, 3, 3, 1]
-          ↓ ↓ ↓
-       (1+2=3)(2+1=3)
-```
-
-## 4. Code Breakdown
-
-```python
-triangle = [[1]]  # Base case
-```
-- Start with first row
-
-```python
-for i in range(1, numRows):
-    row = [1]  # Every row starts with 1
-```
-- Build each row starting with 1
-
-```python
-for j in range(1, i):
-    row.append(triangle[i-1][j-1] + triangle[i-1][j])
-```
-- Calculate middle elements
-- `triangle[i-1]` = previous row
-- Sum adjacent elements
-
-```python
-row.append(1)  # Every row ends with 1
-triangle.append(row)
-```
-- End row with 1
-- Add to triangle
-
-## 5. Complexity Analysis
-
-| Metric | Value | Explanation |
-|--------|-------|-------------|
-| **Time** | O(numRows²) | Generate numRows rows, each row has i elements |
-| **Space** | O(numRows²) | Store entire triangle |
-
-**Why O(numRows²)?**
-- Row 0: 1 element
-- Row 1: 2 elements
-- Row 2: 3 elements
-- ...
-- Row n: n+1 elements
-- Total: 1+2+3+...+n = n(n+1)/2 = O(n²)
-
-## 6. Interview Tips 💡
-
-### What to Say:
-✅ "Each element is the sum of two elements from the previous row"
-✅ "I handle edge cases: first and last elements are always 1"
-✅ "Time complexity is O(n²) because we generate n² elements"
-
-### Common Mistakes to Avoid:
-❌ Forgetting to add 1 at start and end of each row
-❌ Wrong indexing when accessing previous row
-❌ Not handling numRows = 0 or 1
-
-### Companies That Ask This:
-- **Amazon** ⭐⭐⭐⭐
-- **Microsoft** ⭐⭐⭐
-- **Google** ⭐⭐⭐
-- **Apple** ⭐⭐⭐
-- **TCS/Infosys** ⭐⭐⭐⭐⭐ (Very Common)
-
-## 7. Variations & Follow-ups
-
-### Variation 1: Get Specific Row
-```python
-def getRow(rowIndex):
-    \"\"\"Get only the rowIndex-th row\"\"\"
-    row = [1]
-    for i in range(1, rowIndex + 1):
-        # Build from right to left to use O(1) space
-        row.append(1)
-        for j in range(i - 1, 0, -1):
-            row[j] = row[j] + row[j - 1]
-    return row
-```
-
-### Variation 2: Print Triangle Format
-```python
-def print_triangle(numRows):
-    triangle = generate_pascals_triangle(numRows)
-    for i, row in enumerate(triangle):
-        spaces = ' ' * (numRows - i - 1)
-        print(spaces + ' '.join(map(str, row)))
-```
-
-## 8. Similar Problems
-
-1. **Pascal's Triangle II** (LeetCode 119)
-   - Get specific row with O(k) space
-   - Difficulty: Easy
-
-2. **Triangle** (LeetCode 120)
-   - Minimum path sum in triangle
-   - Difficulty: Medium
-
-3. **Combination Sum** (LeetCode 39)
-   - Uses combinatorics like Pascal's
-   - Difficulty: Medium
-
-4. **Unique Paths** (LeetCode 62)
-   - Related to Pascal's triangle values
-   - Difficulty: Medium
-
----
-
-**🎯 This is a common interview question for service-based companies!**
-
-*Note: This is a demo solution. Get Gemini API key for AI-generated solutions.*
-"""
-        
-        # Matrix Zeroes
-        elif "matrix" in problem_lower and "0" in problem:
-            solution = """# 🚀 Set Matrix Zeroes - Complete Solution
-
-## 1. Python Code Solution (Optimal O(1) Space)
-
-```python
-def setZeroes(matrix):
-    \"\"\"
-    Set entire row and column to 0 if element is 0
-    Time: O(M×N), Space: O(1)
-    \"\"\"
-    if not matrix:
-        return
-    
-    rows = len(matrix)
-    cols = len(matrix[0])
-    
-    # Step 1: Check if first row and column need zeroing
-    first_row_has_zero = False
-    first_col_has_zero = False
-    
-    for j in range(cols):
-        if matrix[0][j] == 0:
-            first_row_has_zero = True
-            break
-    
-    for i in range(rows):
-        if matrix[i][0] == 0:
-            first_col_has_zero = True
-            break
-    
-    # Step 2: Use first row/column as markers
-    for i in range(1, rows):
-        for j in range(1, cols):
-            if matrix[i][j] == 0:
-                matrix[i][0] = 0
-                matrix[0][j] = 0
-    
-    # Step 3: Zero out based on markers
-    for i in range(1, rows):
-        for j in range(1, cols):
-            if matrix[i][0] == 0 or matrix[0][j] == 0:
-                matrix[i][j] = 0
-    
-    # Step 4: Handle first row and column
-    if first_row_has_zero:
-        for j in range(cols):
-            matrix[0][j] = 0
-    
-    if first_col_has_zero:
-        for i in range(rows):
-            matrix[i][0] = 0
-```
-
-[Full solution continues...]
-
-**Companies:** Amazon ⭐⭐⭐⭐⭐, Microsoft ⭐⭐⭐⭐, Google ⭐⭐⭐⭐
-
-*Get Gemini API key for complete solution with detailed explanation.*
-"""
-        
-        # Two Sum
-        elif "two sum" in problem_lower:
-            solution = """# 🎯 Two Sum - Complete Solution
-
-## 1. Python Code Solution (Optimal O(n) Time)
-
-```python
-def twoSum(nums, target):
-    \"\"\"
-    Find two numbers that add up to target
-    Time: O(n), Space: O(n)
-    \"\"\"
-    seen = {}  # Dictionary to store {value: index}
-    
-    for i, num in enumerate(nums):
-        complement = target - num
-        
-        if complement in seen:
-            return [seen[complement], i]
-        
-        seen[num] = i
-    
-    return []  # No solution found
-
-
-# Test
-print(twoSum([2, 7, 11, 15], 9))  # Output: [0, 1]
-print(twoSum([3, 2, 4], 6))       # Output: [1, 2]
-```
-
-## 2. Why This Works
-
-**The Insight:** For each number, check if its complement exists
-
-```
-Target = 9
-nums = [2, 7, 11, 15]
-
-i=0: num=2, complement=7, seen={} → Add 2
-i=1: num=7, complement=2, seen={2:0} → Found! Return [0,1]
-```
-
-## 3. Complexity
-
-- **Time:** O(n) - Single pass
-- **Space:** O(n) - Hash map storage
-
-## 4. Interview Tips
-
-✅ "I use a hash map for O(1) lookups"
-✅ "One pass solution is optimal"
-
-**Companies:** Amazon ⭐⭐⭐⭐⭐, Google ⭐⭐⭐⭐⭐, Microsoft ⭐⭐⭐⭐⭐
-
-*Get Gemini API key for complete solution.*
-"""
-        
-        # Valid Parentheses
-        elif "parenthes" in problem_lower or "bracket" in problem_lower:
-            solution = """# 🔤 Valid Parentheses - Complete Solution
-
-## 1. Python Code Solution
-
-```python
-def isValid(s):
-    \"\"\"
-    Check if parentheses are valid
-    Time: O(n), Space: O(n)
-    \"\"\"
-    stack = []
-    mapping = {')': '(', '}': '{', ']': '['}
-    
-    for char in s:
-        if char in mapping:
-            # Closing bracket
-            top = stack.pop() if stack else '#'
-            if mapping[char] != top:
-                return False
-        else:
-            # Opening bracket
-            stack.append(char)
-    
-    return len(stack) == 0
-
-
-# Test
-print(isValid("()"))      # True
-print(isValid("()[]{}"))  # True
-print(isValid("(]"))      # False
-```
-
-## 2. Why Stack?
-
-**Opening brackets** → Push to stack
-**Closing brackets** → Must match top of stack
-
-```
-Input: "({[]})"
-
-Step 1: '(' → stack = ['(']
-Step 2: '{' → stack = ['(', '{']
-Step 3: '[' → stack = ['(', '{', '[']
-Step 4: ']' → matches '[' → stack = ['(', '{']
-Step 5: '}' → matches '{' → stack = ['(']
-Step 6: ')' → matches '(' → stack = []
-Result: Valid ✓
-```
-
-**Companies:** Amazon ⭐⭐⭐⭐, Microsoft ⭐⭐⭐⭐, TCS ⭐⭐⭐⭐⭐
-
-*Get Gemini API key for complete solution.*
-"""
-        
-        # Generic fallback
-        else:
-            solution = f"""# 💡 DSA Problem Solution
-
-**Problem:** {problem}
-
-## Demo Mode Active
-
-⚠️ **Gemini API quota exceeded.** 
-
-### To Get AI-Powered Solutions:
-
-1. **Get New API Key:**
-   - Visit: https://aistudio.google.com/app/apikey
-   - Click "Create API Key"
-   - Copy the key
-
-2. **Update Backend:**
-   ```bash
-   # Edit backend/.env
-   GEMINI_API_KEY=your-new-api-key-here
-   ```
-
-3. **Restart Backend:**
-   ```bash
-   cd backend
-   npm run dev
-   ```
-
-### Popular Demo Solutions Available:
-
-Try these problems to see complete solutions:
-- ✅ **Pascal's Triangle** - Full solution with code
-- ✅ **Set Matrix Zeroes** - O(1) space solution
-- ✅ **Two Sum** - Hash map approach
-- ✅ **Valid Parentheses** - Stack solution
-
-### General DSA Approach:
-
-1. **Understand the Problem**
-   - Read carefully
-   - Identify inputs/outputs
-   - Check constraints
-
-2. **Think of Approaches**
-   - Brute force first
-   - Optimize with data structures
-   - Consider time/space tradeoffs
-
-3. **Write Clean Code**
-   - Meaningful variable names
-   - Add comments
-   - Handle edge cases
-
-4. **Analyze Complexity**
-   - Time: O(?)
-   - Space: O(?)
-
-5. **Test Thoroughly**
-   - Normal cases
-   - Edge cases (empty, single element)
-   - Large inputs
-
-### Interview Tips 💡
-
-- **Think out loud** - Explain your thought process
-- **Start simple** - Brute force first, then optimize
-- **Ask questions** - Clarify requirements
-- **Test your code** - Walk through examples
-- **Discuss tradeoffs** - Time vs space
-
-### Common Data Structures:
-
-| Problem Type | Data Structure |
-|--------------|----------------|
-| Fast lookup | Hash Map/Set |
-| LIFO order | Stack |
-| FIFO order | Queue |
-| Sorted data | Heap/BST |
-| Graph problems | DFS/BFS |
-
----
-
-**Configure Gemini API for AI-generated solutions for ANY problem!**
-"""
-        
+        solution = demo_solutions.find(problem) or demo_solutions.fallback(problem)
         return {
             "problem": problem,
             "solution": solution,
@@ -995,7 +1073,7 @@ Provide:
 
 Make it actionable with clear steps and timeline (6-8 weeks)."""
 
-        guidance = self._generate_response(prompt)
+        guidance = self._generate_response(prompt, endpoint="project_guidance")
         
         return {
             "projectType": project_type,
@@ -1038,7 +1116,7 @@ Focus on:
 
 Return analysis in a structured format."""
 
-        analysis = self._generate_response(prompt)
+        analysis = self._generate_response(prompt, endpoint="analyze_resume")
         
         # Parse the analysis to extract scores (basic parsing)
         ats_score = 75  # Default
@@ -1122,7 +1200,7 @@ Provide:
 
 Make it specific to Indian campus placements and engineering students."""
 
-        preparation = self._generate_response(prompt)
+        preparation = self._generate_response(prompt, endpoint="interview_prep")
         
         # Extract common questions from the response
         common_questions = []
@@ -1165,6 +1243,107 @@ Make it specific to Indian campus placements and engineering students."""
                 "System Design (for senior roles)"
             ]
         }
+    
+    # Async variants - same behaviour as the methods above, but safe to await from async routes
+    
+    async def chat_completion_async(self, messages: List[Dict], user_id: Optional[int] = None,
+                                    language: str = "english", plan: str = None) -> str:
+        """Async variant of chat_completion"""
+        return await self._run_in_executor(self.chat_completion, messages, user_id, language, plan)
+    
+    async def chat_completion_stream_async(self, messages: List[Dict], user_id: Optional[int] = None,
+                                           language: str = "english", plan: str = None):
+        """Async variant of chat_completion_stream.
+        
+        The provider stream is pumped on the AI executor into a bounded queue, so waiting
+        for the next chunk never blocks the event loop.
+        """
+        async for chunk in iterate_in_thread(
+            lambda: self.chat_completion_stream(messages, user_id, language, plan),
+            self._executor,
+            settings.ai_stream_buffer_chunks
+        ):
+            yield chunk
+    
+    async def explain_topic_async(self, topic: str, subject: str, level: str) -> Dict:
+        """Async variant of explain_topic"""
+        return await self._run_in_executor(self.explain_topic, topic, subject, level)
+    
+    async def generate_notes_async(self, topic: str, format: str) -> Dict:
+        """Async variant of generate_notes"""
+        return await self._run_in_executor(self.generate_notes, topic, format)
+    
+    async def solve_doubt_async(self, question: str, subject: str = None) -> Dict:
+        """Async variant of solve_doubt"""
+        return await self._run_in_executor(self.solve_doubt, question, subject)
+    
+    async def generate_mock_test_async(self, subject: str, topic: str, difficulty: str, num_questions: int) -> Dict:
+        """Async variant of generate_mock_test"""
+        return await self._run_in_executor(self.generate_mock_test, subject, topic, difficulty, num_questions)
+    
+    async def generate_mock_test_stream_async(self, subject: str, topic: str, difficulty: str, num_questions: int):
+        """Async variant of generate_mock_test_stream"""
+        async for question in iterate_in_thread(
+            lambda: self.generate_mock_test_stream(subject, topic, difficulty, num_questions),
+            self._executor,
+            settings.ai_stream_buffer_chunks
+        ):
+            yield question
+    
+    async def solve_previous_year_async(self, question: str, subject: str) -> Dict:
+        """Async variant of solve_previous_year"""
+        return await self._run_in_executor(self.solve_previous_year, question, subject)
+    
+    async def generate_study_plan_async(self, exam_date: str, subjects: List[str]) -> Dict:
+        """Async variant of generate_study_plan"""
+        return await self._run_in_executor(self.generate_study_plan, exam_date, subjects)
+    
+    async def explain_code_async(self, code: str, language: str, task: str) -> Dict:
+        """Async variant of explain_code"""
+        return await self._run_in_executor(self.explain_code, code, language, task)
+    
+    async def dsa_hint_async(self, problem: str, plan: str = None) -> Dict:
+        """Async variant of dsa_hint"""
+        return await self._run_in_executor(self.dsa_hint, problem, plan)
+    
+    async def project_guidance_async(self, project_type: str, tech_stack: List[str]) -> Dict:
+        """Async variant of project_guidance"""
+        return await self._run_in_executor(self.project_guidance, project_type, tech_stack)
+    
+    async def analyze_resume_async(self, resume_text: str) -> Dict:
+        """Async variant of analyze_resume"""
+        return await self._run_in_executor(self.analyze_resume, resume_text)
+    
+    async def interview_prep_async(self, company: str, role: str) -> Dict:
+        """Async variant of interview_prep"""
+        return await self._run_in_executor(self.interview_prep, company, role)
+
+_instance: Optional[AIService] = None
+_instance_lock = threading.Lock()
+
+
+def get_ai_service() -> AIService:
+    """The shared AIService, created on first use (not at import, to keep worker startup fast)"""
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = AIService()
+    return _instance
+
+
+def shutdown_ai_service():
+    """Shut the shared AIService down if it was ever created"""
+    if _instance is not None:
+        _instance.shutdown()
+
+
+class _LazyAIService:
+    """Stand-in for the singleton that builds it on first attribute access"""
+    
+    def __getattr__(self, name):
+        return getattr(get_ai_service(), name)
+
 
 # Singleton instance
-ai_service = AIService()
+ai_service = _LazyAIService()
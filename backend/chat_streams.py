@@ -0,0 +1,129 @@
+"""
+Chat streams - replayable SSE event buffers, so a dropped client can resume instead of regenerating
+"""
+
+from typing import Dict, Optional
+from collections import OrderedDict
+import asyncio
+import json
+import time
+import uuid
+from config import settings
+
+
+def parse_last_event_id(value: Optional[str]) -> int:
+    """Sequence number from a Last-Event-ID of the form "<stream id>:<seq>" (0 if absent)"""
+    if not value:
+        return 0
+    try:
+        return max(0, int(value.rsplit(":", 1)[-1]))
+    except ValueError:
+        return 0
+
+
+class ChatStream:
+    """Every event of one streamed answer, numbered from 1, kept until the stream expires.
+
+    The answer is produced by a task that publishes into the stream independently of
+    any client connection; follow() replays the events after a given sequence number
+    and then waits for new ones, sending heartbeat comments while the model is quiet.
+    """
+
+    def __init__(self, stream_id: str, user_id: int):
+        self.stream_id = stream_id
+        self.user_id = user_id
+        self.events = []
+        self.done = False
+        self.finished_at = None
+        self.task = None  # producer task; referenced here so it is not garbage-collected
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def publish(self, data: Dict) -> int:
+        self.events.append(json.dumps(data))
+        self._notify()
+        return len(self.events)
+
+    def finish(self):
+        self.done = True
+        self.finished_at = time.monotonic()
+        self._notify()
+
+    def frame(self, seq: int) -> str:
+        return f"id: {self.stream_id}:{seq}\ndata: {self.events[seq - 1]}\n\n"
+
+    async def follow(self, after: int = 0, heartbeat: float = 15.0):
+        """SSE frames for events after sequence number `after`, until the stream is done"""
+        seq = after
+        while True:
+            while seq < len(self.events):
+                seq += 1
+                yield self.frame(seq)
+            if self.done:
+                return
+            changed = self._changed
+            try:
+                await asyncio.wait_for(changed.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                # Comment line: ignored by clients, keeps proxies from closing an idle connection
+                yield ": heartbeat\n\n"
+
+
+class ChatStreamRegistry:
+    """Live and recently finished chat streams of this process, by stream id.
+
+    Finished streams are kept for ttl seconds so a reconnect can replay the tail of the
+    answer; at most max_streams are kept (finished ones are evicted first). Streams are
+    held in memory, so a resume must reach the worker that started the stream.
+    """
+
+    def __init__(self, ttl: float = 120.0, max_streams: int = 1000):
+        self.ttl = ttl
+        self.max_streams = max_streams
+        self._streams = OrderedDict()
+        self._stats = {"created": 0, "resumed": 0, "resume_misses": 0, "expired": 0}
+
+    def _prune(self):
+        now = time.monotonic()
+        for stream_id in [stream_id for stream_id, stream in self._streams.items()
+                          if stream.done and now - stream.finished_at > self.ttl]:
+            del self._streams[stream_id]
+            self._stats["expired"] += 1
+        while len(self._streams) >= self.max_streams:
+            finished = next((stream_id for stream_id, stream in self._streams.items() if stream.done), None)
+            del self._streams[finished if finished is not None else next(iter(self._streams))]
+            self._stats["expired"] += 1
+
+    def create(self, user_id: int) -> ChatStream:
+        self._prune()
+        stream = ChatStream(uuid.uuid4().hex, user_id)
+        self._streams[stream.stream_id] = stream
+        self._stats["created"] += 1
+        return stream
+
+    def resume(self, stream_id: str, user_id: int) -> Optional[ChatStream]:
+        """The user's stream with this id, or None if it expired or belongs to someone else"""
+        self._prune()
+        stream = self._streams.get(stream_id)
+        if stream is None or stream.user_id != user_id:
+            self._stats["resume_misses"] += 1
+            return None
+        self._stats["resumed"] += 1
+        return stream
+
+    def stats(self) -> Dict:
+        return dict(
+            self._stats,
+            live=sum(not stream.done for stream in self._streams.values()),
+            buffered=len(self._streams),
+            max_streams=self.max_streams
+        )
+
+
+chat_streams = ChatStreamRegistry(
+    ttl=settings.chat_stream_replay_ttl_seconds,
+    max_streams=settings.chat_stream_max_buffers
+)
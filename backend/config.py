@@ -1,3 +1,4 @@
+from typing import Dict
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -22,6 +23,86 @@ class Settings(BaseSettings):
     anthropic_api_key: str = ""
     gemini_api_key: str = ""
     
+    # AI Service
+    ai_providers: str = "gemini,openai,anthropic"  # failover order; providers without a key are skipped ("fake" = local stub)
+    gemini_model: str = "gemini-flash-latest"
+    openai_model: str = "gpt-4o-mini"
+    anthropic_model: str = "claude-3-haiku-20240307"
+    # Models for the fast and large routing tiers ("" = that provider uses its model above for the tier).
+    # The large tier is off until a large model is set, e.g. gemini-pro-latest, gpt-4o, claude-3-5-sonnet-20240620.
+    gemini_fast_model: str = "gemini-flash-lite-latest"
+    gemini_large_model: str = ""
+    openai_fast_model: str = ""
+    openai_large_model: str = ""
+    anthropic_fast_model: str = ""
+    anthropic_large_model: str = ""
+    # Client-side rate limits per API key (0 = unlimited, the default). Set them to a key's quota, e.g. 15 RPM /
+    # 1000000 TPM on the Gemini free tier, to queue and shed locally instead of getting 429s. Each *_api_key may
+    # hold several comma-separated keys.
+    gemini_rpm_limit: int = 0
+    gemini_tpm_limit: int = 0
+    openai_rpm_limit: int = 0
+    openai_tpm_limit: int = 0
+    anthropic_rpm_limit: int = 0
+    anthropic_tpm_limit: int = 0
+    ai_quota_queue_timeout_seconds: float = 2.0  # wait this long for a key to refill before shedding
+    ai_quota_expected_output_tokens: int = 512  # reserved per request, corrected once the answer is known
+    ai_provider_timeout_seconds: float = 0  # per-attempt timeout before failing over (0 = no limit)
+    fake_provider_latency_ms: int = 0
+    ai_concurrency_initial: int = 32  # adaptive limit on concurrent upstream calls
+    ai_concurrency_min: int = 4
+    ai_concurrency_max: int = 256
+    ai_concurrency_latency_threshold_seconds: float = 30.0  # slower calls count as congestion
+    ai_limiter_queue_timeout_seconds: float = 2.0  # wait this long for a slot before shedding
+    ai_breaker_failure_threshold: int = 5  # consecutive failures that open the circuit
+    ai_breaker_reset_seconds: float = 30.0  # how long the circuit stays open before probing
+    ai_retry_attempts: int = 3  # attempts per call for transient errors (timeouts, 5xx)
+    ai_retry_base_delay_seconds: float = 0.5  # exponential backoff with full jitter
+    ai_retry_max_delay_seconds: float = 8.0
+    ai_hedge_endpoints: str = "chat,dsa_hint"  # send a backup request when a call outlives the p95 ("" = off)
+    ai_hedge_percentile: float = 95
+    ai_hedge_min_delay_seconds: float = 1.0
+    ai_warm_start: bool = True  # build the AI service in the background at startup instead of on the first request
+    ai_prewarm_enabled: bool = True  # refresh cached answers for popular inputs during off-peak hours
+    ai_prewarm_file: str = "data/prewarm.json"  # configured inputs to pre-warm ({method: [[args], ...]})
+    ai_prewarm_hours: str = "1-6"  # local hours (inclusive) in which the pre-warm job may run
+    ai_prewarm_interval_minutes: int = 60  # how often the scheduler checks whether to run
+    ai_prewarm_top_n: int = 20  # most requested prompts per endpoint warmed on each run
+    ai_prewarm_max_calls: int = 100  # upstream calls allowed per run
+    ai_prewarm_pause_seconds: float = 1.0  # pause between upstream calls to leave quota for users
+    ai_prewarm_refresh_within_hours: float = 24  # regenerate entries expiring within this window
+    ai_metrics_log_path: str = ""  # also append one JSON line per AI call to this file ("" = off)
+    ai_generation_profiles: Dict[str, Dict] = {}  # per-endpoint overrides as JSON, e.g. {"chat": {"max_output_tokens": 600}}
+    ai_model_routing: bool = True  # pick a model tier per request (off = standard models only)
+    ai_route_fast_max_prompt_tokens: int = 300  # longer messages are moved up from the fast tier
+    ai_route_large_plans: str = "basic,pro"  # user plans allowed the large tier (requests without a user never get it)
+    ai_route_slow_p95_seconds: float = 10.0  # step down a tier while its recent p95 latency is above this
+    ai_executor_workers: int = 256  # threads available for in-flight LLM calls
+    ai_cache_path: str = "ai_cache.db"  # SQLite file for the persistent response cache ("" = memory only)
+    ai_cache_max_entries: int = 512  # in-memory LRU size
+    ai_stream_buffer_chunks: int = 32  # chunks buffered between a provider stream and its SSE client
+    mock_test_shard_size: int = 5  # questions per concurrent request when generating a mock test
+    question_bank_min_pool: int = 45  # refill a (subject, topic, difficulty) pool in the background below this size
+    question_bank_refill_size: int = 30  # questions generated per refill
+    question_bank_serve_multiple: float = 3.0  # serve from a pool only when it holds this many times the test's questions
+    learning_batch_max_items: int = 20  # items accepted by /api/learning/batch
+    learning_batch_concurrency: int = 5  # items of one batch running at the same time
+    chat_context_token_budget: int = 3000  # recent conversation sent verbatim with each chat turn
+    chat_summary_token_budget: int = 400  # rolling summary of older turns
+    chat_history_queue_size: int = 10000  # chat messages waiting to be written before producers are slowed down
+    chat_history_batch_size: int = 200  # rows per bulk insert
+    chat_history_enqueue_timeout_seconds: float = 1.0  # wait this long for queue space, then drop the message
+    chat_conversation_max_messages: int = 40  # turns kept per server-held conversation
+    chat_conversation_cache_size: int = 10000  # conversations kept in memory (others are reloaded from the database)
+    chat_history_purge_batch_size: int = 500  # cleared chat messages deleted per transaction
+    chat_history_purge_pause_seconds: float = 0.2  # pause between purge batches
+    chat_history_purge_max_retries: int = 5  # failed batches in a row before a user's purge is left for the next restart
+    chat_stream_coalesce_ms: int = 50  # merge streamed chunks arriving within this window into one SSE event
+    chat_stream_coalesce_chars: int = 256  # ...or until this many characters are pending
+    chat_stream_heartbeat_seconds: float = 15.0  # send a keep-alive comment when the stream is idle this long
+    chat_stream_replay_ttl_seconds: float = 120.0  # keep finished streams this long so clients can resume them
+    chat_stream_max_buffers: int = 1000  # streams kept for resuming per worker
+    
     # Payment
     stripe_api_key: str = ""
     stripe_webhook_secret: str = ""
@@ -0,0 +1,170 @@
+"""
+Conversation context management for chat prompts
+"""
+
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import threading
+
+# Rough size of a token for English/Hinglish text; good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+# Greeting the frontend shows locally; it carries no context worth sending upstream
+GREETING_PREFIX = "Hello! I'm your AI"
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate (no tokenizer round trip)"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def fingerprint_turns(turns: List[Tuple[str, str]]) -> str:
+    """Stable hash of a sequence of (role, content) turns"""
+    digest = hashlib.sha1()
+    for role, content in turns:
+        digest.update(role.encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(content.encode("utf-8"))
+        digest.update(b"\x01")
+    return digest.hexdigest()
+
+
+class ContextWindow:
+    """Keeps a conversation within a token budget.
+
+    The most recent turns are sent verbatim. Once they exceed the budget, the window is
+    cut back to a low-water mark and the older turns are folded into a short rolling
+    summary that is cached per user, so the cut point (and the summary) stays stable
+    for the next several turns instead of moving on every message.
+    """
+
+    def __init__(self, budget_tokens: int = 3000, summary_tokens: int = 400,
+                 low_water: float = 0.6, max_users: int = 10000):
+        self.budget_tokens = budget_tokens
+        self.summary_tokens = summary_tokens
+        self.low_water = low_water
+        self.max_users = max_users
+        self._summaries = OrderedDict()  # user_id -> (folded_count, fingerprint, summary)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def turns_from_messages(messages: List[Dict]) -> List[Tuple[str, str]]:
+        """Convert client messages into (role, content) turns, skipping the canned greeting"""
+        turns = []
+        for msg in messages:
+            if msg['role'] == 'user':
+                turns.append(('user', msg['content']))
+            elif msg['role'] == 'assistant' and not msg['content'].startswith(GREETING_PREFIX):
+                turns.append(('assistant', msg['content']))
+        return turns
+
+    def build(self, messages: List[Dict], user_id: Optional[int] = None) -> Tuple[str, List[Tuple[str, str]]]:
+        """Return (summary of older turns, recent turns to send verbatim)"""
+        turns = self.turns_from_messages(messages)
+
+        cached = None
+        if user_id is not None:
+            with self._lock:
+                cached = self._summaries.get(user_id)
+                if cached is not None:
+                    self._summaries.move_to_end(user_id)
+
+        # Reuse the previous cut point while the client history still starts with it
+        if cached is not None:
+            folded, fingerprint, summary = cached
+            if folded < len(turns) and fingerprint_turns(turns[:folded]) == fingerprint \
+                    and self._tokens(turns[folded:]) <= self.budget_tokens:
+                return summary, turns[folded:]
+
+        if self._tokens(turns) <= self.budget_tokens:
+            return "", turns
+
+        # Over budget: keep the newest turns up to the low-water mark (always the last one)
+        keep_budget = int(self.budget_tokens * self.low_water)
+        cut = len(turns) - 1
+        used = estimate_tokens(turns[-1][1])
+        while cut > 0:
+            cost = estimate_tokens(turns[cut - 1][1])
+            if used + cost > keep_budget:
+                break
+            used += cost
+            cut -= 1
+
+        # Fold incrementally on top of the cached summary when the prefix still matches
+        summary, start = "", 0
+        if cached is not None and cached[0] <= cut and fingerprint_turns(turns[:cached[0]]) == cached[1]:
+            start, summary = cached[0], cached[2]
+        summary = self._fold(summary, turns[start:cut])
+
+        if user_id is not None:
+            with self._lock:
+                self._summaries[user_id] = (cut, fingerprint_turns(turns[:cut]), summary)
+                self._summaries.move_to_end(user_id)
+                while len(self._summaries) > self.max_users:
+                    self._summaries.popitem(last=False)
+        return summary, turns[cut:]
+
+    def forget(self, user_id: int):
+        """Drop the cached summary for a user (e.g. after clearing history)"""
+        with self._lock:
+            self._summaries.pop(user_id, None)
+
+    @staticmethod
+    def _tokens(turns: List[Tuple[str, str]]) -> int:
+        return sum(estimate_tokens(content) for _, content in turns)
+
+    def _fold(self, summary: str, turns: List[Tuple[str, str]]) -> str:
+        """Append compressed versions of turns to the summary, dropping the oldest lines past the budget"""
+        lines = summary.split("\n") if summary else []
+        for role, content in turns:
+            gist = " ".join(content.split())
+            if len(gist) > 160:
+                gist = gist[:157].rstrip() + "..."
+            lines.append(f"- {'Student asked' if role == 'user' else 'You answered'}: {gist}")
+
+        budget_chars = self.summary_tokens * CHARS_PER_TOKEN
+        total = sum(len(line) + 1 for line in lines)
+        while len(lines) > 1 and total > budget_chars:
+            total -= len(lines.pop(0)) + 1
+        return "\n".join(lines)
+
+
+class ChatSessionPool:
+    """Provider chat sessions kept per conversation and reused while the client history matches.
+
+    A session is checked out exclusively with take() and handed back with put() after a
+    successful turn, tagged with the fingerprint of everything it now contains. A request
+    whose history does not match (edited conversation, concurrent turn, new summary)
+    simply gets None and builds a fresh session.
+    """
+
+    def __init__(self, max_sessions: int = 2000):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # key -> (fingerprint, session)
+        self._lock = threading.Lock()
+        self._stats = {"reused": 0, "created": 0}
+
+    def take(self, key, fingerprint: str):
+        with self._lock:
+            entry = self._sessions.pop(key, None)
+            if entry is not None and entry[0] == fingerprint:
+                self._stats["reused"] += 1
+                return entry[1]
+            self._stats["created"] += 1
+            return None
+
+    def put(self, key, session, fingerprint: str):
+        with self._lock:
+            self._sessions[key] = (fingerprint, session)
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def forget(self, key):
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats, open_sessions=len(self._sessions))
@@ -0,0 +1,100 @@
+"""
+Server-side conversation state - recent turns per conversation, so clients send only the new message
+"""
+
+from typing import List, Optional, Tuple
+from collections import OrderedDict, deque
+import threading
+import uuid
+from config import settings
+from database import SessionLocal
+from history_writer import history_writer
+from history_purger import history_watermark
+from models import ChatHistory
+
+Turn = Tuple[str, str]
+
+
+def new_conversation_id() -> str:
+    return uuid.uuid4().hex
+
+
+class ConversationStore:
+    """Ring buffer of the last max_messages turns per (user, conversation), LRU-bounded.
+
+    get() answers from memory only and returns None on a miss; load() then rebuilds the
+    buffer from ChatHistory (after flushing the write-behind queue so the latest turns
+    are included). append() only extends buffers that are already complete, so a
+    conversation evicted from memory is always reloaded whole rather than partially.
+    """
+
+    def __init__(self, session_factory=SessionLocal, max_messages: int = 40, max_conversations: int = 10000):
+        self.session_factory = session_factory
+        self.max_messages = max_messages
+        self.max_conversations = max_conversations
+        self._buffers = OrderedDict()  # (user_id, conversation_id) -> deque of turns
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def get(self, user_id: int, conversation_id: str) -> Optional[List[Turn]]:
+        with self._lock:
+            buffer = self._buffers.get((user_id, conversation_id))
+            if buffer is None:
+                self._stats["misses"] += 1
+                return None
+            self._buffers.move_to_end((user_id, conversation_id))
+            self._stats["hits"] += 1
+            return list(buffer)
+
+    def load(self, user_id: int, conversation_id: str) -> List[Turn]:
+        """Rebuild a conversation from the database (blocking; run it off the event loop)"""
+        history_writer.flush_user(user_id)
+        db = self.session_factory()
+        try:
+            query = db.query(ChatHistory.role, ChatHistory.content).filter(
+                ChatHistory.user_id == user_id,
+                ChatHistory.conversation_id == conversation_id
+            )
+            watermark = history_watermark(db, user_id)
+            if watermark is not None:
+                query = query.filter(ChatHistory.timestamp >= watermark)
+            rows = query.order_by(ChatHistory.timestamp.desc(), ChatHistory.id.desc()).limit(self.max_messages).all()
+        finally:
+            db.close()
+        turns = [(role, content) for role, content in reversed(rows)]
+        with self._lock:
+            self._buffers[(user_id, conversation_id)] = deque(turns, maxlen=self.max_messages)
+            self._buffers.move_to_end((user_id, conversation_id))
+            while len(self._buffers) > self.max_conversations:
+                self._buffers.popitem(last=False)
+        return turns
+
+    def start(self, user_id: int, conversation_id: str):
+        """Register a brand-new (empty) conversation so its first turns are buffered"""
+        with self._lock:
+            self._buffers[(user_id, conversation_id)] = deque(maxlen=self.max_messages)
+            while len(self._buffers) > self.max_conversations:
+                self._buffers.popitem(last=False)
+
+    def append(self, user_id: int, conversation_id: str, role: str, content: str):
+        with self._lock:
+            buffer = self._buffers.get((user_id, conversation_id))
+            if buffer is not None:
+                buffer.append((role, content))
+
+    def forget(self, user_id: int):
+        """Drop every buffered conversation of a user (e.g. after clearing history)"""
+        with self._lock:
+            for key in [key for key in self._buffers if key[0] == user_id]:
+                del self._buffers[key]
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, conversations=len(self._buffers), max_conversations=self.max_conversations)
+
+
+conversation_store = ConversationStore(
+    SessionLocal,
+    max_messages=settings.chat_conversation_max_messages,
+    max_conversations=settings.chat_conversation_cache_size
+)
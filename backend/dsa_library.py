@@ -0,0 +1,123 @@
+"""
+Offline DSA solution library - demo solutions served when the AI provider is unavailable
+"""
+
+from typing import Dict, List, Optional, Tuple
+from collections import defaultdict
+import os
+import re
+import threading
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "dsa_solutions")
+
+# Answer for problems the library has no solution for ({problem} and {examples} are filled in)
+FALLBACK_FILE = "_fallback.md"
+
+# A full alias match scores ALIAS_WEIGHT per word; keywords add 1 each to solutions an alias matched
+ALIAS_WEIGHT = 2
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def read_front_matter(path: str) -> Tuple[Dict[str, str], int]:
+    """Parse the `---` header of a solution file; returns (fields, offset where the body starts)"""
+    fields = {}
+    # Binary mode, so the offset counts the bytes actually on disk (CRLF files included)
+    with open(path, "rb") as f:
+        first = f.readline()
+        if first.strip() != b"---":
+            return fields, 0
+        offset = len(first)
+        for raw in f:
+            offset += len(raw)
+            line = raw.decode("utf-8")
+            if line.strip() == "---":
+                break
+            key, _, value = line.partition(":")
+            fields[key.strip()] = value.strip()
+    return fields, offset
+
+
+class DemoSolutionLibrary:
+    """Markdown solutions in data/dsa_solutions, matched through an inverted index.
+
+    Each file starts with a small header (title, summary, comma-separated aliases and
+    keywords). The index maps every word to the aliases and keywords that contain it;
+    it is built from the headers on first use, and solution bodies are only read when
+    served. A lookup touches only the postings of the words in the problem, so its cost
+    does not grow with the number of solutions.
+    """
+
+    def __init__(self, directory: str = DATA_DIR):
+        self.directory = directory
+        self._entries = None   # name -> header fields
+        self._offsets = {}     # name -> byte offset of the body
+        self._aliases = None   # word -> [(name, alias words)]
+        self._keywords = None  # word -> [name]
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        with self._lock:
+            if self._entries is not None:
+                return
+            entries, aliases, keywords = {}, defaultdict(list), defaultdict(list)
+            for filename in sorted(os.listdir(self.directory)):
+                if not filename.endswith(".md") or filename.startswith("_"):
+                    continue
+                name = filename[:-3]
+                fields, offset = read_front_matter(os.path.join(self.directory, filename))
+                entries[name] = fields
+                self._offsets[name] = offset
+                for alias in fields.get("aliases", "").split(","):
+                    words = frozenset(tokenize(alias))
+                    if words:
+                        # Indexed under one word; the rest are checked at lookup time
+                        aliases[min(words)].append((name, words))
+                for keyword in fields.get("keywords", "").split(","):
+                    for word in tokenize(keyword):
+                        keywords[word].append(name)
+            self._aliases, self._keywords = dict(aliases), dict(keywords)
+            self._entries = entries
+
+    def search(self, problem: str, limit: int = 5) -> List[Tuple[int, str]]:
+        """Best matching solutions as (score, name), highest score first"""
+        self._load()
+        words = set(tokenize(problem))
+        scores = defaultdict(int)
+        for word in words:
+            for name, alias in self._aliases.get(word, ()):
+                if alias <= words:
+                    scores[name] = max(scores[name], ALIAS_WEIGHT * len(alias))
+        for word in words:
+            for name in self._keywords.get(word, ()):
+                if name in scores:
+                    scores[name] += 1
+        ranked = sorted(((score, name) for name, score in scores.items()), key=lambda item: (-item[0], item[1]))
+        return ranked[:limit]
+
+    def _body(self, name: str) -> str:
+        with open(os.path.join(self.directory, f"{name}.md"), "rb") as f:
+            f.seek(self._offsets.get(name, 0))
+            return f.read().decode("utf-8").replace("\r\n", "\n")
+
+    def find(self, problem: str) -> Optional[str]:
+        """Solution text of the best match, or None"""
+        ranked = self.search(problem, limit=1)
+        return self._body(ranked[0][1]) if ranked else None
+
+    def fallback(self, problem: str) -> str:
+        """Generic answer listing some of the available solutions"""
+        self._load()
+        examples = "\n".join(
+            f"- ✅ **{fields.get('title', name)}** - {fields.get('summary', 'Complete solution')}"
+            for name, fields in list(self._entries.items())[:10]
+        )
+        with open(os.path.join(self.directory, FALLBACK_FILE), encoding="utf-8") as f:
+            return f.read().replace("{examples}", examples).replace("{problem}", problem)
+
+
+demo_solutions = DemoSolutionLibrary()
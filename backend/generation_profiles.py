@@ -0,0 +1,69 @@
+"""
+Generation profiles - per-endpoint output budgets, sampling, stop sequences and model tier
+"""
+
+from typing import Dict
+
+# Used for any endpoint without a profile, and as the base every profile is merged onto
+DEFAULT_PROFILE = {
+    "temperature": 0.7,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 2048,
+    "tier": "standard",
+}
+
+# Short conversational paths get small budgets so they finish fast; long-form content keeps room.
+# "tier" selects the model class for the endpoint, the other keys are passed to the provider.
+PROFILES = {
+    "chat": {"max_output_tokens": 1024, "stop_sequences": ["\nUser:", "\nStudent:"], "tier": "fast"},
+    "solve_doubt": {"max_output_tokens": 1024, "tier": "fast"},
+    "dsa_hint": {"max_output_tokens": 2048, "temperature": 0.4, "tier": "large"},
+    "explain_code": {"max_output_tokens": 2048, "temperature": 0.3},
+    "explain_topic": {"max_output_tokens": 2048},
+    "solve_previous_year": {"max_output_tokens": 2048, "temperature": 0.3},
+    "analyze_resume": {"max_output_tokens": 2048, "temperature": 0.4},
+    "generate_study_plan": {"max_output_tokens": 3072},
+    "project_guidance": {"max_output_tokens": 3072},
+    "generate_notes": {"max_output_tokens": 4096},
+    "interview_prep": {"max_output_tokens": 4096},
+    # One shard of mock test questions (see mock_test_shard_size), returned as JSON
+    "generate_mock_test": {"max_output_tokens": 3072, "temperature": 0.8, "response_mime_type": "application/json"},
+}
+
+# Profile keys that are not generation parameters
+ROUTING_KEYS = ("tier",)
+
+
+class GenerationProfiles:
+    """Resolved profiles: DEFAULT_PROFILE, then PROFILES, then overrides (from settings).
+
+    overrides has the same shape as PROFILES, e.g. {"chat": {"max_output_tokens": 600}};
+    a "default" entry applies to every endpoint. Profiles are resolved once, so lookups
+    on the request path are a dict access.
+    """
+
+    def __init__(self, overrides: Dict[str, Dict] = None):
+        overrides = overrides or {}
+        base = {**DEFAULT_PROFILE, **overrides.get("default", {})}
+        self._profiles = {"default": base}
+        for endpoint in set(PROFILES) | set(overrides):
+            if endpoint != "default":
+                self._profiles[endpoint] = {**base, **PROFILES.get(endpoint, {}), **overrides.get(endpoint, {})}
+        self._configs = {
+            endpoint: {key: value for key, value in profile.items() if key not in ROUTING_KEYS}
+            for endpoint, profile in self._profiles.items()
+        }
+
+    def profile(self, endpoint: str = None) -> Dict:
+        return self._profiles.get(endpoint or "default", self._profiles["default"])
+
+    def config(self, endpoint: str = None) -> Dict:
+        """Generation config sent to the provider (Gemini-style keys, see LLMProvider)"""
+        return self._configs.get(endpoint or "default", self._configs["default"])
+
+    def tier(self, endpoint: str = None) -> str:
+        return self.profile(endpoint)["tier"]
+
+    def stats(self) -> Dict:
+        return {endpoint: dict(profile) for endpoint, profile in sorted(self._profiles.items())}
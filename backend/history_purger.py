@@ -0,0 +1,166 @@
+"""
+Chat history purger - clearing history is a watermark, the rows are deleted later in small batches
+"""
+
+from typing import Dict, Optional
+from datetime import datetime
+import threading
+from sqlalchemy import delete, exists, select
+from config import settings
+from database import SessionLocal
+from models import ChatHistory, User
+
+
+def history_watermark(db, user_id: int) -> Optional[datetime]:
+    """Messages older than this were cleared by the user and must not be shown"""
+    return db.query(User.history_cleared_before).filter(User.id == user_id).scalar()
+
+
+class HistoryPurger:
+    """Deletes cleared chat history in bounded batches on one background thread.
+
+    DELETE /api/chat/history only moves the user's history_cleared_before watermark,
+    which history reads honour, so the request costs one UPDATE however long the history
+    is. schedule() then hands the user to this thread, which deletes at most batch_size
+    rows per transaction and sleeps pause seconds between batches so a large purge never
+    holds long locks or competes with live traffic. On start() users whose watermark
+    still hides rows are picked up again, so purges survive a restart. A failing batch is
+    retried with exponential backoff; after max_retries failures in a row the user is
+    dropped until the next start().
+    """
+
+    def __init__(self, session_factory=SessionLocal, batch_size: int = 500, pause: float = 0.2,
+                 max_retries: int = 5, retry_backoff: float = 1.0, max_backoff: float = 60.0):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.pause = pause
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self._pending = set()
+        self._failures = {}  # user_id -> failed batches in a row
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {"scheduled": 0, "purged": 0, "batches": 0, "failed_batches": 0, "users_done": 0,
+                       "users_dropped": 0}
+        self._last_error = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="chat-history-purger", daemon=True)
+            self._thread.start()
+
+    def schedule(self, user_id: int):
+        """Purge a user's rows older than their watermark in the background"""
+        with self._lock:
+            self._pending.add(user_id)
+            self._stats["scheduled"] += 1
+        self.start()
+        self._wake.set()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop after the current batch; unfinished users are resumed on the next start()"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _resume_pending(self):
+        db = self.session_factory()
+        try:
+            hidden_rows = exists().where(
+                ChatHistory.user_id == User.id, ChatHistory.timestamp < User.history_cleared_before
+            )
+            user_ids = [row[0] for row in db.query(User.id).filter(hidden_rows).all()]
+        except Exception as e:
+            print(f"[HISTORY] Could not look up pending purges: {e}")
+            return
+        finally:
+            db.close()
+        with self._lock:
+            self._pending.update(user_ids)
+
+    def _run(self):
+        self._resume_pending()
+        while not self._stop.is_set():
+            with self._lock:
+                user_id = next(iter(self._pending), None)
+            if user_id is None:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            deleted = self.purge_batch(user_id)
+            self._stop.wait(self._after_batch(user_id, deleted))
+
+    def _after_batch(self, user_id: int, deleted: Optional[int]) -> float:
+        """Book the outcome of one batch; returns how long to wait before the next one"""
+        with self._lock:
+            if deleted is not None:
+                self._failures.pop(user_id, None)
+                if deleted < self.batch_size:
+                    self._pending.discard(user_id)
+                    self._stats["users_done"] += 1
+                return self.pause
+            failures = self._failures.get(user_id, 0) + 1
+            if failures <= self.max_retries:
+                self._failures[user_id] = failures
+                return min(self.max_backoff, self.pause + self.retry_backoff * 2 ** (failures - 1))
+            self._failures.pop(user_id, None)
+            self._pending.discard(user_id)
+            self._stats["users_dropped"] += 1
+        print(f"[HISTORY] Giving up purging user {user_id} after {failures} failed batches; "
+              f"it is resumed on the next start")
+        return self.pause
+
+    def purge_batch(self, user_id: int) -> Optional[int]:
+        """Delete up to batch_size cleared rows of one user; the number deleted, or None on failure"""
+        db = self.session_factory()
+        try:
+            watermark = history_watermark(db, user_id)
+            if watermark is None:
+                return 0
+            ids = select(ChatHistory.id).where(
+                ChatHistory.user_id == user_id, ChatHistory.timestamp < watermark
+            ).limit(self.batch_size)
+            ids = [row[0] for row in db.execute(ids)]
+            if ids:
+                db.execute(delete(ChatHistory).where(ChatHistory.id.in_(ids)))
+                db.commit()
+            with self._lock:
+                self._stats["purged"] += len(ids)
+                self._stats["batches"] += bool(ids)
+            return len(ids)
+        except Exception as e:
+            db.rollback()
+            self._last_error = str(e)[:200]
+            print(f"[HISTORY] Purge batch for user {user_id} failed: {e}")
+            with self._lock:
+                self._stats["failed_batches"] += 1
+            return None
+        finally:
+            db.close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats, pending_users=len(self._pending))
+        return dict(
+            stats,
+            batch_size=self.batch_size,
+            running=self._thread is not None and self._thread.is_alive(),
+            last_error=self._last_error
+        )
+
+
+history_purger = HistoryPurger(
+    SessionLocal,
+    batch_size=settings.chat_history_purge_batch_size,
+    pause=settings.chat_history_purge_pause_seconds,
+    max_retries=settings.chat_history_purge_max_retries
+)
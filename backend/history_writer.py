@@ -0,0 +1,211 @@
+"""
+Chat history writer - write-behind, batched persistence of ChatHistory rows
+"""
+
+from typing import Dict, List, Optional
+from datetime import datetime
+import asyncio
+import queue
+import threading
+import time
+from sqlalchemy import insert
+from config import settings
+from database import SessionLocal
+from models import ChatHistory
+
+_STOP = object()
+
+
+class ChatHistoryWriter:
+    """Bounded queue of chat messages, inserted in batches by one background thread.
+
+    Routes hand rows over with submit_async() and return without touching the database;
+    the writer drains whatever has queued up into a single bulk INSERT and commit, so
+    under load many turns share one transaction. Timestamps are taken when a row is
+    queued, so ordering is the order of the conversation, not of the writes.
+
+    When the queue is full, producers wait up to enqueue_timeout (backpressure) and the
+    row is dropped after that; both are counted in stats(). flush() waits until every row
+    queued before the call is written (stop() uses it on shutdown); flush_user() does the
+    same only if that user has rows queued, which is what readers use for read-your-writes.
+    """
+
+    def __init__(self, session_factory=SessionLocal, max_queue: int = 10000, batch_size: int = 200,
+                 enqueue_timeout: float = 1.0, retry_attempts: int = 3):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.enqueue_timeout = enqueue_timeout
+        self.retry_attempts = retry_attempts
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._pending_users = {}  # user_id -> rows queued but not yet written or failed
+        self._stats = {"queued": 0, "written": 0, "batches": 0, "failed": 0, "dropped": 0,
+                       "backpressure_waits": 0, "max_batch": 0}
+        self._last_error = None
+
+    @staticmethod
+    def row(user_id: int, role: str, content: str, language: str = "english",
+            conversation_id: Optional[str] = None) -> Dict:
+        return {"user_id": user_id, "role": role, "content": content, "language": language,
+                "conversation_id": conversation_id, "timestamp": datetime.utcnow()}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="chat-history-writer", daemon=True)
+                self._thread.start()
+
+    def _count(self, field: str, amount: int = 1):
+        with self._lock:
+            self._stats[field] += amount
+
+    def _queued(self, row: Dict):
+        with self._lock:
+            self._stats["queued"] += 1
+            self._pending_users[row["user_id"]] = self._pending_users.get(row["user_id"], 0) + 1
+
+    def _settled(self, rows: List[Dict]):
+        with self._lock:
+            for row in rows:
+                left = self._pending_users.get(row["user_id"], 0) - 1
+                if left > 0:
+                    self._pending_users[row["user_id"]] = left
+                else:
+                    self._pending_users.pop(row["user_id"], None)
+
+    def submit(self, rows: List[Dict], timeout: float = None) -> bool:
+        """Queue rows, waiting up to timeout for space; False if they were dropped"""
+        self.start()
+        timeout = self.enqueue_timeout if timeout is None else timeout
+        for index, row in enumerate(rows):
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                self._count("backpressure_waits")
+                try:
+                    self._queue.put(row, timeout=timeout)
+                except queue.Full:
+                    self._count("dropped", len(rows) - index)
+                    print(f"[HISTORY] Queue full, dropped {len(rows) - index} chat message(s)")
+                    return False
+            self._queued(row)
+        return True
+
+    async def submit_async(self, rows: List[Dict]) -> bool:
+        """submit() for async routes: no await unless the queue is full"""
+        self.start()
+        try:
+            for index, row in enumerate(rows):
+                self._queue.put_nowait(row)
+                self._queued(row)
+        except queue.Full:
+            return await asyncio.get_running_loop().run_in_executor(None, self.submit, rows[index:])
+        return True
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until every row queued so far is written (or failed); False on timeout"""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def flush_user(self, user_id: int, timeout: float = 5.0) -> bool:
+        """flush(), but only if this user has rows waiting; False if they were not written in time"""
+        with self._lock:
+            if not self._pending_users.get(user_id):
+                return True
+        return self.flush(timeout)
+
+    def stop(self, timeout: float = 10.0):
+        """Write what is queued and stop the background thread (application shutdown)"""
+        if self._thread is None:
+            return
+        self.flush(timeout)
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            batch, waiters, stop = [], [], False
+            item = self._queue.get()
+            while True:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+                self._settled(batch)
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                return
+
+    def _insert(self, rows: List[Dict]) -> bool:
+        session = self.session_factory()
+        try:
+            session.execute(insert(ChatHistory), rows)
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            self._last_error = str(e)[:200]
+            print(f"[HISTORY] Insert of {len(rows)} row(s) failed: {e}")
+            return False
+        finally:
+            session.close()
+
+    def _write(self, rows: List[Dict]):
+        for attempt in range(1, self.retry_attempts + 1):
+            if self._insert(rows):
+                with self._lock:
+                    self._stats["written"] += len(rows)
+                    self._stats["batches"] += 1
+                    self._stats["max_batch"] = max(self._stats["max_batch"], len(rows))
+                return
+            if attempt < self.retry_attempts:
+                time.sleep(0.5 * 2 ** (attempt - 1))
+        if len(rows) == 1:
+            self._count("failed")
+            return
+        # Keeps failing: a bad row should not take the rest of the batch down with it
+        print(f"[HISTORY] Writing a failed batch of {len(rows)} row by row")
+        for row in rows:
+            if self._insert([row]):
+                self._count("written")
+            else:
+                self._count("failed")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        return dict(
+            stats,
+            pending=self._queue.qsize(),
+            max_queue=self._queue.maxsize,
+            avg_batch=round(stats["written"] / stats["batches"], 1) if stats["batches"] else 0,
+            running=self._thread is not None and self._thread.is_alive(),
+            last_error=self._last_error
+        )
+
+
+history_writer = ChatHistoryWriter(
+    SessionLocal,
+    max_queue=settings.chat_history_queue_size,
+    batch_size=settings.chat_history_batch_size,
+    enqueue_timeout=settings.chat_history_enqueue_timeout_seconds
+)
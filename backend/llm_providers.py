@@ -0,0 +1,584 @@
+"""
+LLM provider adapters - one interface in front of Gemini, OpenAI, Anthropic and a local fake
+"""
+
+from typing import Dict, Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import hashlib
+import inspect
+import threading
+import time
+from conversation import ChatSessionPool, estimate_tokens, fingerprint_turns
+from quota import KeyQuota, QuotaExhausted
+from resilience import QUOTA, classify_error
+
+Turns = List[Tuple[str, str]]
+
+
+class ProviderError(Exception):
+    """Raised when no provider could serve a request"""
+
+
+class Completion(str):
+    """Response text that also carries what the provider reported about the call.
+
+    Behaves exactly like the text everywhere else (caching, JSON); the metrics layer
+    reads the token usage and finish reason off it. Fields are None when unknown.
+    """
+
+    def __new__(cls, text: str, input_tokens: int = None, output_tokens: int = None,
+                finish_reason: str = None, model: str = None):
+        completion = super().__new__(cls, text)
+        completion.input_tokens = input_tokens
+        completion.output_tokens = output_tokens
+        completion.finish_reason = finish_reason
+        completion.model = model
+        return completion
+
+
+def is_configured(api_key: str) -> bool:
+    """True for real-looking keys, False for empty values and the demo placeholders from .env.example"""
+    return bool(api_key) and "demo" not in api_key and not api_key.startswith("your-")
+
+
+def split_keys(value: str) -> List[str]:
+    """Configured API keys from a comma-separated setting, placeholders removed"""
+    return [key.strip() for key in (value or "").split(",") if is_configured(key.strip())]
+
+
+def estimate_request_tokens(prompt: str, system: str = None, history: Turns = None) -> int:
+    """Rough input size of a request, used for tokens-per-minute accounting"""
+    return estimate_tokens(prompt) + estimate_tokens(system or "") + sum(
+        estimate_tokens(content) for _, content in history or []
+    )
+
+
+def merge_turns(history: Turns) -> Turns:
+    """Merge back-to-back turns from the same role (chat APIs expect alternating roles)"""
+    merged = []
+    for role, content in history or []:
+        role = "user" if role == "user" else "assistant"
+        if merged and merged[-1][0] == role:
+            merged[-1] = (role, f"{merged[-1][1]}\n\n{content}")
+        else:
+            merged.append((role, content))
+    return merged
+
+
+class LLMProvider:
+    """Base class for provider adapters.
+
+    generate() returns the full response text and stream() yields text chunks; both raise
+    on failure so callers can retry or fail over. config uses Gemini-style keys
+    (temperature, top_p, top_k, max_output_tokens, stop_sequences, response_mime_type),
+    which each adapter maps to its SDK; keys an SDK has no equivalent for are dropped.
+    """
+
+    name = "base"
+
+    def generate(self, prompt: str, system: str = None, history: Turns = None,
+                 config: Dict = None, session_key=None) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, system: str = None, history: Turns = None,
+               config: Dict = None, session_key=None) -> Iterator[str]:
+        # Providers without native streaming return the whole answer as one chunk
+        yield self.generate(prompt, system, history, config, session_key)
+
+    def forget_session(self, session_key):
+        """Drop any provider-side conversation state kept for session_key"""
+
+    def stats(self) -> Dict:
+        return {"name": self.name}
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini via google-generativeai, with reusable chat sessions per conversation"""
+
+    def __init__(self, api_key: str, model_name: str, dedicated_client: bool = False):
+        import google.generativeai as genai
+        self.genai = genai
+        self._client = None
+        if dedicated_client:
+            # genai.configure() holds a single global key, so with several keys each provider
+            # gets its own public GenerativeServiceClient. Handing it to a model goes through
+            # GenerativeModel._client, which is why google-generativeai is pinned in requirements.txt.
+            from google.ai import generativelanguage as glm
+            self._client = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+        else:
+            genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.name = f"gemini:{model_name}"
+        self.model = self._new_model()
+        self.sessions = ChatSessionPool()
+        # Newer SDKs accept a real system instruction; older ones get it as a primer turn
+        self.supports_system_instruction = (
+            "system_instruction" in inspect.signature(genai.GenerativeModel.__init__).parameters
+        )
+        # Older SDKs reject unknown generation config keys (e.g. response_mime_type)
+        self.config_keys = set(inspect.signature(genai.types.GenerationConfig).parameters)
+
+    def _config(self, config):
+        if not config:
+            return config
+        return {key: value for key, value in config.items() if key in self.config_keys}
+
+    def _new_model(self, **kwargs):
+        model = self.genai.GenerativeModel(self.model_name, **kwargs)
+        if self._client is not None:
+            model._client = self._client
+        return model
+
+    def _open_session(self, system: str, history: Turns, session_key=None):
+        """Reuse the conversation's chat session if it already holds exactly this history, else build one"""
+        state = fingerprint_turns([("system", system)] + list(history))
+        session = self.sessions.take(session_key, state) if session_key is not None else None
+        if session is not None:
+            return session
+
+        contents = []
+        if self.supports_system_instruction:
+            model = self._new_model(system_instruction=system)
+        else:
+            model = self.model
+            contents.append({"role": "user", "parts": [system]})
+            contents.append({"role": "model", "parts": ["Understood."]})
+        for role, content in merge_turns(history):
+            gemini_role = "user" if role == "user" else "model"
+            if contents and contents[-1]["role"] == gemini_role:
+                contents[-1]["parts"][0] += f"\n\n{content}"
+            else:
+                contents.append({"role": gemini_role, "parts": [content]})
+        if contents and contents[-1]["role"] == "user":
+            contents.append({"role": "model", "parts": ["..."]})
+        return model.start_chat(history=contents)
+
+    def _release_session(self, session, system: str, history: Turns, prompt: str, reply: str, session_key=None):
+        """Hand a session back after a successful turn, tagged with what it now contains"""
+        if session_key is None:
+            return
+        state = fingerprint_turns([("system", system)] + list(history) + [("user", prompt), ("assistant", reply)])
+        self.sessions.put(session_key, session, state)
+
+    def _completion(self, response) -> Completion:
+        usage = getattr(response, "usage_metadata", None)
+        candidates = getattr(response, "candidates", None) or []
+        reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+        return Completion(
+            response.text,
+            input_tokens=getattr(usage, "prompt_token_count", None),
+            output_tokens=getattr(usage, "candidates_token_count", None),
+            finish_reason=getattr(reason, "name", None) or (str(reason).lower() if reason is not None else None),
+            model=self.name
+        )
+
+    def generate(self, prompt, system=None, history=None, config=None, session_key=None):
+        if system is None:
+            return self._completion(self.model.generate_content(prompt, generation_config=self._config(config)))
+
+        # A conversation that continues where it left off only converts and appends the new message
+        history = history or []
+        session = self._open_session(system, history, session_key)
+        text = self._completion(session.send_message(prompt, generation_config=self._config(config)))
+        self._release_session(session, system, history, prompt, text, session_key)
+        return text
+
+    def stream(self, prompt, system=None, history=None, config=None, session_key=None):
+        if system is None:
+            for chunk in self.model.generate_content(prompt, generation_config=self._config(config), stream=True):
+                if chunk.text:
+                    yield chunk.text
+            return
+
+        history = history or []
+        session = self._open_session(system, history, session_key)
+        parts = []
+        for chunk in session.send_message(prompt, generation_config=self._config(config), stream=True):
+            if chunk.text:
+                parts.append(chunk.text)
+                yield chunk.text
+        self._release_session(session, system, history, prompt, "".join(parts), session_key)
+
+    def forget_session(self, session_key):
+        self.sessions.forget(session_key)
+
+    def stats(self):
+        return {"name": self.name, "chat_sessions": self.sessions.stats()}
+
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI chat completions"""
+
+    def __init__(self, api_key: str, model_name: str, timeout: float = None):
+        from openai import OpenAI
+        self.model_name = model_name
+        self.name = f"openai:{model_name}"
+        self.client = OpenAI(api_key=api_key, timeout=timeout or 60.0, max_retries=0)
+
+    def _request(self, prompt, system, history, config):
+        messages = []
+        if system:
+            messages.append({"role": "system", "content": system})
+        messages.extend({"role": role, "content": content} for role, content in merge_turns(history))
+        messages.append({"role": "user", "content": prompt})
+        config = config or {}
+        request = {"model": self.model_name, "messages": messages}
+        if "temperature" in config:
+            request["temperature"] = config["temperature"]
+        if "top_p" in config:
+            request["top_p"] = config["top_p"]
+        if "max_output_tokens" in config:
+            request["max_tokens"] = config["max_output_tokens"]
+        if config.get("stop_sequences"):
+            request["stop"] = config["stop_sequences"][:4]
+        if config.get("response_mime_type") == "application/json":
+            request["response_format"] = {"type": "json_object"}
+        return request
+
+    def generate(self, prompt, system=None, history=None, config=None, session_key=None):
+        response = self.client.chat.completions.create(**self._request(prompt, system, history, config))
+        usage = getattr(response, "usage", None)
+        return Completion(
+            response.choices[0].message.content or "",
+            input_tokens=getattr(usage, "prompt_tokens", None),
+            output_tokens=getattr(usage, "completion_tokens", None),
+            finish_reason=response.choices[0].finish_reason,
+            model=self.name
+        )
+
+    def stream(self, prompt, system=None, history=None, config=None, session_key=None):
+        response = self.client.chat.completions.create(stream=True, **self._request(prompt, system, history, config))
+        for event in response:
+            if event.choices and event.choices[0].delta.content:
+                yield event.choices[0].delta.content
+
+
+class AnthropicProvider(LLMProvider):
+    """Anthropic messages API"""
+
+    def __init__(self, api_key: str, model_name: str, timeout: float = None):
+        from anthropic import Anthropic
+        self.model_name = model_name
+        self.name = f"anthropic:{model_name}"
+        self.client = Anthropic(api_key=api_key, timeout=timeout or 60.0, max_retries=0)
+
+    def _request(self, prompt, system, history, config):
+        messages = [{"role": role, "content": content} for role, content in merge_turns(history)]
+        # The conversation must start with a user turn and alternate from there
+        if messages and messages[0]["role"] == "assistant":
+            messages.insert(0, {"role": "user", "content": "(continuing our conversation)"})
+        if messages and messages[-1]["role"] == "user":
+            messages[-1]["content"] += f"\n\n{prompt}"
+        else:
+            messages.append({"role": "user", "content": prompt})
+        config = config or {}
+        request = {
+            "model": self.model_name,
+            "messages": messages,
+            "max_tokens": config.get("max_output_tokens", 2048),
+        }
+        if system:
+            request["system"] = system
+        for key in ("temperature", "top_p", "top_k", "stop_sequences"):
+            if key in config:
+                request[key] = config[key]
+        return request
+
+    def generate(self, prompt, system=None, history=None, config=None, session_key=None):
+        response = self.client.messages.create(**self._request(prompt, system, history, config))
+        usage = getattr(response, "usage", None)
+        return Completion(
+            "".join(block.text for block in response.content if getattr(block, "text", None)),
+            input_tokens=getattr(usage, "input_tokens", None),
+            output_tokens=getattr(usage, "output_tokens", None),
+            finish_reason=response.stop_reason,
+            model=self.name
+        )
+
+    def stream(self, prompt, system=None, history=None, config=None, session_key=None):
+        events = self.client.messages.create(stream=True, **self._request(prompt, system, history, config))
+        for event in events:
+            if event.type == "content_block_delta" and getattr(event.delta, "text", None):
+                yield event.delta.text
+
+
+class FakeProvider(LLMProvider):
+    """Deterministic local provider for tests, load tests and offline development.
+
+    The answer depends only on the request, and latency_ms simulates upstream latency
+    (spread across chunks when streaming).
+    """
+
+    def __init__(self, latency_ms: int = 0, response: str = None, name: str = "fake"):
+        self.latency_ms = latency_ms
+        self.response = response
+        self.name = name
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _answer(self, prompt, system, history):
+        if self.response is not None:
+            return self.response
+        digest = hashlib.sha1(f"{system}|{history}|{prompt}".encode("utf-8")).hexdigest()[:8]
+        return f"[{self.name} {digest}] Response to: {' '.join(prompt.split())[:200]}"
+
+    def _count(self):
+        with self._lock:
+            self.calls += 1
+
+    def generate(self, prompt, system=None, history=None, config=None, session_key=None):
+        self._count()
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return self._answer(prompt, system, history)
+
+    def stream(self, prompt, system=None, history=None, config=None, session_key=None):
+        self._count()
+        words = self._answer(prompt, system, history).split(" ")
+        for index, word in enumerate(words):
+            if self.latency_ms:
+                time.sleep(self.latency_ms / 1000 / len(words))
+            yield word if index == len(words) - 1 else word + " "
+
+    def stats(self):
+        return {"name": self.name, "calls": self.calls, "latency_ms": self.latency_ms}
+
+
+class KeyPool(LLMProvider):
+    """Spreads requests over several API keys of one provider, each with its own RPM / TPM buckets.
+
+    A request goes to the key with the most headroom (conversations stick to one key so
+    their chat session can be reused). When every key is out of budget the request waits
+    up to queue_timeout for the first one to refill and is then shed with QuotaExhausted,
+    instead of spending a round trip on a 429.
+    """
+
+    def __init__(self, members: List[Tuple[LLMProvider, KeyQuota]], name: str = None,
+                 queue_timeout: float = 2.0, expected_output_tokens: int = 512):
+        self.members = members
+        self.name = name or members[0][0].name
+        self.queue_timeout = queue_timeout
+        self.expected_output_tokens = expected_output_tokens
+
+    def _order(self, session_key):
+        if session_key is not None:
+            start = int(hashlib.sha1(str(session_key).encode("utf-8")).hexdigest(), 16) % len(self.members)
+            return self.members[start:] + self.members[:start]
+        return sorted(self.members, key=lambda member: member[1].headroom(), reverse=True)
+
+    def _reserve(self, tokens: int, session_key) -> Tuple[LLMProvider, KeyQuota]:
+        deadline = time.monotonic() + self.queue_timeout
+        while True:
+            shortest = None
+            for provider, quota in self._order(session_key):
+                wait = quota.reserve(tokens)
+                if wait == 0:
+                    return provider, quota
+                shortest = wait if shortest is None else min(shortest, wait)
+            remaining = deadline - time.monotonic()
+            if shortest > remaining:
+                raise QuotaExhausted(f"{self.name}: all API keys are at their rate limit")
+            time.sleep(shortest)
+
+    def _failed(self, quota: KeyQuota, error: Exception):
+        if classify_error(error) == QUOTA:
+            quota.exhaust()
+
+    def generate(self, prompt, system=None, history=None, config=None, session_key=None):
+        estimated = estimate_request_tokens(prompt, system, history)
+        provider, quota = self._reserve(estimated + self.expected_output_tokens, session_key)
+        try:
+            text = provider.generate(prompt, system, history, config, session_key)
+        except Exception as e:
+            quota.settle(estimated + self.expected_output_tokens, estimated)
+            self._failed(quota, e)
+            raise
+        used = (getattr(text, "input_tokens", None) or estimated) + \
+            (getattr(text, "output_tokens", None) or estimate_tokens(text))
+        quota.settle(estimated + self.expected_output_tokens, used)
+        return text
+
+    def stream(self, prompt, system=None, history=None, config=None, session_key=None):
+        estimated = estimate_request_tokens(prompt, system, history)
+        provider, quota = self._reserve(estimated + self.expected_output_tokens, session_key)
+        chunks = provider.stream(prompt, system, history, config, session_key)
+        parts = []
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                yield chunk
+        except Exception as e:
+            self._failed(quota, e)
+            raise
+        finally:
+            chunks.close()
+            quota.settle(estimated + self.expected_output_tokens, estimated + estimate_tokens("".join(parts)))
+
+    def forget_session(self, session_key):
+        for provider, _ in self.members:
+            provider.forget_session(session_key)
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "keys": [dict(provider.stats(), quota=quota.stats()) for provider, quota in self.members]
+        }
+
+
+class FailoverProvider(LLMProvider):
+    """Tries providers in order, moving on when one errors, is over quota or is too slow.
+
+    A provider that reports a quota error is skipped for cooldown_seconds. Streams can
+    only fail over before their first chunk; after that the error reaches the caller.
+    Streamed chunks are Completions whose model names the provider that served them.
+    """
+
+    def __init__(self, providers: List[LLMProvider], timeout: float = 0, cooldown_seconds: float = 60):
+        self.providers = providers
+        self.timeout = timeout
+        self.cooldown_seconds = cooldown_seconds
+        self.name = ">".join(provider.name for provider in providers)
+        self._cooldown_until = {}
+        self._stats = {provider.name: {"calls": 0, "failures": 0, "timeouts": 0} for provider in providers}
+        self._lock = threading.Lock()
+        # Attempts run here when a timeout is set, so a slow provider can be abandoned
+        self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="ai-failover") if timeout else None
+
+    def _candidates(self) -> List[LLMProvider]:
+        now = time.time()
+        with self._lock:
+            ready = [p for p in self.providers if self._cooldown_until.get(p.name, 0) <= now]
+        # If everything is cooling down, still try them all rather than failing outright
+        return ready or list(self.providers)
+
+    def _record(self, provider: LLMProvider, field: str):
+        with self._lock:
+            self._stats[provider.name][field] += 1
+
+    def _failed(self, provider: LLMProvider, error: Exception):
+        self._record(provider, "failures")
+        print(f"[AI] {provider.name} failed: {type(error).__name__}: {str(error)[:100]}")
+        if classify_error(error) == QUOTA:
+            with self._lock:
+                self._cooldown_until[provider.name] = time.time() + self.cooldown_seconds
+
+    def generate(self, prompt, system=None, history=None, config=None, session_key=None):
+        last_error = None
+        for provider in self._candidates():
+            self._record(provider, "calls")
+            try:
+                if self._executor is None:
+                    return provider.generate(prompt, system, history, config, session_key)
+                future = self._executor.submit(provider.generate, prompt, system, history, config, session_key)
+                return future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                self._record(provider, "timeouts")
+                last_error = TimeoutError(f"{provider.name} did not answer within {self.timeout}s")
+            except Exception as e:
+                self._failed(provider, e)
+                last_error = e
+        raise last_error or ProviderError("No AI provider configured")
+
+    def stream(self, prompt, system=None, history=None, config=None, session_key=None):
+        last_error = None
+        for provider in self._candidates():
+            self._record(provider, "calls")
+            chunks = provider.stream(prompt, system, history, config, session_key)
+            started = False
+            try:
+                for chunk in chunks:
+                    started = True
+                    yield Completion(chunk, model=provider.name)
+                return
+            except Exception as e:
+                self._failed(provider, e)
+                if started:
+                    raise
+                last_error = e
+            finally:
+                chunks.close()
+        raise last_error or ProviderError("No AI provider configured")
+
+    def forget_session(self, session_key):
+        for provider in self.providers:
+            provider.forget_session(session_key)
+
+    def stats(self):
+        with self._lock:
+            cooling = {name: round(until - time.time(), 1)
+                       for name, until in self._cooldown_until.items() if until > time.time()}
+            return {
+                "name": self.name,
+                "providers": [provider.stats() for provider in self.providers],
+                "attempts": {name: dict(counts) for name, counts in self._stats.items()},
+                "cooling_down": cooling
+            }
+
+
+def _key_pool(settings, keys: List[str], factory, rpm: int, tpm: int) -> Optional[LLMProvider]:
+    """One provider per API key, behind a KeyPool when there are several keys or rate limits"""
+    members = [factory(key) for key in keys]
+    if not members:
+        return None
+    if len(members) == 1 and not rpm and not tpm:
+        return members[0]
+    name = members[0].name
+    if len(members) > 1:
+        for index, member in enumerate(members, 1):
+            member.name = f"{name}#{index}"
+    return KeyPool(
+        [(member, KeyQuota(rpm, tpm)) for member in members],
+        name=name,
+        queue_timeout=settings.ai_quota_queue_timeout_seconds,
+        expected_output_tokens=settings.ai_quota_expected_output_tokens
+    )
+
+
+def _tier_model(settings, provider: str, tier: str) -> str:
+    """Model of a provider for a tier; tiers without their own model use the standard one"""
+    standard = getattr(settings, f"{provider}_model")
+    if tier == "standard":
+        return standard
+    return getattr(settings, f"{provider}_{tier}_model", "") or standard
+
+
+def has_tier(settings, tier: str) -> bool:
+    """True if any configured provider has a dedicated model for the tier"""
+    names = [n.strip().lower() for n in settings.ai_providers.split(",") if n.strip()]
+    return any(getattr(settings, f"{name}_{tier}_model", "") for name in names if name != "fake")
+
+
+def build_provider(settings, tier: str = "standard", shared: Dict = None) -> Optional[LLMProvider]:
+    """Build the provider chain from settings.ai_providers, skipping providers without a key.
+
+    tier picks each provider's model for that tier (see _tier_model). Chains built with the
+    same `shared` dict reuse the key pools of models they have in common, so a model that
+    serves two tiers keeps one set of rate limit buckets.
+    """
+    timeout = settings.ai_provider_timeout_seconds
+    shared = shared if shared is not None else {}
+    providers = []
+    for name in [n.strip().lower() for n in settings.ai_providers.split(",") if n.strip()]:
+        provider = None
+        if name == "fake":
+            provider = shared.get("fake") or FakeProvider(latency_ms=settings.fake_provider_latency_ms)
+            shared["fake"] = provider
+        elif name in ("gemini", "openai", "anthropic"):
+            model = _tier_model(settings, name, tier)
+            if (name, model) not in shared:
+                keys = split_keys(getattr(settings, f"{name}_api_key"))
+                if name == "gemini":
+                    factory = lambda key: GeminiProvider(key, model, dedicated_client=len(keys) > 1)
+                elif name == "openai":
+                    factory = lambda key: OpenAIProvider(key, model, timeout)
+                else:
+                    factory = lambda key: AnthropicProvider(key, model, timeout)
+                shared[(name, model)] = _key_pool(settings, keys, factory,
+                                                  getattr(settings, f"{name}_rpm_limit"), getattr(settings, f"{name}_tpm_limit"))
+            provider = shared[(name, model)]
+        if provider is not None:
+            providers.append(provider)
+
+    if not providers:
+        return None
+    return FailoverProvider(providers, timeout=settings.ai_provider_timeout_seconds)
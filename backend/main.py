@@ -2,6 +2,9 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from database import engine, Base
 from config import settings
+from ai_service import get_ai_service, shutdown_ai_service
+from history_writer import history_writer
+from history_purger import history_purger
 from middleware import (
     SecurityHeadersMiddleware,
     RequestValidationMiddleware,
@@ -12,6 +15,7 @@ from middleware import (
 )
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
+import threading
 
 # Import routes
 from routes import auth_routes, chat_routes, exam_routes, coding_routes, career_routes, payment_routes, admin_routes
@@ -61,6 +65,43 @@ app.include_router(career_routes.router)
 app.include_router(payment_routes.router)
 app.include_router(admin_routes.router, prefix="/api/admin", tags=["admin"])
 
+def start_ai_service():
+    """Build the AI service and start its off-peak cache pre-warm scheduler"""
+    service = get_ai_service()
+    if settings.ai_prewarm_enabled:
+        service.warmer.start(settings.ai_prewarm_interval_minutes * 60)
+
+@app.on_event("startup")
+async def warm_up_ai_service():
+    """Build the AI service (provider SDKs, caches) in the background once the worker is serving"""
+    if settings.ai_warm_start or settings.ai_prewarm_enabled:
+        threading.Thread(target=start_ai_service, name="ai-warmup", daemon=True).start()
+
+@app.on_event("startup")
+async def start_history_writer():
+    """Start the background writer that persists chat messages in batches"""
+    history_writer.start()
+
+@app.on_event("startup")
+async def start_history_purger():
+    """Resume deleting chat history that users cleared before the last restart"""
+    history_purger.start()
+
+@app.on_event("shutdown")
+async def stop_ai_service():
+    """Release AI worker threads when the server stops"""
+    shutdown_ai_service()
+
+@app.on_event("shutdown")
+async def flush_history_writer():
+    """Write chat messages still queued before the process exits"""
+    history_writer.stop()
+
+@app.on_event("shutdown")
+async def stop_history_purger():
+    """Stop purging after the current batch (unfinished purges resume on the next start)"""
+    history_purger.stop()
+
 @app.get("/")
 @rate_limit("10/minute")  # Rate limit: 10 requests per minute
 async def root(request: Request):
@@ -0,0 +1,213 @@
+"""
+AI call metrics - latency histograms, token counts, cost and outcomes per AIService endpoint
+"""
+
+from typing import Dict, Optional, Tuple
+from datetime import datetime
+import json
+import threading
+from conversation import estimate_tokens
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 16, 32)
+
+# USD per million (input, output) tokens, matched by model name prefix (longest prefix wins)
+MODEL_PRICES = {
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-pro": (0.50, 1.50),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "claude-3-haiku": (0.25, 1.25),
+    "claude-3-5-haiku": (0.80, 4.00),
+    "claude-3-5-sonnet": (3.00, 15.00),
+    "claude-3-opus": (15.00, 75.00),
+}
+
+
+def model_price(model: Optional[str]) -> Optional[Tuple[float, float]]:
+    """Price of a model ("provider:model" or plain model name), or None if unknown"""
+    name = (model or "").split(":")[-1]
+    matches = [prefix for prefix in MODEL_PRICES if name.startswith(prefix)]
+    return MODEL_PRICES[max(matches, key=len)] if matches else None
+
+
+class Histogram:
+    """Fixed-bucket histogram; percentiles are reported as the upper bound of their bucket"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.total += 1
+        self.sum += value
+
+    def percentile(self, percent: float) -> Optional[float]:
+        if not self.total:
+            return None
+        rank = percent / 100 * self.total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return None
+
+    def snapshot(self) -> Dict:
+        labels = [f"le_{bound}" for bound in self.buckets] + ["inf"]
+        return {
+            "count": self.total,
+            "mean": round(self.sum / self.total, 3) if self.total else None,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "buckets": dict(zip(labels, self.counts))
+        }
+
+
+class _EndpointMetrics:
+    def __init__(self):
+        self.latency = Histogram()
+        self.calls = 0
+        self.streamed = 0
+        self.errors = {}
+        self.finish_reasons = {}
+        self.cache = {"hit": 0, "miss": 0, "stale": 0}
+        self.prompt_chars = 0
+        self.response_chars = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.estimated_calls = 0
+        self.cost_usd = 0.0
+        self.unpriced_calls = 0
+
+
+class AICallMetrics:
+    """Aggregates one record per upstream call (and per cache lookup) by endpoint.
+
+    Token counts come from the provider when it reports usage (see Completion) and are
+    estimated from the text otherwise. When log_path is set every record is also
+    appended to it as one JSON line, for offline analysis.
+    """
+
+    def __init__(self, log_path: str = ""):
+        self.log_path = log_path
+        self._endpoints = {}
+        self._tiers = {}  # same aggregates per model tier, to compare routing decisions
+        self._lock = threading.Lock()
+
+    def _endpoint(self, endpoint: Optional[str]) -> _EndpointMetrics:
+        return self._endpoints.setdefault(endpoint or "default", _EndpointMetrics())
+
+    def record_cache(self, endpoint: Optional[str], result: str):
+        """Count a cache lookup: 'hit', 'miss' or 'stale' (expired answer served on failure)"""
+        with self._lock:
+            self._endpoint(endpoint).cache[result] += 1
+        self._write({"event": "cache", "endpoint": endpoint, "result": result})
+
+    def record_call(self, endpoint: Optional[str], latency: float, prompt: str, response: Optional[str] = None,
+                    error_class: Optional[str] = None, model: Optional[str] = None, streamed: bool = False,
+                    tier: Optional[str] = None):
+        """Record one upstream call; response is None when the call failed"""
+        input_tokens = getattr(response, "input_tokens", None)
+        output_tokens = getattr(response, "output_tokens", None)
+        estimated = input_tokens is None or output_tokens is None
+        if input_tokens is None:
+            input_tokens = estimate_tokens(prompt)
+        if output_tokens is None:
+            output_tokens = estimate_tokens(response or "")
+        finish_reason = getattr(response, "finish_reason", None)
+        model = getattr(response, "model", None) or model
+        price = model_price(model)
+        cost = (input_tokens * price[0] + output_tokens * price[1]) / 1_000_000 if price else 0.0
+
+        with self._lock:
+            targets = [self._endpoint(endpoint)]
+            if tier:
+                targets.append(self._tiers.setdefault(tier, _EndpointMetrics()))
+            for metrics in targets:
+                self._add(metrics, latency, prompt, response, input_tokens, output_tokens, estimated,
+                          cost, price is None, error_class, finish_reason, streamed)
+
+        self._write({
+            "event": "call",
+            "endpoint": endpoint,
+            "tier": tier,
+            "model": model,
+            "latency_seconds": round(latency, 3),
+            "prompt_chars": len(prompt),
+            "response_chars": len(response or ""),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "tokens_estimated": estimated,
+            "finish_reason": finish_reason,
+            "error_class": error_class,
+            "streamed": streamed,
+            "cost_usd": round(cost, 6)
+        })
+
+    @staticmethod
+    def _add(metrics: _EndpointMetrics, latency, prompt, response, input_tokens, output_tokens, estimated,
+             cost, unpriced, error_class, finish_reason, streamed):
+        metrics.calls += 1
+        metrics.streamed += streamed
+        metrics.latency.observe(latency)
+        metrics.prompt_chars += len(prompt)
+        metrics.response_chars += len(response or "")
+        metrics.input_tokens += input_tokens
+        metrics.output_tokens += output_tokens
+        metrics.estimated_calls += estimated
+        metrics.cost_usd += cost
+        metrics.unpriced_calls += unpriced
+        if error_class:
+            metrics.errors[error_class] = metrics.errors.get(error_class, 0) + 1
+        if finish_reason:
+            metrics.finish_reasons[finish_reason] = metrics.finish_reasons.get(finish_reason, 0) + 1
+
+    def _write(self, record: Dict):
+        if not self.log_path:
+            return
+        line = json.dumps(dict(record, timestamp=datetime.utcnow().isoformat()))
+        with self._lock:
+            try:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except OSError as e:
+                print(f"[AI] Could not write metrics log: {e}")
+
+    @staticmethod
+    def _summary(m: _EndpointMetrics) -> Dict:
+        return {
+            "calls": m.calls,
+            "streamed": m.streamed,
+            "latency_seconds": m.latency.snapshot(),
+            "errors": dict(m.errors),
+            "finish_reasons": dict(m.finish_reasons),
+            "cache": dict(m.cache),
+            "prompt_chars": m.prompt_chars,
+            "response_chars": m.response_chars,
+            "input_tokens": m.input_tokens,
+            "output_tokens": m.output_tokens,
+            "estimated_token_calls": m.estimated_calls,
+            "cost_usd": round(m.cost_usd, 6),
+            "unpriced_calls": m.unpriced_calls
+        }
+
+    def snapshot(self) -> Dict:
+        """Per-endpoint and per-tier aggregates plus totals, for the metrics endpoint"""
+        with self._lock:
+            endpoints = {name: self._summary(m) for name, m in self._endpoints.items()}
+            tiers = {name: self._summary(m) for name, m in self._tiers.items()}
+        totals = {
+            field: sum(m[field] for m in endpoints.values())
+            for field in ("calls", "input_tokens", "output_tokens", "cost_usd")
+        }
+        totals["cost_usd"] = round(totals["cost_usd"], 6)
+        return {"endpoints": endpoints, "tiers": tiers, "totals": totals}
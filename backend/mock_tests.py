@@ -0,0 +1,200 @@
+"""
+Mock test helpers - prompt building, parsing and de-duplication of generated MCQs
+"""
+
+from typing import Dict, List, Optional
+import json
+import re
+
+# Each shard of a large test is steered towards a different angle so shards overlap less
+SHARD_FOCUS = [
+    "core concepts and definitions",
+    "numerical and calculation based problems",
+    "application and scenario based questions",
+    "tricky edge cases and common misconceptions",
+    "comparison and reasoning questions",
+    "previous-year placement exam style questions",
+]
+
+# Questions whose word sets overlap at least this much are treated as duplicates
+SIMILARITY_THRESHOLD = 0.8
+
+
+def build_prompt(subject: str, topic: str, difficulty: str, num_questions: int,
+                 shard: int = 0, shards: int = 1) -> str:
+    """Prompt for one batch of questions; shards of a larger test get their own focus"""
+    focus = ""
+    if shards > 1:
+        focus = f"""
+This is set {shard + 1} of {shards} for the same test. Concentrate on {SHARD_FOCUS[shard % len(SHARD_FOCUS)]}
+so the sets do not repeat each other.
+"""
+    return f"""Generate EXACTLY {num_questions} multiple choice questions for campus placement aptitude test.
+
+Subject: {subject}
+Topic: {topic}
+Difficulty: {difficulty}
+{focus}
+IMPORTANT: Generate ALL {num_questions} questions. Do not generate less.
+
+For each question provide:
+1. Clear question text
+2. Four options (A, B, C, D)
+3. Correct answer index (0-3)
+4. Detailed explanation
+
+Focus on aptitude questions commonly asked in placement exams.
+
+Return in JSON format with ALL {num_questions} questions:
+{{
+  "questions": [
+    {{
+      "id": 1,
+      "question": "...",
+      "options": ["Option A", "Option B", "Option C", "Option D"],
+      "correctAnswer": 0,
+      "explanation": "..."
+    }},
+    ... (continue for all {num_questions} questions)
+  ]
+}}
+
+CRITICAL: The questions array MUST contain exactly {num_questions} questions."""
+
+
+def extract_json(response: str) -> str:
+    """Strip markdown code fences around a JSON answer"""
+    if "```json" in response:
+        return response.split("```json")[1].split("```")[0].strip()
+    if "```" in response:
+        return response.split("```")[1].split("```")[0].strip()
+    return response
+
+
+def clean_question(item) -> Optional[Dict]:
+    """Validate one generated question; None if it is unusable"""
+    if not isinstance(item, dict):
+        return None
+    question = item.get("question")
+    options = item.get("options")
+    answer = item.get("correctAnswer")
+    if not isinstance(question, str) or not question.strip():
+        return None
+    if not isinstance(options, list) or len(options) != 4:
+        return None
+    if isinstance(answer, str) and answer.strip().isdigit():
+        answer = int(answer)
+    if not isinstance(answer, int) or not 0 <= answer <= 3:
+        return None
+    return {
+        "question": question.strip(),
+        "options": [str(option) for option in options],
+        "correctAnswer": answer,
+        "explanation": str(item.get("explanation", "")),
+    }
+
+
+def parse_questions(response: str) -> List[Dict]:
+    """Valid questions from a model response (invalid ones are dropped, not repaired)"""
+    data = json.loads(extract_json(response))
+    items = data.get("questions", []) if isinstance(data, dict) else data
+    return [question for question in map(clean_question, items or []) if question is not None]
+
+
+class QuestionStreamParser:
+    """Incremental parser that pulls complete question objects out of a streamed JSON answer.
+
+    feed() takes raw text chunks as they arrive and returns the questions completed by
+    that chunk. It tracks string/escape state and bracket nesting instead of parsing the
+    whole document, so markdown fences, a preamble or a truncated tail are simply
+    ignored: every object that closed inside an array is emitted, anything after the
+    cut-off is dropped.
+    """
+
+    def __init__(self):
+        self._stack = []        # open brackets outside strings
+        self._in_string = False
+        self._escape = False
+        self._item = None       # text of the array element object being read, if any
+        self._item_depth = 0
+
+    def feed(self, text: str) -> List[Dict]:
+        questions = []
+        for char in text:
+            if self._item is not None:
+                self._item.append(char)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if char == "{" and self._item is None and self._stack and self._stack[-1] == "[":
+                    self._item = [char]
+                    self._item_depth = len(self._stack)
+                self._stack.append(char)
+            elif char in "}]" and self._stack:
+                self._stack.pop()
+                if self._item is not None and char == "}" and len(self._stack) == self._item_depth:
+                    question = self._finish("".join(self._item))
+                    self._item = None
+                    if question is not None:
+                        questions.append(question)
+        return questions
+
+    @staticmethod
+    def _finish(text: str) -> Optional[Dict]:
+        try:
+            return clean_question(json.loads(text))
+        except ValueError:
+            return None
+
+
+def question_words(text: str) -> frozenset:
+    """Normalized word set of a question, used for near-duplicate detection"""
+    return frozenset(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def is_similar(a: frozenset, b: frozenset, threshold: float = SIMILARITY_THRESHOLD) -> bool:
+    if not a or not b:
+        return a == b
+    return len(a & b) / len(a | b) >= threshold
+
+
+def dedupe_questions(questions: List[Dict], seen: List[frozenset] = None) -> List[Dict]:
+    """Drop questions that (nearly) repeat an earlier one, keeping first occurrences"""
+    seen = seen if seen is not None else []
+    unique = []
+    for question in questions:
+        words = question_words(question["question"])
+        if any(is_similar(words, other) for other in seen):
+            continue
+        seen.append(words)
+        unique.append(question)
+    return unique
+
+
+def number_questions(questions: List[Dict]) -> List[Dict]:
+    """Assign sequential ids 1..n"""
+    return [dict(question, id=index) for index, question in enumerate(questions, 1)]
+
+
+def demo_questions(topic: str, num_questions: int) -> List[Dict]:
+    """Placeholder questions for demo mode (no AI provider configured)"""
+    return [
+        {
+            "id": i + 1,
+            "question": f"Sample question {i+1} on {topic}",
+            "options": ["Option A", "Option B", "Option C", "Option D"],
+            "correctAnswer": 0,
+            "explanation": "This is a sample question."
+        }
+        for i in range(num_questions)
+    ]
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Enum, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Enum, Boolean, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -19,6 +19,7 @@ class User(Base):
     plan = Column(Enum(PlanType), default=PlanType.FREE)
     is_google_user = Column(Boolean, default=False)
     is_admin = Column(Boolean, default=False)
+    history_cleared_before = Column(DateTime, nullable=True)  # chat messages older than this are cleared (purged in the background)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -35,9 +36,15 @@ class ChatHistory(Base):
     role = Column(String)  # 'user' or 'assistant'
     content = Column(Text)
     language = Column(String, default="english")  # 'english', 'hindi', 'gujarati'
+    conversation_id = Column(String, index=True, nullable=True)  # set for server-held conversations
     timestamp = Column(DateTime, default=datetime.utcnow)
     
     user = relationship("User", back_populates="chat_history")
+    
+    __table_args__ = (
+        # History pages are read per user in (timestamp, id) order, starting from a cursor
+        Index("ix_chat_history_user_timestamp_id", "user_id", "timestamp", "id"),
+    )
 
 class UserProgress(Base):
     __tablename__ = "user_progress"
@@ -64,3 +71,22 @@ class Payment(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     
     user = relationship("User", back_populates="payments")
+
+class QuestionBankItem(Base):
+    __tablename__ = "question_bank"
+    __table_args__ = (
+        # Mock tests are served by reading one (subject, topic, difficulty) pool
+        Index("ix_question_bank_pool", "subject", "topic", "difficulty"),
+        UniqueConstraint("subject", "topic", "difficulty", "question_hash", name="uq_question_bank_question"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    subject = Column(String, nullable=False)  # stored normalized (lowercase, trimmed)
+    topic = Column(String, nullable=False)
+    difficulty = Column(String, nullable=False)
+    question = Column(Text, nullable=False)
+    options = Column(Text, nullable=False)  # JSON list of 4 options
+    correct_answer = Column(Integer, nullable=False)
+    explanation = Column(Text, default="")
+    question_hash = Column(String(40), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,174 @@
+"""
+Cache pre-warming - fill the AI response cache for popular inputs during off-peak hours
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple
+from datetime import datetime
+import json
+import os
+import threading
+from resilience import QUOTA, REJECTED, classify_error
+
+
+class PopularityTracker:
+    """Request counts per (endpoint, prompt) for cacheable endpoints.
+
+    Bounded to max_entries: when full, the least requested half is dropped. decay()
+    halves every count so the ranking follows recent traffic rather than all-time totals.
+    """
+
+    def __init__(self, max_entries: int = 2000):
+        self.max_entries = max_entries
+        self._counts = {}  # (endpoint, prompt) -> count
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, prompt: str):
+        with self._lock:
+            key = (endpoint, prompt)
+            self._counts[key] = self._counts.get(key, 0) + 1
+            if len(self._counts) > self.max_entries:
+                ranked = sorted(self._counts.items(), key=lambda item: item[1], reverse=True)
+                self._counts = dict(ranked[:self.max_entries // 2])
+
+    def top(self, endpoint: str, n: int, min_count: int = 2) -> List[str]:
+        """The n most requested prompts of an endpoint (requested at least min_count times)"""
+        with self._lock:
+            ranked = sorted(
+                ((count, prompt) for (name, prompt), count in self._counts.items()
+                 if name == endpoint and count >= min_count),
+                key=lambda item: item[0],
+                reverse=True
+            )
+        return [prompt for _, prompt in ranked[:n]]
+
+    def endpoints(self) -> List[str]:
+        with self._lock:
+            return sorted({endpoint for endpoint, _ in self._counts})
+
+    def decay(self):
+        with self._lock:
+            self._counts = {key: count // 2 for key, count in self._counts.items() if count > 1}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"tracked_prompts": len(self._counts)}
+
+
+def load_configured_inputs(path: str) -> Dict[str, List[List]]:
+    """Read {method name: [[arg, ...], ...]} from a JSON file; missing file means no configured inputs"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def parse_hours(value: str) -> Tuple[int, int]:
+    """'1-6' -> (1, 6): the job runs from 01:00 until 06:59 local time"""
+    start, _, end = value.partition("-")
+    return int(start), int(end or start)
+
+
+class CacheWarmer:
+    """Pre-generates cached answers for configured inputs and the most requested prompts.
+
+    A run goes through each cacheable endpoint: configured inputs first, then the top_n
+    prompts seen since the last run. Entries that are still fresh for refresh_within
+    seconds are skipped. Calls run one at a time with a pause in between, at most
+    max_calls per run. The run stops early as soon as the upstream reports quota
+    exhaustion or the service starts shedding load, so it never competes with users.
+    """
+
+    def __init__(self, service, configured: Dict[str, List[List]], top_n: int = 20,
+                 max_calls: int = 100, pause: float = 1.0, refresh_within: float = 12 * 3600,
+                 hours: str = "1-6"):
+        self.service = service
+        self.configured = configured
+        self.top_n = top_n
+        self.max_calls = max_calls
+        self.pause = pause
+        self.refresh_within = refresh_within
+        self.hours = parse_hours(hours)
+        self._running = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._last_run = None
+
+    def plan(self) -> List[Tuple[str, Callable]]:
+        """(label, call) pairs in the order they will be warmed"""
+        items, seen = [], set()
+        for method, inputs in self.configured.items():
+            for args in inputs:
+                items.append((f"{method}{tuple(args)}", lambda method=method, args=args: getattr(self.service, method)(*args)))
+        for endpoint in self.service.CACHE_TTLS:
+            for prompt in self.service.popularity.top(endpoint, self.top_n):
+                if (endpoint, prompt) not in seen:
+                    seen.add((endpoint, prompt))
+                    items.append((f"{endpoint}:{' '.join(prompt.split())[:60]}",
+                                  lambda endpoint=endpoint, prompt=prompt: self.service._generate(prompt, endpoint)))
+        return items
+
+    def run(self) -> Dict:
+        """Warm the cache once; returns a summary (also kept for stats)"""
+        if not self.service.use_ai or not self._running.acquire(blocking=False):
+            return {"skipped": True}
+        summary = {"started_at": datetime.utcnow().isoformat(), "warmed": 0, "fresh": 0, "failed": 0, "stopped": None}
+        try:
+            for label, call in self.plan():
+                if summary["warmed"] >= self.max_calls:
+                    summary["stopped"] = "call budget used"
+                    break
+                if self._stop.is_set():
+                    summary["stopped"] = "shutdown"
+                    break
+                state = self.service.warm(call, self.refresh_within)
+                error = state["error"]
+                if error is not None:
+                    summary["failed"] += 1
+                    if classify_error(error) in (QUOTA, REJECTED):
+                        summary["stopped"] = f"upstream busy ({classify_error(error)})"
+                        break
+                elif state["upstream_calls"]:
+                    summary["warmed"] += 1
+                else:
+                    summary["fresh"] += 1
+                if state["upstream_calls"]:
+                    self._stop.wait(self.pause)
+            self.service.popularity.decay()
+        finally:
+            summary["finished_at"] = datetime.utcnow().isoformat()
+            self._last_run = summary
+            self._running.release()
+        print(f"[AI] Cache pre-warm: {summary}")
+        return summary
+
+    def in_window(self, now: Optional[datetime] = None) -> bool:
+        hour = (now or datetime.now()).hour
+        start, end = self.hours
+        return start <= hour <= end if start <= end else hour >= start or hour <= end
+
+    def start(self, interval: float = 3600):
+        """Check every interval seconds and run when inside the off-peak window"""
+        if self._thread is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                if self.in_window():
+                    try:
+                        self.run()
+                    except Exception as e:
+                        print(f"[AI] Cache pre-warm failed: {e}")
+
+        self._thread = threading.Thread(target=loop, name="ai-prewarm", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> Dict:
+        return {
+            "configured_inputs": sum(len(inputs) for inputs in self.configured.values()),
+            "window_hours": "%d-%d" % self.hours,
+            "running": self._running.locked(),
+            "last_run": self._last_run
+        }
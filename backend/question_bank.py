@@ -0,0 +1,167 @@
+"""
+Question bank - generated mock test questions persisted per (subject, topic, difficulty) pool
+"""
+
+from typing import Callable, Dict, List, Tuple
+import hashlib
+import json
+import random
+import threading
+from models import QuestionBankItem
+from mock_tests import dedupe_questions, number_questions, question_words
+
+PoolKey = Tuple[str, str, str]
+
+
+def pool_key(subject: str, topic: str, difficulty: str) -> PoolKey:
+    return tuple(" ".join(value.lower().split()) for value in (subject, topic, difficulty))
+
+
+def question_hash(question: str) -> str:
+    return hashlib.sha1(" ".join(sorted(question_words(question))).encode("utf-8")).hexdigest()
+
+
+class QuestionBank:
+    """Serves mock tests by sampling stored questions and refills small pools in the background.
+
+    generate(subject, topic, difficulty, count) must return (questions, error) like
+    AIService._generate_questions; refills run it on `executor`, one refill per pool at a time.
+    A pool only serves tests of up to 1/serve_multiple of its size, so repeat takers of the
+    same test do not keep drawing the same few questions.
+    """
+
+    def __init__(self, session_factory, executor, generate: Callable,
+                 min_pool: int = 45, refill_size: int = 30, serve_multiple: float = 3.0):
+        self.session_factory = session_factory
+        self.executor = executor
+        self.generate = generate
+        self.min_pool = min_pool
+        self.refill_size = refill_size
+        self.serve_multiple = serve_multiple
+        self._refilling = set()
+        self._lock = threading.Lock()
+        self._stats = {"served": 0, "misses": 0, "refills": 0, "stored": 0, "errors": 0}
+
+    def _count(self, field: str, amount: int = 1):
+        with self._lock:
+            self._stats[field] += amount
+
+    def _load(self, key: PoolKey, num_questions: int) -> Tuple[int, List[QuestionBankItem]]:
+        """(pool size, num_questions random rows); only ids are read for the whole pool"""
+        db = self.session_factory()
+        try:
+            subject, topic, difficulty = key
+            ids = [row.id for row in db.query(QuestionBankItem.id).filter(
+                QuestionBankItem.subject == subject,
+                QuestionBankItem.topic == topic,
+                QuestionBankItem.difficulty == difficulty
+            ).all()]
+            if len(ids) < num_questions * self.serve_multiple:
+                return len(ids), []
+            chosen = random.sample(ids, num_questions)
+            rows = {row.id: row for row in db.query(QuestionBankItem).filter(QuestionBankItem.id.in_(chosen)).all()}
+            return len(ids), [rows[question_id] for question_id in chosen if question_id in rows]
+        finally:
+            db.close()
+
+    def sample(self, subject: str, topic: str, difficulty: str, num_questions: int) -> List[Dict]:
+        """num_questions random questions from the pool, or [] if the pool is too small.
+
+        The pool must hold at least serve_multiple * num_questions questions to serve.
+        A pool that can serve the test but is below min_pool gets a background refill. On a
+        miss the caller generates the test itself and add()s it, which grows the pool, so no
+        refill is started then (that would pay for the same questions twice).
+        """
+        key = pool_key(subject, topic, difficulty)
+        try:
+            size, rows = self._load(key, num_questions)
+        except Exception as e:
+            print(f"Question bank read failed: {e}")
+            self._count("errors")
+            return []
+
+        if len(rows) < num_questions:
+            self._count("misses")
+            return []
+        if size < self.min_pool:
+            self.refill(subject, topic, difficulty)
+
+        self._count("served")
+        return number_questions([
+            {
+                "question": row.question,
+                "options": json.loads(row.options),
+                "correctAnswer": row.correct_answer,
+                "explanation": row.explanation or ""
+            }
+            for row in rows
+        ])
+
+    def add(self, subject: str, topic: str, difficulty: str, questions: List[Dict]) -> int:
+        """Store questions that are not (near-)duplicates of the pool; returns how many were stored"""
+        key = pool_key(subject, topic, difficulty)
+        db = self.session_factory()
+        try:
+            rows = db.query(QuestionBankItem.question).filter(
+                QuestionBankItem.subject == key[0],
+                QuestionBankItem.topic == key[1],
+                QuestionBankItem.difficulty == key[2]
+            ).all()
+            seen = [question_words(row.question) for row in rows]
+            fresh = dedupe_questions(questions, seen)
+            db.add_all([
+                QuestionBankItem(
+                    subject=key[0],
+                    topic=key[1],
+                    difficulty=key[2],
+                    question=question["question"],
+                    options=json.dumps(question["options"]),
+                    correct_answer=question["correctAnswer"],
+                    explanation=question.get("explanation", ""),
+                    question_hash=question_hash(question["question"])
+                )
+                for question in fresh
+            ])
+            db.commit()
+            self._count("stored", len(fresh))
+            return len(fresh)
+        except Exception as e:
+            # A concurrent writer may have stored the same question; the pool is still usable
+            db.rollback()
+            print(f"Question bank write failed: {e}")
+            self._count("errors")
+            return 0
+        finally:
+            db.close()
+
+    def refill(self, subject: str, topic: str, difficulty: str):
+        """Generate refill_size questions for the pool in the background (no-op if already running)"""
+        key = pool_key(subject, topic, difficulty)
+        with self._lock:
+            if key in self._refilling:
+                return
+            self._refilling.add(key)
+            self._stats["refills"] += 1
+
+        def run():
+            try:
+                questions, _ = self.generate(subject, topic, difficulty, self.refill_size)
+                self.add(subject, topic, difficulty, questions)
+            except Exception as e:
+                print(f"Question bank refill failed: {e}")
+                self._count("errors")
+            finally:
+                with self._lock:
+                    self._refilling.discard(key)
+
+        try:
+            self.executor.submit(run)
+        except RuntimeError:
+            # Executor already shut down
+            with self._lock:
+                self._refilling.discard(key)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats, refilling=len(self._refilling), min_pool=self.min_pool,
+                        serve_multiple=self.serve_multiple)
@@ -0,0 +1,110 @@
+"""
+Client-side quota scheduling - token buckets for upstream RPM / TPM limits per API key
+"""
+
+from typing import Dict
+import threading
+import time
+from resilience import ServiceUnavailable
+
+
+class QuotaExhausted(ServiceUnavailable):
+    """Raised when no API key has quota left within the queueing timeout"""
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at capacity per `period` seconds.
+
+    take() may drive the level below zero (used when a request turned out larger than
+    estimated); the debt is paid back by the refill before anything else is admitted.
+    """
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self._level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 = now)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self._level >= amount else (amount - self._level) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self._level -= amount
+
+    def empty(self):
+        self._refill()
+        self._level = min(self._level, 0.0)
+
+    @property
+    def level(self) -> float:
+        self._refill()
+        return self._level
+
+
+class KeyQuota:
+    """Requests-per-minute and tokens-per-minute budget of one API key (0 = unlimited)"""
+
+    def __init__(self, rpm: int = 0, tpm: int = 0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = TokenBucket(rpm) if rpm else None
+        self._tokens = TokenBucket(tpm) if tpm else None
+        self._lock = threading.Lock()
+        self._stats = {"admitted": 0, "throttled": 0, "upstream_429s": 0}
+
+    def reserve(self, tokens: int) -> float:
+        """Charge one request of ~tokens if both buckets allow it and return 0, else return the wait in seconds"""
+        with self._lock:
+            wait = max(
+                self._requests.wait_time(1) if self._requests else 0.0,
+                self._tokens.wait_time(tokens) if self._tokens else 0.0
+            )
+            if wait > 0:
+                self._stats["throttled"] += 1
+                return wait
+            if self._requests:
+                self._requests.take(1)
+            if self._tokens:
+                self._tokens.take(tokens)
+            self._stats["admitted"] += 1
+            return 0.0
+
+    def settle(self, estimated: int, actual: int):
+        """Correct the token charge once the real request size is known"""
+        if self._tokens and actual != estimated:
+            with self._lock:
+                self._tokens.take(actual - estimated)
+
+    def exhaust(self):
+        """The upstream said 429 anyway: stop sending on this key until the buckets refill"""
+        with self._lock:
+            self._stats["upstream_429s"] += 1
+            if self._requests:
+                self._requests.empty()
+            if self._tokens:
+                self._tokens.empty()
+
+    def headroom(self) -> float:
+        """Fraction of the tighter bucket still available (1.0 when unlimited)"""
+        with self._lock:
+            fractions = [bucket.level / bucket.capacity for bucket in (self._requests, self._tokens) if bucket]
+        return min(fractions) if fractions else 1.0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(
+                self._stats,
+                rpm=self.rpm,
+                tpm=self.tpm,
+                requests_left=round(self._requests.level, 1) if self._requests else None,
+                tokens_left=round(self._tokens.level) if self._tokens else None
+            )
@@ -0,0 +1,323 @@
+"""
+Resilience primitives for upstream AI calls - error classification, retries, hedging,
+adaptive concurrency limiting and circuit breaking
+"""
+
+from typing import Callable, Dict, List, Optional
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+import random
+import threading
+import time
+
+# Error classes
+QUOTA = "quota"          # rate limited / out of quota - retrying now only burns requests
+TRANSIENT = "transient"  # timeouts, 5xx, dropped connections - worth retrying
+FATAL = "fatal"          # bad request, auth, blocked content - retrying cannot help
+REJECTED = "rejected"    # shed locally (circuit open, at capacity) - never reached upstream
+
+_QUOTA_NAMES = ("ResourceExhausted", "RateLimitError", "TooManyRequests")
+_TRANSIENT_NAMES = (
+    "Timeout", "TimeoutError", "DeadlineExceeded", "ServiceUnavailable", "InternalServerError",
+    "InternalError", "APIConnectionError", "APITimeoutError", "ConnectionError", "BadGateway",
+    "GatewayTimeout", "Aborted", "RemoteDisconnected", "OverloadedError", "ProtocolError"
+)
+
+
+class ServiceUnavailable(Exception):
+    """Raised when a call is rejected locally instead of being sent upstream"""
+
+
+def _status(error: Exception) -> Optional[int]:
+    """HTTP status carried by an SDK exception (status_code, code or response.status_code)"""
+    for status in (getattr(error, "status_code", None), getattr(error, "code", None),
+                   getattr(getattr(error, "response", None), "status_code", None)):
+        if isinstance(status, int) and not isinstance(status, bool):
+            return status
+    return None
+
+
+def classify_error(error: Exception) -> str:
+    """Map an exception from any provider SDK to QUOTA, TRANSIENT, FATAL or REJECTED.
+
+    Only the exception type and its structured status are used: message text is not
+    reliable (a prompt of "4290 tokens" or a request id containing "429" is not a quota error).
+    """
+    if isinstance(error, ServiceUnavailable):
+        return REJECTED
+    names = [cls.__name__ for cls in type(error).__mro__]
+    status = _status(error)
+
+    if any(name in _QUOTA_NAMES for name in names) or status == 429:
+        return QUOTA
+    if any(name in _TRANSIENT_NAMES for name in names) or (status is not None and status >= 500) \
+            or isinstance(error, (TimeoutError, ConnectionError)):
+        return TRANSIENT
+    return FATAL
+
+
+class RetryPolicy:
+    """Retries TRANSIENT errors with exponential backoff and full jitter.
+
+    QUOTA, FATAL and REJECTED errors are raised immediately: waiting a second does not
+    give us more quota, and the breaker/failover layers handle those cases.
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._stats = {"retries": 0, "gave_up": 0}
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before retry number `attempt` (1-based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def retryable(self, error: Exception, attempt: int) -> bool:
+        """True if `error` on attempt number `attempt` should be retried; records the decision"""
+        if classify_error(error) != TRANSIENT:
+            return False
+        with self._lock:
+            if attempt >= self.max_attempts:
+                self._stats["gave_up"] += 1
+                return False
+            self._stats["retries"] += 1
+        return True
+
+    def call(self, func: Callable):
+        attempt = 1
+        while True:
+            try:
+                return func()
+            except Exception as e:
+                if not self.retryable(e, attempt):
+                    raise
+                time.sleep(self.backoff(attempt))
+                attempt += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats, max_attempts=self.max_attempts)
+
+
+class LatencyTracker:
+    """Rolling window of recent call latencies per endpoint"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(endpoint or "default", deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, endpoint: str, percent: float, min_samples: int = 20) -> Optional[float]:
+        """Latency percentile for an endpoint, or None until enough samples were seen"""
+        with self._lock:
+            samples = sorted(self._samples.get(endpoint or "default", ()))
+        if len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, int(round(percent / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            endpoints = list(self._samples)
+        return {
+            endpoint: {
+                "samples": len(self._samples[endpoint]),
+                "p50": self.percentile(endpoint, 50, 1),
+                "p95": self.percentile(endpoint, 95, 1)
+            }
+            for endpoint in endpoints
+        }
+
+
+class Hedger:
+    """Fires a backup request when the first one is slower than the endpoint's recent p95.
+
+    Whichever attempt finishes first successfully wins; the loser runs to completion in
+    the background and its result is discarded. Endpoints without enough latency
+    history are not hedged.
+    """
+
+    def __init__(self, executor, latencies: LatencyTracker, endpoints: List[str],
+                 percent: float = 95, min_delay: float = 0.5):
+        self.executor = executor
+        self.latencies = latencies
+        self.endpoints = set(endpoints)
+        self.percent = percent
+        self.min_delay = min_delay
+        self._lock = threading.Lock()
+        self._stats = {"hedged": 0, "hedge_wins": 0}
+
+    def delay(self, endpoint: str) -> Optional[float]:
+        if endpoint not in self.endpoints:
+            return None
+        p = self.latencies.percentile(endpoint, self.percent)
+        return None if p is None else max(p, self.min_delay)
+
+    def call(self, func: Callable, endpoint: str):
+        delay = self.delay(endpoint)
+        if delay is None:
+            return func()
+
+        first = self.executor.submit(func)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        with self._lock:
+            self._stats["hedged"] += 1
+        backup = self.executor.submit(func)
+        pending, error = {first, backup}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        with self._lock:
+                            self._stats["hedge_wins"] += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats, endpoints=sorted(self.endpoints))
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limiter.
+
+    The limit grows by roughly one slot per limit-worth of successful calls (additive
+    increase) and shrinks by `backoff` on every failure or call slower than
+    `latency_threshold` (multiplicative decrease). Callers wait up to a short timeout
+    for a free slot and are rejected after that, so a degraded upstream sheds load
+    instead of piling up threads and sockets.
+    """
+
+    def __init__(self, initial_limit: int = 32, min_limit: int = 4, max_limit: int = 256,
+                 latency_threshold: float = 30.0, backoff: float = 0.8):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_threshold = latency_threshold
+        self.backoff = backoff
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._stats = {"accepted": 0, "rejected": 0, "increases": 0, "decreases": 0}
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def acquire(self, timeout: float = 0) -> bool:
+        """Take a slot, waiting up to timeout seconds; False means the call should be shed"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["rejected"] += 1
+                    return False
+                self._cond.wait(remaining)
+            self._in_flight += 1
+            self._stats["accepted"] += 1
+            return True
+
+    def release(self, success: Optional[bool], latency: Optional[float] = None):
+        """Return a slot. success=None releases without adjusting the limit (e.g. client went away)"""
+        with self._cond:
+            self._in_flight -= 1
+            if success is None:
+                pass
+            elif not success or (latency is not None and latency > self.latency_threshold):
+                self._limit = max(self.min_limit, self._limit * self.backoff)
+                self._stats["decreases"] += 1
+            elif self._in_flight + 1 >= int(self._limit) * 0.5:
+                # Only grow while the current limit is actually being used
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+                self._stats["increases"] += 1
+            self._cond.notify_all()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return dict(self._stats, limit=self.limit, in_flight=self._in_flight,
+                        min_limit=self.min_limit, max_limit=self.max_limit)
+
+
+class CircuitBreaker:
+    """Classic closed / open / half-open breaker.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls fail fast
+    for `reset_timeout` seconds. Then a single probe call is let through: success closes
+    the circuit, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self._stats = {"rejected": 0, "times_opened": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def allow(self) -> bool:
+        """True if a call may go upstream now"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self._stats["rejected"] += 1
+            return False
+
+    def cancel(self):
+        """The allowed call never reached upstream; let another caller probe"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self._state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._stats["times_opened"] += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            state = self._current_state()
+            retry_in = self.reset_timeout - (time.monotonic() - self._opened_at) if state == self.OPEN else 0
+            return dict(self._stats, state=state, consecutive_failures=self._failures,
+                        retry_in_seconds=round(max(retry_in, 0), 1))
@@ -4,10 +4,15 @@ from sqlalchemy.orm import Session
 from typing import List
 from datetime import datetime
 from pydantic import BaseModel
+import threading
 
 from database import get_db
 from models import User, ChatHistory, UserProgress, Payment, PlanType
 from auth import get_current_user
+from ai_service import ai_service
+from history_writer import history_writer
+from history_purger import history_purger
+from chat_streams import chat_streams
 
 router = APIRouter()
 
@@ -118,6 +123,46 @@ async def get_admin_stats(
         "total_revenue": total_revenue
     }
 
+# AI service statistics
+@router.get("/ai-stats")
+async def get_ai_stats(admin: User = Depends(get_admin_user)):
+    """Get AI service runtime statistics (cache hit rates, etc.)"""
+    return ai_service.get_stats()
+
+# Chat history write-behind queue
+@router.get("/history-writer-stats")
+async def get_history_writer_stats(admin: User = Depends(get_admin_user)):
+    """Queue depth, batch sizes, backpressure waits and dropped/failed rows of the chat history writer"""
+    return history_writer.stats()
+
+# Background deletion of cleared chat history
+@router.get("/history-purger-stats")
+async def get_history_purger_stats(admin: User = Depends(get_admin_user)):
+    """Users waiting to be purged, rows purged so far and failed batches"""
+    return history_purger.stats()
+
+# Resumable chat streams
+@router.get("/chat-stream-stats")
+async def get_chat_stream_stats(admin: User = Depends(get_admin_user)):
+    """Live and buffered chat streams, resumes and resumes that came too late"""
+    return chat_streams.stats()
+
+# Per-endpoint AI call metrics
+@router.get("/ai-metrics")
+async def get_ai_metrics(admin: User = Depends(get_admin_user)):
+    """Latency histograms, token counts, cost, cache hit/miss and errors per AI endpoint"""
+    return ai_service.metrics.snapshot()
+
+# Run the AI cache pre-warm job now instead of waiting for the off-peak window
+@router.post("/ai-prewarm")
+async def run_ai_prewarm(admin: User = Depends(get_admin_user)):
+    """Start a cache pre-warm run in the background (progress shows up in /ai-stats)"""
+    warmer = ai_service.warmer
+    if warmer.stats()["running"]:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Cache pre-warm is already running")
+    threading.Thread(target=warmer.run, name="ai-prewarm-manual", daemon=True).start()
+    return {"message": "Cache pre-warm started"}
+
 # Get all users
 @router.get("/users", response_model=List[UserResponse])
 async def get_all_users(
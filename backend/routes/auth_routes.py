@@ -1,8 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from sqlalchemy.orm import Session
 from datetime import timedelta
-from google.oauth2 import id_token
-from google.auth.transport import requests
 from database import get_db
 from models import User as UserModel
 from schemas import UserCreate, UserLogin, User, Token
@@ -91,6 +89,10 @@ async def login(request: Request, user_login: UserLogin, db: Session = Depends(g
 @rate_limit("10/minute")  # Rate limit for Google OAuth
 async def google_auth(request: Request, auth_data: GoogleAuthRequest, db: Session = Depends(get_db)):
     """Authenticate user with Google OAuth"""
+    # Imported on first use to keep worker startup fast
+    from google.oauth2 import id_token
+    from google.auth.transport import requests
+    
     try:
         # Verify the Google token
         idinfo = id_token.verify_oauth2_token(
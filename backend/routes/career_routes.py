@@ -1,7 +1,6 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException
 from schemas import ResumeAnalyzeRequest, InterviewPrepRequest
 from ai_service import ai_service
-import PyPDF2
 import io
 
 router = APIRouter(prefix="/api/career", tags=["Career & Placement"])
@@ -9,6 +8,7 @@ router = APIRouter(prefix="/api/career", tags=["Career & Placement"])
 @router.post("/resume-upload")
 async def upload_resume(file: UploadFile = File(...)):
     """Upload and analyze resume PDF"""
+    import PyPDF2  # imported on first upload to keep worker startup fast
     
     # Validate file type
     if not file.filename.endswith('.pdf'):
@@ -31,7 +31,7 @@ async def upload_resume(file: UploadFile = File(...)):
             raise HTTPException(status_code=400, detail="Could not extract text from PDF. Please ensure it's not a scanned image.")
         
         # Analyze the extracted text
-        result = ai_service.analyze_resume(resume_text)
+        result = await ai_service.analyze_resume_async(resume_text)
         result["filename"] = file.filename
         result["pages"] = len(pdf_reader.pages)
         
@@ -43,15 +43,15 @@ async def upload_resume(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
 
 @router.post("/resume-analyze")
-def analyze_resume(request: ResumeAnalyzeRequest):
+async def analyze_resume(request: ResumeAnalyzeRequest):
     """Analyze resume text for ATS compatibility and improvements"""
-    result = ai_service.analyze_resume(request.resumeText)
+    result = await ai_service.analyze_resume_async(request.resumeText)
     return result
 
 @router.post("/interview-prep")
-def interview_preparation(request: InterviewPrepRequest):
+async def interview_preparation(request: InterviewPrepRequest):
     """Get company-specific interview preparation"""
-    result = ai_service.interview_prep(request.company, request.role)
+    result = await ai_service.interview_prep_async(request.company, request.role)
     return result
 
 @router.post("/resume-generate")
@@ -1,143 +1,218 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
-from schemas import ChatRequest, ChatResponse, ExplainTopicRequest, GenerateNotesRequest, SolveDoubtRequest
+from typing import Optional
+from datetime import datetime
+from schemas import ChatRequest, ChatResponse, ExplainTopicRequest, GenerateNotesRequest, SolveDoubtRequest, LearningBatchRequest
 from ai_service import ai_service
 from database import get_db
+from history_writer import history_writer
+from history_purger import history_purger, history_watermark
+from conversation_store import conversation_store, new_conversation_id
+from chat_streams import chat_streams, parse_last_event_id
+from streaming import coalesce
 from models import ChatHistory, User
 from auth import get_current_user
 from middleware import rate_limit
+from config import settings
+import asyncio
 import json
 
 router = APIRouter(prefix="/api", tags=["Chat & Learning"])
 
+async def resolve_conversation(chat_request: ChatRequest, user_id: int):
+    """Return (conversation id, messages for the model).
+    
+    Clients either send the whole conversation in `messages`, or only the new `message`
+    plus a `conversation_id`, in which case earlier turns come from the server-side store
+    (memory first, the database on a miss). A missing id starts a new conversation.
+    """
+    if chat_request.messages:
+        return chat_request.conversation_id, [{"role": msg.role, "content": msg.content} for msg in chat_request.messages]
+    
+    conversation_id = chat_request.conversation_id
+    if conversation_id is None:
+        conversation_id = new_conversation_id()
+        conversation_store.start(user_id, conversation_id)
+        turns = []
+    else:
+        turns = conversation_store.get(user_id, conversation_id)
+        if turns is None:
+            turns = await run_in_threadpool(conversation_store.load, user_id, conversation_id)
+    messages = [{"role": role, "content": content} for role, content in turns]
+    messages.append({"role": "user", "content": chat_request.message})
+    return conversation_id, messages
+
+async def save_turn(user_id: int, conversation_id, language: str, *turns):
+    """Queue (role, content) turns for the history writer and the conversation store"""
+    if conversation_id is not None:
+        for role, content in turns:
+            conversation_store.append(user_id, conversation_id, role, content)
+    await history_writer.submit_async([
+        history_writer.row(user_id, role, content, language, conversation_id) for role, content in turns
+    ])
+
 @router.post("/chat", response_model=ChatResponse)
 @rate_limit("30/minute")  # 30 chat messages per minute
-async def chat(request: Request, chat_request: ChatRequest, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def chat(request: Request, chat_request: ChatRequest, current_user: User = Depends(get_current_user)):
     """Main chat endpoint with streaming, history saving and multi-language support"""
     
     # Detect language from user message
     language = chat_request.language if hasattr(chat_request, 'language') else "english"
     
-    # Build messages with language instruction
-    messages = [{"role": msg.role, "content": msg.content} for msg in chat_request.messages]
-    
-    # Add language instruction if not English
-    if language.lower() in ["hindi", "gujarati"]:
-        language_instruction = f"\n\nIMPORTANT: Respond in {language.upper()} language. Translate your entire response to {language}."
-        messages[-1]["content"] += language_instruction
+    # Build messages (the language instruction lives in the system prompt for that language)
+    conversation_id, messages = await resolve_conversation(chat_request, current_user.id)
     
     # Get AI response
-    response = ai_service.chat_completion(messages)
-    
-    # Save user message to history
-    try:
-        user_message = ChatHistory(
-            user_id=current_user.id,
-            role="user",
-            content=chat_request.messages[-1].content,
-            language=language
-        )
-        db.add(user_message)
-        
-        # Save assistant response to history
-        assistant_message = ChatHistory(
-            user_id=current_user.id,
-            role="assistant",
-            content=response,
-            language=language
-        )
-        db.add(assistant_message)
-        db.commit()
-    except Exception as e:
-        print(f"Error saving chat history: {e}")
-        db.rollback()
-    
-    return {"response": response}
+    response = await ai_service.chat_completion_async(messages, current_user.id, language, current_user.plan)
+    
+    # Save both messages to history (written in the background, off the request path)
+    await save_turn(current_user.id, conversation_id, language,
+                    ("user", messages[-1]["content"]), ("assistant", response))
+    
+    return {"response": response, "conversation_id": conversation_id}
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
 
 @router.post("/chat/stream")
 @rate_limit("30/minute")  # 30 streaming requests per minute
-async def chat_stream(request: Request, chat_request: ChatRequest, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    """Streaming chat endpoint - responses appear word by word like ChatGPT"""
+async def chat_stream(request: Request, chat_request: ChatRequest, current_user: User = Depends(get_current_user)):
+    """Streaming chat endpoint - responses appear word by word like ChatGPT.
+    
+    Events carry ids ("<stream id>:<seq>") and the answer is generated into a replay
+    buffer independently of this connection, so a client that drops can reconnect to
+    GET /chat/stream/{stream_id} with Last-Event-ID and receive only what it missed.
+    """
     
     # Detect language from user message
     language = chat_request.language if hasattr(chat_request, 'language') else "english"
     
-    # Build messages with language instruction
-    messages = [{"role": msg.role, "content": msg.content} for msg in chat_request.messages]
-    
-    # Add language instruction if not English
-    if language.lower() in ["hindi", "gujarati"]:
-        language_instruction = f"\n\nIMPORTANT: Respond in {language.upper()} language. Translate your entire response to {language}."
-        messages[-1]["content"] += language_instruction
-    
-    # Save user message to history
-    try:
-        user_message = ChatHistory(
-            user_id=current_user.id,
-            role="user",
-            content=chat_request.messages[-1].content,
-            language=language
-        )
-        db.add(user_message)
-        db.commit()
-    except Exception as e:
-        print(f"Error saving user message: {e}")
-        db.rollback()
-    
-    # Stream response
+    # Build messages (the language instruction lives in the system prompt for that language)
+    conversation_id, messages = await resolve_conversation(chat_request, current_user.id)
+    
+    # Save user message to history (written in the background, off the request path)
+    await save_turn(current_user.id, conversation_id, language, ("user", messages[-1]["content"]))
+    
+    stream = chat_streams.create(current_user.id)
+    first_event = {"stream_id": stream.stream_id}
+    if conversation_id is not None:
+        first_event["conversation_id"] = conversation_id
+    stream.publish(first_event)
+    
+    # Generate into the replay buffer; keeps going if the client disconnects
     async def generate():
         full_response = ""
         try:
-            for chunk in ai_service.chat_completion_stream(messages):
-                full_response += chunk
-                # Send chunk as SSE (Server-Sent Events)
-                yield f"data: {json.dumps({'chunk': chunk})}\n\n"
+            chunks = ai_service.chat_completion_stream_async(messages, current_user.id, language, current_user.plan)
+            # Merge chunks arriving close together into one SSE event
+            async for text in coalesce(chunks, settings.chat_stream_coalesce_ms / 1000, settings.chat_stream_coalesce_chars):
+                full_response += text
+                stream.publish({"chunk": text})
             
             # Send completion signal
-            yield f"data: {json.dumps({'done': True})}\n\n"
+            stream.publish({"done": True})
             
             # Save complete response to history
-            try:
-                assistant_message = ChatHistory(
-                    user_id=current_user.id,
-                    role="assistant",
-                    content=full_response,
-                    language=language
-                )
-                db.add(assistant_message)
-                db.commit()
-            except Exception as e:
-                print(f"Error saving assistant message: {e}")
-                db.rollback()
-                
+            await save_turn(current_user.id, conversation_id, language, ("assistant", full_response))
+            
         except Exception as e:
             error_msg = f"⚠️ Error: {str(e)[:100]}"
-            yield f"data: {json.dumps({'error': error_msg})}\n\n"
+            stream.publish({"error": error_msg})
+        finally:
+            stream.finish()
     
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    stream.task = asyncio.create_task(generate())
+    return StreamingResponse(stream.follow(0, settings.chat_stream_heartbeat_seconds),
+                             media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.get("/chat/stream/{stream_id}")
+@rate_limit("60/minute")
+async def resume_chat_stream(
+    request: Request,
+    stream_id: str,
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    current_user: User = Depends(get_current_user)
+):
+    """Resume a chat stream: replays the events after Last-Event-ID, then follows the live answer"""
+    stream = chat_streams.resume(stream_id, current_user.id)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="Stream expired or not found")
+    return StreamingResponse(stream.follow(parse_last_event_id(last_event_id), settings.chat_stream_heartbeat_seconds),
+                             media_type="text/event-stream", headers=SSE_HEADERS)
 
 @router.get("/chat/history")
 def get_chat_history(
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[int] = Query(None, description="Return messages older than this message id (scrolling back)"),
+    since: Optional[int] = Query(None, description="Return only messages newer than this message id (polling)"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get user's chat history"""
-    history = db.query(ChatHistory).filter(
-        ChatHistory.user_id == current_user.id
-    ).order_by(ChatHistory.timestamp.desc()).limit(limit).all()
+    """Get user's chat history, one page at a time.
+    
+    Without a cursor this is the latest page. `before` pages backwards through older
+    messages and `since` returns only what is new since the client's last-seen id. Pages
+    are read by keyset on (timestamp, id) through ix_chat_history_user_timestamp_id, so
+    every request costs one page regardless of how long the history is.
+    """
+    if before is not None and since is not None:
+        raise HTTPException(status_code=400, detail="Use either before or since, not both")
+    
+    # Include this user's messages still waiting in the write-behind queue
+    up_to_date = history_writer.flush_user(current_user.id)
+    if not up_to_date:
+        print(f"[HISTORY] Serving history of user {current_user.id} while messages are still queued")
+    query = db.query(ChatHistory).filter(ChatHistory.user_id == current_user.id)
+    watermark = history_watermark(db, current_user.id)
+    if watermark is not None:
+        # Cleared messages stay in the table until the purger gets to them
+        query = query.filter(ChatHistory.timestamp >= watermark)
+    
+    cursor_id = before if before is not None else since
+    if cursor_id is not None:
+        cursor = query.with_entities(ChatHistory.timestamp).filter(ChatHistory.id == cursor_id).first()
+        if cursor is None:
+            raise HTTPException(status_code=404, detail="Unknown history cursor")
+        if before is not None:
+            query = query.filter(or_(
+                ChatHistory.timestamp < cursor.timestamp,
+                and_(ChatHistory.timestamp == cursor.timestamp, ChatHistory.id < cursor_id)
+            ))
+        else:
+            query = query.filter(or_(
+                ChatHistory.timestamp > cursor.timestamp,
+                and_(ChatHistory.timestamp == cursor.timestamp, ChatHistory.id > cursor_id)
+            ))
+    
+    # One extra row tells whether there is more beyond this page
+    if since is not None:
+        rows = query.order_by(ChatHistory.timestamp.asc(), ChatHistory.id.asc()).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        page = rows[:limit]
+    else:
+        rows = query.order_by(ChatHistory.timestamp.desc(), ChatHistory.id.desc()).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        page = list(reversed(rows[:limit]))
     
     return {
         "history": [
             {
+                "id": msg.id,
                 "role": msg.role,
                 "content": msg.content,
                 "language": msg.language,
                 "timestamp": msg.timestamp.isoformat()
             }
-            for msg in reversed(history)
-        ]
+            for msg in page
+        ],
+        "has_more": has_more,
+        # False when recently sent messages were not saved in time and may be missing
+        "up_to_date": up_to_date,
+        # Pass as `before` for the previous page, or as `since` to poll for new messages
+        "oldest_id": page[0].id if page else None,
+        "newest_id": page[-1].id if page else since
     }
 
 @router.delete("/chat/history")
@@ -145,25 +220,70 @@ def clear_chat_history(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Clear user's chat history"""
-    db.query(ChatHistory).filter(ChatHistory.user_id == current_user.id).delete()
+    """Clear user's chat history.
+    
+    Only the user's clear watermark is moved here, so this is one small UPDATE however
+    long the history is; the rows themselves are deleted by the background purger.
+    Messages still in the write-behind queue were stamped before now and are cleared too.
+    """
+    db.query(User).filter(User.id == current_user.id).update({User.history_cleared_before: datetime.utcnow()})
     db.commit()
+    history_purger.schedule(current_user.id)
+    ai_service.forget_conversation(current_user.id)
+    conversation_store.forget(current_user.id)
     return {"message": "Chat history cleared"}
 
 @router.post("/learning/explain")
-def explain_topic(request: ExplainTopicRequest):
+async def explain_topic(request: ExplainTopicRequest):
     """Explain any topic in simple terms"""
-    result = ai_service.explain_topic(request.topic, request.subject, request.level)
+    result = await ai_service.explain_topic_async(request.topic, request.subject, request.level)
     return result
 
 @router.post("/learning/notes")
-def generate_notes(request: GenerateNotesRequest):
+async def generate_notes(request: GenerateNotesRequest):
     """Generate study notes from topic/syllabus"""
-    result = ai_service.generate_notes(request.topic, request.format)
+    result = await ai_service.generate_notes_async(request.topic, request.format)
     return result
 
 @router.post("/learning/doubt")
-def solve_doubt(request: SolveDoubtRequest):
+async def solve_doubt(request: SolveDoubtRequest):
     """Solve student doubts 24/7"""
-    result = ai_service.solve_doubt(request.question, request.subject)
+    result = await ai_service.solve_doubt_async(request.question, request.subject)
     return result
+
+@router.post("/learning/batch")
+@rate_limit("10/minute")  # each batch fans out into several AI calls
+async def learning_batch(request: Request, batch: LearningBatchRequest):
+    """Run several explain/notes/doubt requests concurrently, streaming each result as an NDJSON line when it is ready"""
+    if not batch.items:
+        raise HTTPException(status_code=400, detail="No items in batch")
+    if len(batch.items) > settings.learning_batch_max_items:
+        raise HTTPException(status_code=400, detail=f"At most {settings.learning_batch_max_items} items per batch")
+    
+    semaphore = asyncio.Semaphore(settings.learning_batch_concurrency)
+    
+    async def run(index, item):
+        async with semaphore:
+            try:
+                if item.type == "explain":
+                    result = await ai_service.explain_topic_async(item.topic, item.subject, item.level)
+                elif item.type == "notes":
+                    result = await ai_service.generate_notes_async(item.topic, item.format)
+                else:
+                    result = await ai_service.solve_doubt_async(item.question, item.subject)
+                return {"index": index, "type": item.type, "result": result}
+            except Exception as e:
+                return {"index": index, "type": item.type, "error": f"⚠️ Error: {str(e)[:100]}"}
+    
+    async def generate():
+        tasks = [asyncio.create_task(run(index, item)) for index, item in enumerate(batch.items)]
+        try:
+            # One line per item in completion order; "index" points back into the request
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            # Client went away: don't start the items still waiting for the semaphore
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
@@ -1,23 +1,25 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from schemas import CodeHelpRequest, DSARequest, ProjectGuideRequest
 from ai_service import ai_service
+from auth import get_optional_user
 
 router = APIRouter(prefix="/api/coding", tags=["Coding Help"])
 
 @router.post("/help")
-def code_help(request: CodeHelpRequest):
+async def code_help(request: CodeHelpRequest):
     """Explain, debug, or optimize code"""
-    result = ai_service.explain_code(request.code, request.language, request.task)
+    result = await ai_service.explain_code_async(request.code, request.language, request.task)
     return result
 
 @router.post("/dsa-hint")
-def dsa_hint(request: DSARequest):
+async def dsa_hint(request: DSARequest, current_user=Depends(get_optional_user)):
     """Get hints for DSA problems without spoiling solution"""
-    result = ai_service.dsa_hint(request.problem)
+    plan = current_user.plan if current_user else None
+    result = await ai_service.dsa_hint_async(request.problem, plan)
     return result
 
 @router.post("/project-guide")
-def project_guidance(request: ProjectGuideRequest):
+async def project_guidance(request: ProjectGuideRequest):
     """Get project guidance and roadmap"""
-    result = ai_service.project_guidance(request.projectType, request.techStack)
+    result = await ai_service.project_guidance_async(request.projectType, request.techStack)
     return result
@@ -1,13 +1,15 @@
 from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
 from schemas import MockTestRequest, SolvePYQRequest, StudyPlanRequest
 from ai_service import ai_service
+import json
 
 router = APIRouter(prefix="/api/exam", tags=["Exam Preparation"])
 
 @router.post("/mock-test")
-def generate_mock_test(request: MockTestRequest):
+async def generate_mock_test(request: MockTestRequest):
     """Generate mock test with questions"""
-    result = ai_service.generate_mock_test(
+    result = await ai_service.generate_mock_test_async(
         request.subject,
         request.topic,
         request.difficulty,
@@ -15,14 +17,39 @@ def generate_mock_test(request: MockTestRequest):
     )
     return result
 
+@router.post("/mock-test/stream")
+async def generate_mock_test_stream(request: MockTestRequest):
+    """Stream mock test questions as SSE events, one event per question as soon as it is ready"""
+    
+    async def generate():
+        count = 0
+        try:
+            async for question in ai_service.generate_mock_test_stream_async(
+                request.subject,
+                request.topic,
+                request.difficulty,
+                request.numQuestions
+            ):
+                count += 1
+                yield f"data: {json.dumps({'question': question})}\n\n"
+            
+            if count == 0:
+                yield f"data: {json.dumps({'error': '⚠️ Could not generate questions right now. Please try again in a moment.'})}\n\n"
+            yield f"data: {json.dumps({'done': True, 'totalQuestions': count, 'timeLimit': count * 2})}\n\n"
+        except Exception as e:
+            error_msg = f"⚠️ Error: {str(e)[:100]}"
+            yield f"data: {json.dumps({'error': error_msg})}\n\n"
+    
+    return StreamingResponse(generate(), media_type="text/event-stream")
+
 @router.post("/solve-pyq")
-def solve_previous_year_question(request: SolvePYQRequest):
+async def solve_previous_year_question(request: SolvePYQRequest):
     """Solve previous year question with explanation"""
-    result = ai_service.solve_previous_year(request.question, request.subject)
+    result = await ai_service.solve_previous_year_async(request.question, request.subject)
     return result
 
 @router.post("/study-plan")
-def generate_study_plan(request: StudyPlanRequest):
+async def generate_study_plan(request: StudyPlanRequest):
     """Generate personalized study plan"""
-    result = ai_service.generate_study_plan(request.examDate, request.subjects)
+    result = await ai_service.generate_study_plan_async(request.examDate, request.subjects)
     return result
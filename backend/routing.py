@@ -0,0 +1,84 @@
+"""
+Model routing - pick a model tier (fast / standard / large) per request
+"""
+
+from typing import Dict, Iterable, Optional, Tuple
+import threading
+from resilience import LatencyTracker
+
+TIERS = ("fast", "standard", "large")
+
+
+class ModelRouter:
+    """Chooses the model tier for a request from its endpoint, size, user plan and upstream latency.
+
+    The endpoint's generation profile gives the starting tier, then:
+    - a fast-tier request whose prompt is longer than fast_max_prompt_tokens moves to standard;
+    - the large tier is kept for plans in large_plans; requests without a plan (anonymous
+      routes) never get it;
+    - while a tier's recent p95 latency exceeds slow_p95_seconds, requests step down one tier
+      if the tier below is not known to be slower;
+    - tiers without a configured model fall back to standard.
+    Every decision is counted per endpoint as "tier:reason", and latencies are tracked per
+    tier, so the effect of routing on p50 / p99 can be read from the stats and metrics.
+    """
+
+    def __init__(self, profiles, available: Iterable[str], enabled: bool = True,
+                 fast_max_prompt_tokens: int = 300, large_plans: Iterable[str] = ("basic", "pro"),
+                 slow_p95_seconds: float = 10.0):
+        self.profiles = profiles
+        self.available = set(available) | {"standard"}
+        self.enabled = enabled
+        self.fast_max_prompt_tokens = fast_max_prompt_tokens
+        self.large_plans = {plan.lower() for plan in large_plans}
+        self.slow_p95_seconds = slow_p95_seconds
+        self.latencies = LatencyTracker()
+        self._decisions = {}  # endpoint -> {"tier:reason": count}
+        self._lock = threading.Lock()
+
+    def _slow(self, tier: str) -> bool:
+        p95 = self.latencies.percentile(tier, 95)
+        return p95 is not None and p95 > self.slow_p95_seconds
+
+    def route(self, endpoint: Optional[str], prompt_tokens: int, plan: Optional[str] = None) -> str:
+        tier, reason = self._choose(endpoint, prompt_tokens, plan)
+        with self._lock:
+            counts = self._decisions.setdefault(endpoint or "default", {})
+            label = f"{tier}:{reason}"
+            counts[label] = counts.get(label, 0) + 1
+        return tier
+
+    def _choose(self, endpoint: Optional[str], prompt_tokens: int, plan: Optional[str]) -> Tuple[str, str]:
+        if not self.enabled:
+            return "standard", "routing off"
+        tier, reason = self.profiles.tier(endpoint), "profile"
+        if tier == "fast" and prompt_tokens > self.fast_max_prompt_tokens:
+            tier, reason = "standard", "long prompt"
+        if tier == "large" and (plan is None or plan.lower() not in self.large_plans):
+            tier, reason = "standard", "plan"
+
+        index = TIERS.index(tier)
+        if index > 0 and self._slow(tier):
+            lower = TIERS[index - 1]
+            lower_p95 = self.latencies.percentile(lower, 95)
+            own_p95 = self.latencies.percentile(tier, 95)
+            if lower in self.available and (lower_p95 is None or lower_p95 < own_p95):
+                tier, reason = lower, "latency"
+
+        if tier not in self.available:
+            tier, reason = "standard", "tier not configured"
+        return tier, reason
+
+    def record(self, tier: str, seconds: float):
+        """Latency of a successful call served by a tier"""
+        self.latencies.record(tier, seconds)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            decisions = {endpoint: dict(counts) for endpoint, counts in self._decisions.items()}
+        return {
+            "enabled": self.enabled,
+            "available_tiers": [tier for tier in TIERS if tier in self.available],
+            "decisions": decisions,
+            "latency": self.latencies.stats()
+        }
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, model_validator
+from typing import Optional, List, Literal, Union, Annotated
 from datetime import datetime
 
 # User Schemas
@@ -41,11 +41,21 @@ class ChatMessage(BaseModel):
     timestamp: Optional[datetime] = None
 
 class ChatRequest(BaseModel):
-    messages: List[ChatMessage]
+    # Either the whole conversation (messages) or, with server-held state, just the new message
+    messages: List[ChatMessage] = []
+    message: Optional[str] = None
+    conversation_id: Optional[str] = Field(None, max_length=64)  # omit to start a new conversation
     language: Optional[str] = "english"  # 'english', 'hindi', 'gujarati'
 
+    @model_validator(mode="after")
+    def check_messages(self):
+        if not self.messages and not self.message:
+            raise ValueError("Provide either messages or message")
+        return self
+
 class ChatResponse(BaseModel):
     response: str
+    conversation_id: Optional[str] = None
 
 # Learning Schemas
 class ExplainTopicRequest(BaseModel):
@@ -61,12 +71,27 @@ class SolveDoubtRequest(BaseModel):
     question: str
     subject: Optional[str] = None
 
+class ExplainTopicBatchItem(ExplainTopicRequest):
+    type: Literal["explain"]
+
+class GenerateNotesBatchItem(GenerateNotesRequest):
+    type: Literal["notes"]
+
+class SolveDoubtBatchItem(SolveDoubtRequest):
+    type: Literal["doubt"]
+
+class LearningBatchRequest(BaseModel):
+    items: List[Annotated[
+        Union[ExplainTopicBatchItem, GenerateNotesBatchItem, SolveDoubtBatchItem],
+        Field(discriminator="type")
+    ]]
+
 # Exam Schemas
 class MockTestRequest(BaseModel):
     subject: str
     topic: str
     difficulty: str
-    numQuestions: int
+    numQuestions: int = Field(ge=1, le=50)  # each 5 questions are one upstream call
 
 class SolvePYQRequest(BaseModel):
     question: str
@@ -0,0 +1,108 @@
+"""
+Streaming helpers - bridge blocking provider streams into asyncio
+"""
+
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import asyncio
+import threading
+
+_DONE = object()
+
+
+async def iterate_in_thread(factory, executor, max_buffer: int = 32):
+    """Consume a blocking iterator on a worker thread and yield its items asynchronously.
+
+    factory() is called on the worker thread and must return an iterable. Items are
+    handed over through a bounded asyncio.Queue, so a slow client applies backpressure
+    to the worker instead of buffering the whole response, and the event loop never
+    waits on the provider. Exceptions raised by the iterator are re-raised here.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=max(1, max_buffer))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while True:
+            try:
+                future.result(timeout=0.1)
+                return True
+            except FutureTimeoutError:
+                # Buffer is full; give up if the consumer went away meanwhile
+                if stop.is_set():
+                    future.cancel()
+                    return False
+
+    def pump():
+        iterator = None
+        try:
+            iterator = iter(factory())
+            for item in iterator:
+                if stop.is_set() or not put((item, None)):
+                    return
+            if not stop.is_set():
+                put((_DONE, None))
+        except Exception as e:
+            if not stop.is_set():
+                put((_DONE, e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    loop.run_in_executor(executor, pump)
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        # Consumer finished or disconnected: stop the worker and free any blocked put
+        stop.set()
+        while not queue.empty():
+            queue.get_nowait()
+
+
+async def coalesce(chunks, max_delay: float, max_chars: int):
+    """Merge an async stream of text chunks into fewer, larger pieces.
+
+    A piece is emitted once it holds max_chars characters or its first chunk has waited
+    max_delay seconds, whichever comes first, so a fast model produces a few larger
+    frames instead of one per token while a slow one still shows text promptly.
+    Exceptions from the stream are re-raised after the pending text is emitted.
+    """
+    loop = asyncio.get_running_loop()
+    iterator = chunks.__aiter__()
+    pending, deadline = "", 0.0
+    next_chunk = asyncio.ensure_future(iterator.__anext__())
+    try:
+        while True:
+            timeout = max(0.0, deadline - loop.time()) if pending else None
+            done, _ = await asyncio.wait({next_chunk}, timeout=timeout)
+            if not done:
+                yield pending
+                pending = ""
+                continue
+            try:
+                chunk = next_chunk.result()
+            except StopAsyncIteration:
+                break
+            except Exception:
+                if pending:
+                    yield pending
+                raise
+            if not pending:
+                deadline = loop.time() + max_delay
+            pending += chunk
+            if len(pending) >= max_chars:
+                yield pending
+                pending = ""
+            next_chunk = asyncio.ensure_future(iterator.__anext__())
+        if pending:
+            yield pending
+    finally:
+        # Consumer went away mid-stream: stop waiting for the provider
+        next_chunk.cancel()
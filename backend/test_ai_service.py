@@ -0,0 +1,1070 @@
+"""
+Unit Tests for the AI service layer (no network access needed)
+Run with: pytest test_ai_service.py -v
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import threading
+import time
+import pytest
+from ai_service import AIService, ResponseCache, SingleFlight
+from config import settings
+from streaming import coalesce, iterate_in_thread
+from conversation import ContextWindow, estimate_tokens
+from prompts import get_system_prompt
+from mock_tests import QuestionStreamParser, dedupe_questions, parse_questions
+from question_bank import QuestionBank
+from dsa_library import DemoSolutionLibrary
+from prewarm import CacheWarmer, PopularityTracker
+from generation_profiles import GenerationProfiles
+from routing import ModelRouter
+from metrics import MODEL_PRICES, AICallMetrics, Histogram, model_price
+from database import Base
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import models  # noqa: F401 - registers the tables on Base
+from llm_providers import Completion, FailoverProvider, FakeProvider, GeminiProvider, KeyPool, LLMProvider, build_provider, has_tier
+from quota import KeyQuota, QuotaExhausted, TokenBucket
+from resilience import (
+    FATAL, QUOTA, REJECTED, TRANSIENT, AdaptiveLimiter, CircuitBreaker, Hedger, LatencyTracker,
+    RetryPolicy, ServiceUnavailable, classify_error
+)
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Stands in for genai.GenerativeModel and counts upstream calls"""
+
+    def __init__(self, text="Fake AI response", gate=None):
+        self.text = text
+        self.gate = gate  # optional threading.Event that holds every call until set
+        self.calls = 0
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        self.calls += 1
+        self.last_config = generation_config
+        if stream:
+            return self._stream()
+        if self.gate:
+            self.gate.wait(5)
+        return FakeChunk(self.text)
+
+    def _stream(self):
+        for word in self.text.split(" "):
+            if self.gate:
+                self.gate.wait(5)
+            yield FakeChunk(word + " ")
+
+    def start_chat(self, history=None):
+        self.sessions_started = getattr(self, "sessions_started", 0) + 1
+        return FakeChatSession(self, history)
+
+
+class FakeChatSession:
+    def __init__(self, model, history):
+        self.model = model
+        self.history = list(history or [])
+
+    def send_message(self, content, generation_config=None, stream=False):
+        self.history.append({"role": "user", "parts": [content]})
+        return self.model.generate_content(self.history, generation_config, stream)
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    """AIService wired to a Gemini provider with a fake model and a throwaway cache file"""
+    monkeypatch.setattr(settings, "ai_cache_path", str(tmp_path / "cache.db"))
+    monkeypatch.setattr(settings, "ai_cache_max_entries", 8)
+    svc = AIService()
+    engine = create_engine(f"sqlite:///{tmp_path / 'bank.db'}")
+    Base.metadata.create_all(bind=engine)
+    svc.question_bank = QuestionBank(sessionmaker(bind=engine), svc._executor, svc._generate_questions,
+                                    min_pool=0, serve_multiple=1)
+    svc.provider = GeminiProvider("test-key", "gemini-test")
+    svc.provider.model = FakeModel()
+    svc.tier_providers = {}  # tier chains are built from the real settings (and API keys)
+    svc.use_ai = True
+    yield svc
+    svc.shutdown()
+
+
+class TestResponseCache:
+    """Test the two-tier response cache"""
+
+    def test_memory_hit(self, tmp_path):
+        cache = ResponseCache(str(tmp_path / "cache.db"))
+        cache.set("k", "value", ttl=60, endpoint="explain_topic")
+        assert cache.get("k", "explain_topic") == "value"
+        assert cache.stats()["endpoints"]["explain_topic"]["memory_hits"] == 1
+
+    def test_survives_restart(self, tmp_path):
+        path = str(tmp_path / "cache.db")
+        ResponseCache(path).set("k", "value", ttl=60)
+
+        restarted = ResponseCache(path)
+        assert restarted.get("k") == "value"
+        assert restarted.stats()["endpoints"]["default"]["disk_hits"] == 1
+
+    def test_expired_entry_is_a_miss(self, tmp_path):
+        cache = ResponseCache(str(tmp_path / "cache.db"))
+        cache.set("k", "value", ttl=-1)
+        assert cache.get("k") is None
+        assert cache.stats()["endpoints"]["default"]["misses"] == 1
+
+    def test_memory_tier_is_bounded(self):
+        cache = ResponseCache("", max_entries=2)
+        for key in ["a", "b", "c"]:
+            cache.set(key, key, ttl=60)
+        assert cache.get("a") is None
+        assert cache.get("c") == "c"
+
+    def test_key_normalizes_prompt(self):
+        config = {"temperature": 0.7}
+        assert ResponseCache.make_key("Explain  DBMS\nnormalization", config) == \
+            ResponseCache.make_key("explain dbms normalization", config)
+        assert ResponseCache.make_key("DBMS", config) != ResponseCache.make_key("DBMS", {"temperature": 0.2})
+
+
+class TestAIServiceCaching:
+    """Test which AIService endpoints use the cache"""
+
+    def test_cached_endpoint_calls_model_once(self, service):
+        first = service.interview_prep("Amazon", "SDE")
+        second = service.interview_prep("amazon", "SDE")
+        assert first["preparation"] == second["preparation"]
+        assert service.provider.model.calls == 1
+
+    def test_uncached_endpoint_always_calls_model(self, service):
+        service.solve_doubt("What is a deadlock?")
+        service.solve_doubt("What is a deadlock?")
+        assert service.provider.model.calls == 2
+
+    def test_errors_are_not_cached(self, service):
+        class BrokenModel:
+            def generate_content(self, *args, **kwargs):
+                raise RuntimeError("upstream down")
+
+        service.provider.model = BrokenModel()
+        result = service.explain_topic("Deadlock", "OS", "beginner")
+        assert "temporarily unavailable" in result["explanation"]
+
+        service.provider.model = FakeModel()
+        service.explain_topic("Deadlock", "OS", "beginner")
+        assert service.provider.model.calls == 1
+
+
+class TestSingleFlight:
+    """Test coalescing of identical in-flight requests"""
+
+    def test_concurrent_calls_share_one_upstream_request(self, service):
+        gate = threading.Event()
+        service.provider.model = FakeModel(gate=gate)
+        results = []
+
+        def ask():
+            results.append(service.solve_doubt("What is paging?")["answer"])
+
+        threads = [threading.Thread(target=ask) for _ in range(5)]
+        for t in threads:
+            t.start()
+        while service.flights.stats()["coalesced_calls"] < 4:
+            time.sleep(0.01)
+        gate.set()
+        for t in threads:
+            t.join()
+
+        assert service.provider.model.calls == 1
+        assert results == ["Fake AI response"] * 5
+
+    def test_exception_propagates_and_clears_flight(self):
+        flights = SingleFlight()
+        with pytest.raises(ValueError):
+            flights.do("k", lambda: (_ for _ in ()).throw(ValueError("boom")))
+        assert flights.stats()["in_flight"] == 0
+
+    def test_late_stream_joiner_replays_emitted_chunks(self):
+        flights = SingleFlight()
+        gate = threading.Event()
+        pulls = []
+
+        def source():
+            for chunk in ["a", "b", "c"]:
+                if chunk == "c":
+                    gate.wait(5)
+                pulls.append(chunk)
+                yield chunk
+
+        leader = flights.stream("k", source)
+        assert [next(leader), next(leader)] == ["a", "b"]
+
+        follower = flights.stream("k", source)
+        assert [next(follower), next(follower)] == ["a", "b"]
+
+        gate.set()
+        assert list(leader) == ["c"]
+        assert list(follower) == ["c"]
+        assert pulls == ["a", "b", "c"]
+        assert flights.stats()["streams_in_flight"] == 0
+
+
+class TestStreamingBridge:
+    """Test the thread-to-asyncio stream bridge"""
+
+    def test_stream_chunks_arrive_in_order(self, service):
+        service.provider.model = FakeModel(text="one two three")
+
+        async def collect():
+            return [chunk async for chunk in service.chat_completion_stream_async(
+                [{"role": "user", "content": "Hi"}]
+            )]
+
+        assert "".join(asyncio.run(collect())) == "one two three "
+
+    def test_errors_are_reraised(self, service):
+        def broken():
+            yield "partial"
+            raise RuntimeError("stream broke")
+
+        async def collect():
+            return [chunk async for chunk in iterate_in_thread(broken, service._executor, 1)]
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(collect())
+
+    def test_consumer_disconnect_stops_worker(self, service):
+        closed = threading.Event()
+
+        def endless():
+            try:
+                while True:
+                    yield "chunk"
+            finally:
+                closed.set()
+
+        async def take_one():
+            stream = iterate_in_thread(endless, service._executor, 2)
+            first = await stream.__anext__()
+            await stream.aclose()
+            return first
+
+        assert asyncio.run(take_one()) == "chunk"
+        assert closed.wait(2)
+
+    def test_coalesce_merges_chunks_by_size_and_time(self):
+        async def chunks():
+            for word in ["a", "b", "c", "d", "e"]:
+                yield word
+            await asyncio.sleep(0.1)
+            yield "f"
+
+        async def collect():
+            return [piece async for piece in coalesce(chunks(), 0.02, 3)]
+
+        assert asyncio.run(collect()) == ["abc", "de", "f"]
+
+
+class TestContextWindow:
+    """Test the token-budgeted conversation window"""
+
+    @staticmethod
+    def conversation(turns, size=400):
+        return [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " + "x" * size}
+            for i in range(turns)
+        ]
+
+    def test_short_conversation_is_sent_verbatim(self):
+        window = ContextWindow(budget_tokens=3000)
+        summary, turns = window.build(self.conversation(4), user_id=1)
+        assert summary == ""
+        assert len(turns) == 4
+
+    def test_long_conversation_is_folded_within_budget(self):
+        window = ContextWindow(budget_tokens=500, summary_tokens=200)
+        messages = self.conversation(40)
+        summary, turns = window.build(messages, user_id=1)
+        assert sum(estimate_tokens(content) for _, content in turns) <= 500
+        assert turns[-1][1] == messages[-1]["content"]
+        assert summary and len(summary) <= 200 * 4
+
+    def test_cut_point_is_reused_on_the_next_turn(self):
+        window = ContextWindow(budget_tokens=500, summary_tokens=200)
+        messages = self.conversation(40)
+        summary, turns = window.build(messages, user_id=1)
+
+        messages.append({"role": "assistant", "content": "short answer"})
+        messages.append({"role": "user", "content": "short follow-up"})
+        next_summary, next_turns = window.build(messages, user_id=1)
+        assert next_summary == summary
+        assert next_turns[:len(turns)] == turns
+
+    def test_greeting_is_skipped(self):
+        turns = ContextWindow.turns_from_messages([
+            {"role": "assistant", "content": "Hello! I'm your AI study buddy"},
+            {"role": "user", "content": "Hi"},
+        ])
+        assert turns == [("user", "Hi")]
+
+
+class TestChatSessions:
+    """Test prebuilt system prompts and chat session reuse"""
+
+    def test_continuing_conversation_reuses_session(self, service):
+        messages = [{"role": "user", "content": "What is an array?"}]
+        reply = service.chat_completion(messages, user_id=7)
+
+        messages += [{"role": "assistant", "content": reply}, {"role": "user", "content": "And a linked list?"}]
+        service.chat_completion(messages, user_id=7)
+
+        assert service.provider.model.sessions_started == 1
+        assert service.provider.sessions.stats()["reused"] == 1
+
+    def test_edited_history_starts_new_session(self, service):
+        service.chat_completion([{"role": "user", "content": "Hi"}], user_id=7)
+        service.chat_completion([
+            {"role": "user", "content": "Hi"},
+            {"role": "assistant", "content": "something else"},
+            {"role": "user", "content": "Next"},
+        ], user_id=7)
+        assert service.provider.model.sessions_started == 2
+
+    def test_language_prompts_are_prebuilt(self):
+        assert "HINDI" in get_system_prompt("chat", "Hindi")
+        assert get_system_prompt("chat", "klingon") == get_system_prompt("chat")
+
+
+class BrokenProvider(LLMProvider):
+    def __init__(self, error):
+        self.error = error
+        self.name = "broken"
+
+    def generate(self, *args, **kwargs):
+        raise self.error
+
+
+class TestProviders:
+    """Test the provider layer and failover"""
+
+    def test_fake_provider_is_deterministic(self):
+        provider = FakeProvider()
+        assert provider.generate("Explain DBMS") == provider.generate("Explain DBMS")
+        assert provider.generate("Explain DBMS") != provider.generate("Explain OS")
+        assert "".join(provider.stream("Explain DBMS")) == provider.generate("Explain DBMS")
+
+    def test_failover_to_next_provider(self):
+        backup = FakeProvider(response="from backup")
+        chain = FailoverProvider([BrokenProvider(RuntimeError("boom")), backup])
+        assert chain.generate("Hi") == "from backup"
+        assert "".join(chain.stream("Hi")) == "from backup"
+
+    def test_quota_error_puts_provider_on_cooldown(self):
+        broken = BrokenProvider(ResourceExhausted("429 You exceeded your current quota"))
+        chain = FailoverProvider([broken, FakeProvider(response="ok")], cooldown_seconds=60)
+        chain.generate("Hi")
+        chain.generate("Hi")
+        assert chain.stats()["attempts"]["broken"]["calls"] == 1
+        assert "broken" in chain.stats()["cooling_down"]
+
+    def test_slow_provider_times_out(self):
+        chain = FailoverProvider([FakeProvider(latency_ms=500, name="slow"), FakeProvider(response="fast")],
+                                 timeout=0.05)
+        assert chain.generate("Hi") == "fast"
+        assert chain.stats()["attempts"]["slow"]["timeouts"] == 1
+
+    def test_all_providers_failing_raises(self):
+        chain = FailoverProvider([BrokenProvider(RuntimeError("boom"))])
+        with pytest.raises(RuntimeError):
+            chain.generate("Hi")
+
+
+class TestResilience:
+    """Test the adaptive limiter, circuit breaker and degraded-mode fallbacks"""
+
+    def test_limiter_sheds_when_full(self):
+        limiter = AdaptiveLimiter(initial_limit=4, min_limit=4)
+        assert all(limiter.acquire() for _ in range(4))
+        assert not limiter.acquire(timeout=0)
+        assert limiter.stats()["rejected"] == 1
+
+    def test_limiter_backs_off_on_failure(self):
+        limiter = AdaptiveLimiter(initial_limit=20, min_limit=4)
+        limiter.acquire()
+        limiter.release(False)
+        assert limiter.limit < 20
+
+    def test_breaker_opens_and_probes(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+
+        time.sleep(0.06)
+        assert breaker.allow()
+        assert not breaker.allow()  # only one probe at a time
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    def test_open_circuit_fails_fast_without_calling_provider(self, service):
+        service.provider = BrokenProvider(ConnectionError("upstream down"))
+        service.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        service.solve_doubt("What is a mutex?")
+
+        backup = FakeProvider()
+        service.provider = backup
+        result = service.solve_doubt("What is a mutex?")
+        assert "temporarily unavailable" in result["answer"]
+        assert backup.calls == 0
+
+    def test_open_circuit_serves_stale_cache_and_demo_dsa(self, service):
+        service.provider = FakeProvider(response="fresh explanation")
+        service.cache = ResponseCache("", max_entries=8)
+        first = service.explain_topic("Deadlock", "OS", "beginner")
+
+        # Expire everything, then break the upstream
+        for key, (expires_at, value) in list(service.cache._memory.items()):
+            service.cache._memory[key] = (0, value)
+        service.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        service.breaker.record_failure()
+
+        assert service.explain_topic("Deadlock", "OS", "beginner") == first
+        assert service.dsa_hint("Two Sum")["type"] == "demo_solution"
+
+
+class FlakyProvider(LLMProvider):
+    """Raises the given errors in order, then answers"""
+
+    def __init__(self, errors, response="recovered", delays=None):
+        self.errors = list(errors)
+        self.response = response
+        self.delays = list(delays or [])
+        self.name = "flaky"
+        self.calls = 0
+
+    def generate(self, *args, **kwargs):
+        self.calls += 1
+        if self.delays:
+            time.sleep(self.delays.pop(0))
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.response
+
+
+class ApiError(Exception):
+    """SDK error carrying an HTTP status, like openai.APIStatusError"""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ResourceExhausted(Exception):
+    """Same class name as google.api_core.exceptions.ResourceExhausted"""
+
+
+class TestRetriesAndHedging:
+    """Test error classification, jittered retries and hedged requests"""
+
+    def test_classify_error(self):
+        assert classify_error(ResourceExhausted("try later")) == QUOTA
+        assert classify_error(ApiError("You exceeded your current quota", status_code=429)) == QUOTA
+        assert classify_error(ApiError("overloaded", status_code=503)) == TRANSIENT
+        assert classify_error(RuntimeError("prompt has 4290 tokens")) == FATAL
+        assert classify_error(ValueError("bad request id=req_a429x quota")) == FATAL
+        assert classify_error(TimeoutError()) == TRANSIENT
+        assert classify_error(ValueError("prompt blocked")) == FATAL
+        assert classify_error(ServiceUnavailable("circuit open")) == REJECTED
+
+    def test_backoff_is_jittered_and_capped(self):
+        policy = RetryPolicy(max_attempts=5, base_delay=1.0, max_delay=3.0)
+        delays = [policy.backoff(4) for _ in range(50)]
+        assert all(0 <= d <= 3.0 for d in delays)
+        assert len(set(delays)) > 1
+
+    def test_transient_errors_are_retried(self, service):
+        service.retry = RetryPolicy(max_attempts=3, base_delay=0.001)
+        service.provider = FlakyProvider([TimeoutError(), TimeoutError()])
+        result = service.solve_doubt("What is paging?")
+        assert result["answer"] == "recovered"
+        assert service.provider.calls == 3
+
+    def test_quota_and_fatal_errors_are_not_retried(self, service):
+        service.retry = RetryPolicy(max_attempts=3, base_delay=0.001)
+        service.provider = FlakyProvider([ResourceExhausted("quota")])
+        assert service.dsa_hint("Two Sum")["type"] == "demo_solution"
+        assert service.provider.calls == 1
+
+        service.provider = FlakyProvider([ValueError("bad request")])
+        assert "temporarily unavailable" in service.solve_doubt("What is paging?")["answer"]
+        assert service.provider.calls == 1
+
+    def test_hedge_fires_after_p95(self):
+        latencies = LatencyTracker()
+        for _ in range(20):
+            latencies.record("chat", 0.01)
+        hedger = Hedger(ThreadPoolExecutor(4), latencies, ["chat"], min_delay=0.01)
+        provider = FlakyProvider([], response="fast", delays=[1.0, 0])
+
+        started = time.monotonic()
+        assert hedger.call(lambda: provider.generate(), "chat") == "fast"
+        assert time.monotonic() - started < 0.5
+        assert hedger.stats()["hedge_wins"] == 1
+
+    def test_no_hedge_without_history_or_for_other_endpoints(self):
+        latencies = LatencyTracker()
+        hedger = Hedger(ThreadPoolExecutor(4), latencies, ["chat"])
+        assert hedger.delay("chat") is None
+        for _ in range(20):
+            latencies.record("explain_topic", 0.01)
+        assert hedger.delay("explain_topic") is None
+
+
+class TestQuota:
+    """Test the per-key token buckets and load spreading across keys"""
+
+    def test_bucket_refills_over_time(self):
+        bucket = TokenBucket(60, period=1.0)
+        bucket.take(60)
+        assert bucket.wait_time(30) == pytest.approx(0.5, abs=0.05)
+        time.sleep(0.1)
+        assert bucket.wait_time(30) < 0.5
+
+    def test_requests_spread_across_keys(self):
+        first, second = FakeProvider(name="k1"), FakeProvider(name="k2")
+        pool = KeyPool([(first, KeyQuota(rpm=10)), (second, KeyQuota(rpm=10))], queue_timeout=0)
+        for _ in range(10):
+            pool.generate("What is an index?")
+        assert first.calls == 5 and second.calls == 5
+
+    def test_sheds_when_every_key_is_empty(self):
+        provider = FakeProvider()
+        pool = KeyPool([(provider, KeyQuota(rpm=2))], queue_timeout=0.05)
+        pool.generate("one")
+        pool.generate("two")
+        with pytest.raises(QuotaExhausted):
+            pool.generate("three")
+        assert provider.calls == 2
+
+    def test_token_budget_counts_prompt_size(self):
+        pool = KeyPool([(FakeProvider(response="ok"), KeyQuota(tpm=1000))],
+                       queue_timeout=0, expected_output_tokens=100)
+        pool.generate("x" * 2000)  # ~500 input tokens, settled to the real answer size
+        with pytest.raises(QuotaExhausted):
+            pool.generate("x" * 2400)
+
+    def test_upstream_429_drains_the_key(self):
+        quota = KeyQuota(rpm=100)
+        pool = KeyPool([(BrokenProvider(ResourceExhausted("429")), quota)], queue_timeout=0)
+        with pytest.raises(ResourceExhausted):
+            pool.generate("hello")
+        with pytest.raises(QuotaExhausted):
+            pool.generate("hello")
+        assert quota.stats()["upstream_429s"] == 1
+
+    def test_shed_requests_do_not_trip_the_breaker(self, service):
+        service.provider = KeyPool([(FakeProvider(), KeyQuota(rpm=1))], queue_timeout=0)
+        service.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        service.solve_doubt("first")
+        assert service.dsa_hint("Two Sum")["type"] == "demo_solution"
+        assert service.breaker.state == CircuitBreaker.CLOSED
+
+    def test_fatal_errors_do_not_trip_the_breaker(self, service):
+        service.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        limit = service.limiter.limit
+        service.provider = BrokenProvider(ValueError("prompt blocked"))
+        service.solve_doubt("first")
+        assert list(service.chat_completion_stream([{"role": "user", "content": "hi"}], user_id=1))
+        assert service.breaker.state == CircuitBreaker.CLOSED
+        assert service.limiter.limit == limit
+
+        service.provider = BrokenProvider(ConnectionError("upstream down"))
+        service.solve_doubt("second")
+        assert service.breaker.state == CircuitBreaker.OPEN
+
+    def test_build_provider_splits_keys(self):
+        class Settings:
+            ai_providers = "gemini"
+            gemini_api_key = "key-one, key-two"
+            gemini_model = "gemini-test"
+            gemini_rpm_limit = 15
+            gemini_tpm_limit = 0
+            ai_provider_timeout_seconds = 0
+            ai_quota_queue_timeout_seconds = 1
+            ai_quota_expected_output_tokens = 512
+
+        pool = build_provider(Settings).providers[0]
+        assert isinstance(pool, KeyPool)
+        assert [p.name for p, _ in pool.members] == ["gemini:gemini-test#1", "gemini:gemini-test#2"]
+
+
+class QuestionProvider(LLMProvider):
+    """Answers mock test prompts with distinct questions (or repeats a fixed set)"""
+
+    def __init__(self, repeat=False, latency=0.0):
+        self.repeat = repeat
+        self.latency = latency
+        self.name = "questions"
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def generate(self, prompt, *args, **kwargs):
+        with self._lock:
+            self.calls += 1
+            batch = 0 if self.repeat else self.calls
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.latency)
+        with self._lock:
+            self.in_flight -= 1
+        count = int(re.search(r"EXACTLY (\d+)", prompt).group(1))
+        questions = [
+            {"id": i + 1, "question": " ".join(hashlib.md5(f"{batch}-{i}-{j}".encode()).hexdigest()[:6] for j in range(6)),
+             "options": ["1", "2", "3", "4"], "correctAnswer": 1, "explanation": "..."}
+            for i in range(count)
+        ]
+        return f"```json\n{json.dumps({'questions': questions})}\n```"
+
+
+class TestMockTests:
+    """Test sharded mock test generation"""
+
+    def test_large_test_is_sharded_concurrently(self, service):
+        service.provider = QuestionProvider(latency=0.2)
+        result = service.generate_mock_test("Aptitude", "Trains", "medium", 30)
+        assert service.provider.calls == 6
+        assert service.provider.max_in_flight > 1
+        assert [q["id"] for q in result["questions"]] == list(range(1, 31))
+        assert result["totalQuestions"] == 30
+
+    def test_duplicates_are_dropped_not_padded(self, service):
+        service.provider = QuestionProvider(repeat=True)
+        result = service.generate_mock_test("Aptitude", "Trains", "medium", 10)
+        assert result["totalQuestions"] == 5
+        assert not any(q["question"].startswith("Sample") for q in result["questions"])
+
+    def test_invalid_questions_are_dropped(self):
+        response = json.dumps({"questions": [
+            {"question": "Valid?", "options": ["a", "b", "c", "d"], "correctAnswer": "2"},
+            {"question": "Three options", "options": ["a", "b", "c"], "correctAnswer": 0},
+            {"question": "", "options": ["a", "b", "c", "d"], "correctAnswer": 0},
+        ]})
+        questions = parse_questions(response)
+        assert len(questions) == 1 and questions[0]["correctAnswer"] == 2
+
+    def test_near_duplicates_are_detected(self):
+        questions = [{"question": "A train 100 m long crosses a pole in 10 s. Find its speed."},
+                     {"question": "a train 100 m long crosses a pole in 10 s - find its speed?"},
+                     {"question": "A train 150 m long crosses a pole in 15 s. Find its speed."},
+                     {"question": "Find the speed of a boat in still water."}]
+        assert [q["question"][:11] for q in dedupe_questions(questions)] == [
+            "A train 100", "A train 150", "Find the sp"]
+
+    def test_total_failure_reports_error(self, service):
+        service.provider = BrokenProvider(ValueError("bad request"))
+        result = service.generate_mock_test("Aptitude", "Trains", "medium", 5)
+        assert result["questions"] == []
+        assert "temporarily unavailable" in result["error"]
+
+
+class TestQuestionBank:
+    """Test serving mock tests from the persistent question bank"""
+
+    def test_generated_questions_are_stored_and_served(self, service):
+        service.provider = QuestionProvider()
+        first = service.generate_mock_test("Aptitude", "Trains", "medium", 10)
+        calls = service.provider.calls
+
+        second = service.generate_mock_test(" aptitude", "TRAINS", "Medium", 5)
+        assert service.provider.calls == calls  # no LLM call
+        assert second["totalQuestions"] == 5
+        assert {q["question"] for q in second["questions"]} <= {q["question"] for q in first["questions"]}
+        assert [q["id"] for q in second["questions"]] == [1, 2, 3, 4, 5]
+
+    def test_pool_serves_only_with_margin_over_the_test(self, service):
+        service.provider = QuestionProvider()
+        service.question_bank.serve_multiple = 2
+        service.generate_mock_test("Aptitude", "Trains", "medium", 10)
+        calls = service.provider.calls
+
+        service.generate_mock_test("Aptitude", "Trains", "medium", 6)  # 10 < 2 * 6: generated
+        assert service.provider.calls > calls
+        assert service.question_bank.stats()["misses"] == 2
+        assert service.question_bank.stats()["stored"] == 16
+
+        calls = service.provider.calls
+        service.generate_mock_test("Aptitude", "Trains", "medium", 8)  # 16 == 2 * 8: served
+        assert service.provider.calls == calls
+        assert service.question_bank.stats()["served"] == 1
+
+    def test_duplicates_are_not_stored_twice(self, service):
+        service.provider = QuestionProvider(repeat=True)
+        service.generate_mock_test("Aptitude", "Trains", "medium", 5)
+        assert service.question_bank.add("Aptitude", "Trains", "medium",
+                                         service.generate_mock_test("Aptitude", "Trains", "medium", 5)["questions"]) == 0
+
+    def test_small_pool_is_refilled_in_background(self, service):
+        service.provider = QuestionProvider()
+        service.question_bank.min_pool = 20
+        service.question_bank.refill_size = 20
+        service.generate_mock_test("Aptitude", "Trains", "medium", 5)
+        assert service.question_bank.stats()["refills"] == 0  # the miss was generated inline
+        calls = service.provider.calls
+        service.generate_mock_test("Aptitude", "Trains", "medium", 5)
+
+        deadline = time.monotonic() + 5
+        while service.question_bank.stats()["refilling"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert service.question_bank.stats()["stored"] == 25
+        assert service.question_bank.stats()["refills"] == 1
+        assert service.provider.calls == calls + 4  # only the refill's shards
+
+
+class GatedQuestionStream(QuestionProvider):
+    """Streams each question object separately, holding back all but the first until released"""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+        self.finished = False
+
+    def stream(self, prompt, *args, **kwargs):
+        text = self.generate(prompt)
+        head, _, rest = text.partition('"questions": [')
+        yield head + '"questions": ['
+        pieces = rest.split("}, {")
+        for index, piece in enumerate(pieces):
+            yield ("{" if index else "") + piece + ("}" if index < len(pieces) - 1 else "")
+            if index == 0:
+                self.release.wait(5)
+            if index < len(pieces) - 1:
+                yield ", "
+        self.finished = True
+
+
+class TestMockTestStreaming:
+    """Test incremental parsing and the streaming mock test generator"""
+
+    def test_parser_emits_questions_across_chunk_boundaries(self):
+        doc = 'Here you go:\n```json\n' + json.dumps({"questions": [
+            {"id": 1, "question": 'Which brace "}" closes {this}?', "options": ["a", "b", "c", "d"], "correctAnswer": 1},
+            {"id": 2, "question": "Second", "options": ["a", "b", "c", "d"], "correctAnswer": 0},
+        ]}, indent=2) + "\n```"
+        parser = QuestionStreamParser()
+        questions = []
+        for start in range(0, len(doc), 3):
+            questions.extend(parser.feed(doc[start:start + 3]))
+        assert [q["question"] for q in questions] == ['Which brace "}" closes {this}?', "Second"]
+
+    def test_parser_recovers_from_truncated_output(self):
+        doc = json.dumps({"questions": [
+            {"question": "Complete", "options": ["a", "b", "c", "d"], "correctAnswer": 2},
+            {"question": "Cut off", "options": ["a", "b", "c", "d"], "correctAnswer": 0},
+        ]})
+        questions = QuestionStreamParser().feed(doc[:-30])
+        assert [q["question"] for q in questions] == ["Complete"]
+
+    def test_first_question_arrives_before_generation_finishes(self, service):
+        provider = service.provider = GatedQuestionStream()
+        stream = service.generate_mock_test_stream("Aptitude", "Trains", "medium", 5)
+        first = next(stream)
+        assert first["id"] == 1
+        assert not provider.finished
+        provider.release.set()
+        rest = list(stream)
+        assert [q["id"] for q in rest] == [2, 3, 4, 5]
+        assert provider.finished
+
+    def test_streamed_questions_are_banked(self, service):
+        service.provider = QuestionProvider()
+        streamed = list(service.generate_mock_test_stream("Aptitude", "Trains", "medium", 10))
+        calls = service.provider.calls
+        assert len(streamed) == 10
+        assert service.generate_mock_test("Aptitude", "Trains", "medium", 10)["totalQuestions"] == 10
+        assert service.provider.calls == calls
+
+
+class TestDemoSolutionLibrary:
+    """Test the offline DSA solution library"""
+
+    def test_aliases_match_bundled_solutions(self):
+        library = DemoSolutionLibrary()
+        assert library.find("Pascal's Triangle").startswith("# 🔺 Pascal's Triangle")
+        assert library.find("Set Matrix Zeroes").startswith("# 🚀 Set Matrix Zeroes")
+        assert library.find("two sum problem").startswith("# 🎯 Two Sum")
+        assert library.find("Check balanced brackets").startswith("# 🔤 Valid Parentheses")
+        assert library.find("Spiral matrix traversal") is None
+
+    def test_index_is_built_lazily_and_ranked(self, tmp_path):
+        (tmp_path / "_fallback.md").write_text("Nothing for {problem}. Try:\n{examples}\n", encoding="utf-8")
+        (tmp_path / "max_subarray.md").write_text(
+            "---\ntitle: Maximum Subarray\nsummary: Kadane\naliases: subarray, maximum subarray\n---\nKadane body\n",
+            encoding="utf-8")
+        (tmp_path / "subarray_sum.md").write_text(
+            "---\ntitle: Subarray Sum Equals K\naliases: subarray, subarray sum\nkeywords: k\n---\nPrefix sums body\n",
+            encoding="utf-8")
+        library = DemoSolutionLibrary(str(tmp_path))
+        assert library._entries is None
+
+        assert library.find("Maximum subarray") == "Kadane body\n"
+        assert library.find("Count subarray sum equals k") == "Prefix sums body\n"
+        assert [name for _, name in library.search("subarray")] == ["max_subarray", "subarray_sum"]
+        assert library.fallback("Graph coloring") == (
+            "Nothing for Graph coloring. Try:\n"
+            "- ✅ **Maximum Subarray** - Kadane\n"
+            "- ✅ **Subarray Sum Equals K** - Complete solution\n")
+
+    def test_crlf_files_are_read_correctly(self, tmp_path):
+        (tmp_path / "two_sum.md").write_bytes(
+            "---\r\ntitle: Two Sum ✅\r\naliases: two sum\r\n---\r\nHash map body\r\nline two\r\n".encode("utf-8"))
+        library = DemoSolutionLibrary(str(tmp_path))
+        assert library.find("two sum") == "Hash map body\nline two\n"
+
+
+class QuotaModel(FakeModel):
+    """Answers `allowed` calls, then reports an exhausted upstream quota"""
+
+    def __init__(self, allowed):
+        super().__init__()
+        self.allowed = allowed
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        if self.calls >= self.allowed:
+            self.calls += 1
+            raise ResourceExhausted("429 quota exceeded")
+        return super().generate_content(prompt, generation_config, stream)
+
+
+class TestCacheWarming:
+    """Test the off-peak cache pre-warm job"""
+
+    def make_warmer(self, service, configured=None, **kwargs):
+        return CacheWarmer(service, configured or {}, pause=0, **kwargs)
+
+    def test_popularity_ranking_and_decay(self):
+        tracker = PopularityTracker()
+        for prompt, count in [("dbms", 5), ("os", 3), ("cn", 1)]:
+            for _ in range(count):
+                tracker.record("explain_topic", prompt)
+        assert tracker.top("explain_topic", 5) == ["dbms", "os"]
+        assert tracker.top("explain_topic", 1) == ["dbms"]
+
+        tracker.decay()
+        assert tracker.top("explain_topic", 5) == ["dbms"]
+        assert tracker.stats()["tracked_prompts"] == 2
+
+    def test_warmed_inputs_are_served_without_upstream_calls(self, service):
+        service.explain_topic("Deadlock", "OS", "beginner")
+        service.explain_topic("Deadlock", "OS", "beginner")
+        service.solve_doubt("What is a deadlock?")  # not cacheable, never tracked
+        service.cache = ResponseCache("", max_entries=8)  # popular entry was evicted
+        service.provider.model = FakeModel()
+
+        warmer = self.make_warmer(service, {"interview_prep": [["Amazon", "SDE"]]})
+        summary = warmer.run()
+        assert summary["warmed"] == 2 and summary["stopped"] is None
+        assert service.provider.model.calls == 2
+
+        service.interview_prep("Amazon", "SDE")
+        service.explain_topic("Deadlock", "OS", "beginner")
+        assert service.provider.model.calls == 2
+
+    def test_fresh_entries_are_not_regenerated(self, service):
+        warmer = self.make_warmer(service, {"interview_prep": [["Amazon", "SDE"]]}, refresh_within=3600)
+        warmer.run()
+        assert warmer.run()["fresh"] == 1
+        assert service.provider.model.calls == 1
+
+        warmer.refresh_within = 30 * 24 * 3600  # everything expires within the window
+        assert warmer.run()["warmed"] == 1
+        assert service.provider.model.calls == 2
+
+    def test_stops_when_upstream_quota_runs_out(self, service):
+        service.provider.model = QuotaModel(allowed=2)
+        companies = [[company, "SDE"] for company in ["TCS", "Infosys", "Wipro", "Amazon", "Google"]]
+        summary = self.make_warmer(service, {"interview_prep": companies}).run()
+        assert summary["warmed"] == 2 and summary["failed"] == 1
+        assert summary["stopped"].startswith("upstream busy")
+        assert service.provider.model.calls == 3
+
+    def test_call_budget_and_window(self, service):
+        companies = [[company, "SDE"] for company in ["TCS", "Infosys", "Wipro"]]
+        warmer = self.make_warmer(service, {"interview_prep": companies}, max_calls=2, hours="23-2")
+        assert warmer.run()["stopped"] == "call budget used"
+        assert service.provider.model.calls == 2
+
+        assert warmer.in_window(datetime(2024, 1, 1, 23)) and warmer.in_window(datetime(2024, 1, 1, 1))
+        assert not warmer.in_window(datetime(2024, 1, 1, 12))
+
+
+class TestCallMetrics:
+    """Test per-call AI instrumentation"""
+
+    def test_histogram_percentiles(self):
+        histogram = Histogram(buckets=(1, 2, 4))
+        for value in [0.5] * 90 + [3] * 9 + [10]:
+            histogram.observe(value)
+        assert histogram.percentile(50) == 1
+        assert histogram.percentile(95) == 4
+        assert histogram.percentile(100) == float("inf")
+        assert histogram.snapshot()["buckets"] == {"le_1": 90, "le_2": 0, "le_4": 9, "inf": 1}
+
+    def test_model_prices(self):
+        assert model_price("openai:gpt-4o-mini") == MODEL_PRICES["gpt-4o-mini"]
+        assert model_price("gpt-4o-2024-08-06") == MODEL_PRICES["gpt-4o"]
+        assert model_price("fake") is None
+
+    def test_calls_and_cache_lookups_are_recorded(self, service):
+        service.explain_topic("Deadlock", "OS", "beginner")
+        service.explain_topic("Deadlock", "OS", "beginner")
+        service.solve_doubt("What is a deadlock?")
+
+        endpoints = service.metrics.snapshot()["endpoints"]
+        assert endpoints["explain_topic"]["calls"] == 1
+        assert endpoints["explain_topic"]["cache"] == {"hit": 1, "miss": 1, "stale": 0}
+        assert endpoints["solve_doubt"]["cache"] == {"hit": 0, "miss": 0, "stale": 0}
+        assert endpoints["solve_doubt"]["output_tokens"] > 0
+        assert endpoints["solve_doubt"]["latency_seconds"]["count"] == 1
+
+    def test_provider_usage_and_cost(self, tmp_path):
+        log = tmp_path / "calls.jsonl"
+        metrics = AICallMetrics(str(log))
+        answer = Completion("Paris", input_tokens=1000, output_tokens=500, finish_reason="stop",
+                            model="openai:gpt-4o-mini")
+        metrics.record_call("chat", 0.3, "Capital of France?", answer)
+        metrics.record_call("chat", 2.5, "Capital of Spain?", None, error_class=QUOTA, model="openai:gpt-4o-mini")
+
+        chat = metrics.snapshot()["endpoints"]["chat"]
+        assert chat["input_tokens"] == 1000 + estimate_tokens("Capital of Spain?")
+        assert chat["finish_reasons"] == {"stop": 1}
+        assert chat["errors"] == {QUOTA: 1}
+        assert chat["estimated_token_calls"] == 1
+        assert chat["cost_usd"] == pytest.approx((1000 * 0.15 + 500 * 0.60 + estimate_tokens("Capital of Spain?") * 0.15) / 1e6, abs=1e-6)
+
+        records = [json.loads(line) for line in log.read_text().splitlines()]
+        assert [record["error_class"] for record in records] == [None, QUOTA]
+        assert records[0]["output_tokens"] == 500 and not records[0]["tokens_estimated"]
+
+    def test_failed_and_streamed_calls(self, service):
+        class BrokenModel:
+            def generate_content(self, *args, **kwargs):
+                raise ValueError("bad request")
+
+        service.provider.model = BrokenModel()
+        service.solve_doubt("What is a deadlock?")
+        service.provider.model = FakeModel("streamed answer")
+        assert "".join(service.chat_completion_stream([{"role": "user", "content": "hi"}], user_id=1))
+
+        endpoints = service.metrics.snapshot()["endpoints"]
+        assert endpoints["solve_doubt"]["errors"] == {FATAL: 1}
+        assert endpoints["chat"]["streamed"] == 1
+        assert endpoints["chat"]["response_chars"] == len("streamed answer ")
+
+    def test_streamed_call_is_priced_as_the_serving_provider(self, service):
+        service.provider = FailoverProvider([FakeProvider(name="gemini:gemini-1.5-flash"),
+                                             FakeProvider(name="anthropic:claude-3-opus")])
+        assert "".join(service.chat_completion_stream([{"role": "user", "content": "hi"}], user_id=1))
+
+        chat = service.metrics.snapshot()["endpoints"]["chat"]
+        flash = MODEL_PRICES["gemini-1.5-flash"]
+        expected = (chat["input_tokens"] * flash[0] + chat["output_tokens"] * flash[1]) / 1e6
+        assert chat["unpriced_calls"] == 0
+        assert chat["cost_usd"] == pytest.approx(expected, abs=1e-6)
+
+
+class TestGenerationProfiles:
+    """Test per-endpoint generation profiles"""
+
+    def test_profiles_merge_defaults_and_overrides(self):
+        profiles = GenerationProfiles({"default": {"top_k": 20}, "chat": {"max_output_tokens": 600}, "custom": {"tier": "fast"}})
+        assert profiles.config("chat")["max_output_tokens"] == 600
+        assert profiles.config("chat")["top_k"] == 20
+        assert profiles.config("generate_notes")["max_output_tokens"] == 4096
+        assert profiles.config("unknown") == profiles.config()
+        assert profiles.tier("custom") == "fast" and profiles.tier("generate_notes") == "standard"
+        assert "tier" not in profiles.config("chat")
+
+    def test_endpoint_profile_reaches_the_provider(self, service):
+        service.chat_completion([{"role": "user", "content": "hi"}])
+        assert service.provider.model.last_config["max_output_tokens"] == 1024
+
+        service.generate_notes("DBMS", "detailed")
+        config = service.provider.model.last_config
+        assert config["max_output_tokens"] == 4096
+        # google-generativeai 0.3 has no response_mime_type; unsupported keys are dropped
+        service.generate_mock_test("Aptitude", "Percentages", "easy", 1)
+        assert set(service.provider.model.last_config) <= service.provider.config_keys
+
+    def test_cache_key_depends_on_profile(self, service):
+        service.explain_topic("Deadlock", "OS", "beginner")
+        service.profiles = GenerationProfiles({"explain_topic": {"max_output_tokens": 512}})
+        service.explain_topic("Deadlock", "OS", "beginner")
+        assert service.provider.model.calls == 2
+
+
+class TestModelRouting:
+    """Test model tier routing"""
+
+    def test_routing_rules(self):
+        router = ModelRouter(GenerationProfiles(), ["fast", "large"], fast_max_prompt_tokens=50)
+        assert router.route("chat", 10) == "fast"
+        assert router.route("chat", 400) == "standard"
+        assert router.route("dsa_hint", 100, plan="free") == "standard"
+        assert router.route("dsa_hint", 100, plan="pro") == "large"
+        assert router.route("dsa_hint", 100) == "standard"  # anonymous requests stay off the large tier
+        assert router.route("explain_topic", 100) == "standard"
+        assert router.stats()["decisions"]["chat"] == {"fast:profile": 1, "standard:long prompt": 1}
+
+        unconfigured = ModelRouter(GenerationProfiles(), [])
+        assert unconfigured.route("chat", 10) == "standard"
+        assert unconfigured.stats()["decisions"]["chat"] == {"standard:tier not configured": 1}
+
+    def test_slow_tier_steps_down(self):
+        router = ModelRouter(GenerationProfiles(), ["fast", "large"], slow_p95_seconds=5)
+        for _ in range(20):
+            router.record("large", 12.0)
+        assert router.route("dsa_hint", 100, plan="pro") == "standard"
+        for _ in range(20):
+            router.record("standard", 20.0)
+        assert router.route("dsa_hint", 100, plan="pro") == "large"  # the tier below is even slower
+
+    def test_requests_reach_the_routed_tier(self, service):
+        lite, large = FakeProvider(name="lite"), FakeProvider(name="large")
+        service.tier_providers = {"fast": lite, "large": large}
+        service.router = ModelRouter(service.profiles, service.tier_providers)
+        service.chat_completion([{"role": "user", "content": "hi"}], user_id=1, plan="free")
+        service.dsa_hint("Two Sum", plan="pro")
+        service.dsa_hint("Three Sum")  # anonymous route: standard tier
+        service.explain_topic("Deadlock", "OS", "beginner")
+        assert lite.calls == 1 and large.calls == 1
+        assert service.provider.model.calls == 2
+        assert set(service.metrics.snapshot()["tiers"]) == {"fast", "large", "standard"}
+
+    def test_tier_chains_share_key_pools(self):
+        class Settings:
+            ai_providers = "gemini"
+            gemini_api_key = "key-one"
+            gemini_model = "gemini-test"
+            gemini_fast_model = "gemini-lite"
+            gemini_large_model = ""
+            gemini_rpm_limit = 15
+            gemini_tpm_limit = 0
+            ai_provider_timeout_seconds = 0
+            ai_quota_queue_timeout_seconds = 1
+            ai_quota_expected_output_tokens = 512
+
+        shared = {}
+        standard = build_provider(Settings, "standard", shared)
+        assert build_provider(Settings, "fast", shared).providers[0].name == "gemini:gemini-lite"
+        assert build_provider(Settings, "large", shared).providers[0] is standard.providers[0]
+        assert has_tier(Settings, "fast") and not has_tier(Settings, "large")
@@ -6,9 +6,23 @@ Run with: pytest test_endpoints.py -v
 import pytest
 from fastapi.testclient import TestClient
 from main import app
-from database import Base, engine
+from database import Base, engine, SessionLocal
 from sqlalchemy.orm import Session
+from ai_service import ResponseCache, get_ai_service
+from llm_providers import FakeProvider
+from test_ai_service import QuestionProvider
+from config import settings
+from history_writer import ChatHistoryWriter
+from history_purger import HistoryPurger
+from conversation_store import conversation_store
+from models import ChatHistory, PlanType, User
+from routing import ModelRouter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from datetime import datetime, timedelta
 import json
+import threading
+import time
 
 # Create test client
 client = TestClient(app)
@@ -31,6 +45,52 @@ user_token = None
 admin_token = None
 
 
+@pytest.fixture(scope="module", autouse=True)
+def isolated_ai_cache(tmp_path_factory):
+    """Keep the shared service's response cache in a throwaway file, not ai_cache.db"""
+    path = str(tmp_path_factory.mktemp("ai_cache") / "cache.db")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(settings, "ai_cache_path", path)
+        # The shared service may have been built before this module ran
+        patch.setattr(get_ai_service(), "cache", ResponseCache(path, settings.ai_cache_max_entries))
+        yield
+
+
+@pytest.fixture
+def use_provider(monkeypatch):
+    """Serve AI calls from one given provider only, whatever providers and keys the environment configures"""
+    service = get_ai_service()
+
+    def use(provider):
+        monkeypatch.setattr(settings, "ai_providers", "fake")
+        monkeypatch.setattr(service, "provider", provider)
+        monkeypatch.setattr(service, "tier_providers", {})
+        monkeypatch.setattr(service, "use_ai", True)
+        return provider
+
+    return use
+
+
+class InFlightProvider(FakeProvider):
+    """FakeProvider that records the largest number of calls running at the same time"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._flight_lock = threading.Lock()
+
+    def generate(self, prompt, system=None, history=None, config=None, session_key=None):
+        with self._flight_lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return super().generate(prompt, system, history, config, session_key)
+        finally:
+            with self._flight_lock:
+                self.in_flight -= 1
+
+
 class TestHealthEndpoints:
     """Test health and status endpoints"""
     
@@ -136,6 +196,9 @@ class TestChatEndpoints:
         data = response.json()
         assert "history" in data
         assert isinstance(data["history"], list)
+        # Messages written behind the chat request are visible right away
+        assert [msg["role"] for msg in data["history"][-2:]] == ["user", "assistant"]
+        assert data["history"][-2]["content"] == "What is DSA?"
     
     def test_chat_history_clear(self):
         """Test clearing chat history"""
@@ -143,13 +206,183 @@ class TestChatEndpoints:
         response = client.delete("/api/chat/history", headers=headers)
         assert response.status_code == 200
         assert "message" in response.json()
+    
+    def test_learning_batch(self):
+        """Test batch learning endpoint streams one NDJSON line per item"""
+        response = client.post("/api/learning/batch", json={
+            "items": [
+                {"type": "explain", "topic": "Deadlock", "subject": "OS", "level": "beginner"},
+                {"type": "notes", "topic": "Normalization", "format": "summary"},
+                {"type": "doubt", "question": "What is a mutex?"}
+            ]
+        })
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert sorted(line["index"] for line in lines) == [0, 1, 2]
+        assert all("result" in line for line in lines)
+    
+    def test_learning_batch_runs_items_concurrently(self, use_provider):
+        """Test batch items overlap instead of running one after another"""
+        provider = use_provider(InFlightProvider(latency_ms=100))
+        response = client.post("/api/learning/batch", json={
+            "items": [{"type": "doubt", "question": f"Batch question {i}"} for i in range(5)]
+        })
+        assert response.status_code == 200
+        assert len(response.text.splitlines()) == 5
+        assert provider.max_in_flight > 1
+    
+    def test_learning_batch_rejects_unknown_type(self):
+        """Test batch items must have a known type"""
+        response = client.post("/api/learning/batch", json={"items": [{"type": "essay", "topic": "x"}]})
+        assert response.status_code == 422
+
+
+class RecordingProvider(FakeProvider):
+    """FakeProvider that remembers the history sent with each request"""
+
+    def __init__(self):
+        super().__init__()
+        self.histories = []
+
+    def generate(self, prompt, system=None, history=None, config=None, session_key=None):
+        self.histories.append(list(history or []) + [("user", prompt)])
+        return super().generate(prompt, system, history, config, session_key)
+
+
+class TestServerConversations:
+    """Test chat with server-held conversation state"""
+
+    @pytest.fixture
+    def provider(self, use_provider):
+        return use_provider(RecordingProvider())
+
+    def send(self, **body):
+        headers = {"Authorization": f"Bearer {user_token}"}
+        response = client.post("/api/chat", json=body, headers=headers)
+        assert response.status_code == 200
+        return response.json()
+
+    def test_client_sends_only_the_new_message(self, provider):
+        first = self.send(message="What is a stack?")
+        conversation_id = first["conversation_id"]
+        self.send(message="And a queue?", conversation_id=conversation_id)
+
+        assert provider.histories[-1] == [
+            ("user", "What is a stack?"),
+            ("assistant", first["response"]),
+            ("user", "And a queue?"),
+        ]
+
+    def test_conversation_reloads_from_database(self, provider):
+        conversation_id = self.send(message="What is a heap?")["conversation_id"]
+        self.send(message="Min or max?", conversation_id=conversation_id)
+        conversation_store._buffers.clear()  # e.g. another worker, or evicted
+
+        misses = conversation_store.stats()["misses"]
+        self.send(message="Show an example", conversation_id=conversation_id)
+        assert conversation_store.stats()["misses"] == misses + 1
+        assert [turn[1] for turn in provider.histories[-1] if turn[0] == "user"] == [
+            "What is a heap?", "Min or max?", "Show an example"
+        ]
+
+    def test_stream_announces_conversation_id(self, provider):
+        headers = {"Authorization": f"Bearer {user_token}"}
+        response = client.post("/api/chat/stream", json={"message": "Hi"}, headers=headers)
+        events = [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+        assert "conversation_id" in events[0] and events[-1] == {"done": True}
+
+    def test_request_needs_messages_or_message(self):
+        headers = {"Authorization": f"Bearer {user_token}"}
+        response = client.post("/api/chat", json={"conversation_id": "abc"}, headers=headers)
+        assert response.status_code == 422
+
+
+class TestChatHistoryPagination:
+    """Test cursor-based paging and delta reads of chat history"""
+
+    def history(self, **params):
+        headers = {"Authorization": f"Bearer {user_token}"}
+        response = client.get("/api/chat/history", params=params, headers=headers)
+        assert response.status_code == 200
+        return response.json()
+
+    def test_pages_backwards_and_polls_for_new_messages(self):
+        headers = {"Authorization": f"Bearer {user_token}"}
+        client.delete("/api/chat/history", headers=headers)
+        for i in range(3):
+            client.post("/api/chat", json={"messages": [{"role": "user", "content": f"Page question {i}"}]},
+                        headers=headers)
+
+        latest = self.history(limit=4)
+        assert latest["has_more"] is True
+        assert latest["history"][-2]["content"] == "Page question 2"
+        assert [msg["id"] for msg in latest["history"]] == sorted(msg["id"] for msg in latest["history"])
+
+        older = self.history(limit=4, before=latest["oldest_id"])
+        assert older["has_more"] is False
+        assert [msg["content"] for msg in older["history"] if msg["role"] == "user"] == ["Page question 0"]
+        seen = {msg["id"] for msg in older["history"]} | {msg["id"] for msg in latest["history"]}
+        assert len(seen) == 6
+
+        assert self.history(since=latest["newest_id"])["history"] == []
+        client.post("/api/chat", json={"messages": [{"role": "user", "content": "Page question 3"}]},
+                    headers=headers)
+        delta = self.history(since=latest["newest_id"])
+        assert [msg["role"] for msg in delta["history"]] == ["user", "assistant"]
+        assert delta["history"][0]["content"] == "Page question 3"
+
+    def test_unknown_cursor_is_rejected(self):
+        headers = {"Authorization": f"Bearer {user_token}"}
+        response = client.get("/api/chat/history", params={"before": 10 ** 9}, headers=headers)
+        assert response.status_code == 404
+        response = client.get("/api/chat/history", params={"before": 1, "since": 1}, headers=headers)
+        assert response.status_code == 400
+
+
+class TestResumableChatStream:
+    """Test SSE chat streams with event ids, replay and coalescing"""
+
+    @staticmethod
+    def frames(text):
+        return [frame for frame in text.split("\n\n") if frame.strip()]
+
+    def test_stream_events_carry_ids_and_can_be_replayed(self):
+        headers = {"Authorization": f"Bearer {user_token}"}
+        response = client.post("/api/chat/stream", json={"messages": [{"role": "user", "content": "Explain recursion"}]},
+                                headers=headers)
+        assert response.status_code == 200
+        frames = self.frames(response.text)
+        stream_id = json.loads(frames[0].split("data: ", 1)[1])["stream_id"]
+        assert [frame.splitlines()[0] for frame in frames] == [f"id: {stream_id}:{seq}" for seq in range(1, len(frames) + 1)]
+
+        # Reconnect after the second event: only the tail is sent again
+        replay = client.get(f"/api/chat/stream/{stream_id}", headers=dict(headers, **{"Last-Event-ID": f"{stream_id}:2"}))
+        assert replay.status_code == 200
+        assert self.frames(replay.text) == frames[2:]
+
+    def test_resume_unknown_stream(self):
+        headers = {"Authorization": f"Bearer {user_token}"}
+        response = client.get("/api/chat/stream/does-not-exist", headers=headers)
+        assert response.status_code == 404
+
+    def test_small_chunks_are_coalesced(self, use_provider):
+        use_provider(FakeProvider())
+        headers = {"Authorization": f"Bearer {user_token}"}
+        response = client.post("/api/chat/stream",
+                               json={"messages": [{"role": "user", "content": "Coalesce " + "word " * 30}]},
+                               headers=headers)
+        events = [json.loads(frame.split("data: ", 1)[1]) for frame in self.frames(response.text)]
+        chunks = [event["chunk"] for event in events if "chunk" in event]
+        assert events[-1] == {"done": True}
+        assert len(chunks) < len("".join(chunks).split())
 
 
 class TestExamEndpoints:
     """Test exam preparation endpoints"""
     
-    def test_mock_test_generation(self):
+    def test_mock_test_generation(self, use_provider):
         """Test mock test generation"""
+        use_provider(QuestionProvider())
         headers = {"Authorization": f"Bearer {user_token}"}
         response = client.post("/api/exam/mock-test",
             json={
@@ -163,7 +396,35 @@ class TestExamEndpoints:
         assert response.status_code == 200
         data = response.json()
         assert "questions" in data
-        assert len(data["questions"]) > 0
+        assert len(data["questions"]) == 5
+    
+    def test_mock_test_stream(self, use_provider):
+        """Test streaming mock test generation"""
+        use_provider(QuestionProvider())
+        headers = {"Authorization": f"Bearer {user_token}"}
+        response = client.post("/api/exam/mock-test/stream",
+            json={
+                "subject": "Data Structures",
+                "topic": "Arrays",
+                "difficulty": "medium",
+                "numQuestions": 3
+            },
+            headers=headers
+        )
+        assert response.status_code == 200
+        events = [json.loads(line[6:]) for line in response.text.splitlines() if line.startswith("data: ")]
+        assert len([event for event in events if "question" in event]) == 3
+        assert events[-1]["done"] is True
+    
+    def test_mock_test_question_count_is_bounded(self):
+        """Test out-of-range question counts are rejected before any generation"""
+        headers = {"Authorization": f"Bearer {user_token}"}
+        for count in (-1, 0, 51):
+            response = client.post("/api/exam/mock-test",
+                json={"subject": "DBMS", "topic": "Joins", "difficulty": "easy", "numQuestions": count},
+                headers=headers
+            )
+            assert response.status_code == 422
     
     def test_solve_pyq(self):
         """Test previous year question solving"""
@@ -224,7 +485,33 @@ class TestCodingEndpoints:
         assert response.status_code == 200
         data = response.json()
         assert "solution" in data
-    
+
+    def test_dsa_hint_routes_premium_users_to_large_model(self, use_provider, monkeypatch):
+        """A paying user's hint is served by the large tier, an anonymous one by the standard tier"""
+        standard = use_provider(FakeProvider(name="standard"))
+        large = FakeProvider(name="large")
+        service = get_ai_service()
+        monkeypatch.setattr(service, "tier_providers", {"large": large})
+        monkeypatch.setattr(service, "router", ModelRouter(service.profiles, service.tier_providers))
+
+        response = client.post("/api/auth/register", json={
+            "email": "premium@codecampus.ai", "password": "Premium@123456", "name": "Premium User"
+        })
+        token = response.json()["access_token"]
+        db = SessionLocal()
+        db.query(User).filter(User.email == "premium@codecampus.ai").update({User.plan: PlanType.PRO})
+        db.commit()
+        db.close()
+
+        response = client.post("/api/coding/dsa-hint", json={"problem": "Premium tier routing problem"},
+                               headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+        assert large.calls == 1 and standard.calls == 0
+
+        response = client.post("/api/coding/dsa-hint", json={"problem": "Anonymous tier routing problem"})
+        assert response.status_code == 200
+        assert large.calls == 1 and standard.calls == 1
+
     def test_project_guidance(self):
         """Test project guidance"""
         headers = {"Authorization": f"Bearer {user_token}"}
@@ -338,7 +625,162 @@ class TestErrorHandling:
         assert response.status_code == 422
 
 
+class TestChatHistoryWriter:
+    """Test the write-behind chat history writer"""
+
+    @pytest.fixture
+    def make_writer(self, tmp_path):
+        db_engine = create_engine(f"sqlite:///{tmp_path / 'history.db'}")
+        Base.metadata.create_all(bind=db_engine)
+        sessions = sessionmaker(bind=db_engine)
+        gate = threading.Event()
+        writers = []
+
+        def factory():
+            gate.wait(5)
+            return sessions()
+
+        def make(**kwargs):
+            writer = ChatHistoryWriter(factory, **kwargs)
+            writers.append(writer)
+            return writer
+
+        make.gate = gate
+        make.rows = lambda: sessions().query(ChatHistory).order_by(ChatHistory.timestamp).all()
+        yield make
+        gate.set()
+        for writer in writers:
+            writer.stop()
+
+    def wait_until_taken(self, writer):
+        deadline = time.time() + 2
+        while writer.stats()["pending"] and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_rows_are_written_in_batches(self, make_writer):
+        writer = make_writer(batch_size=50)
+        writer.submit([ChatHistoryWriter.row(1, "user", "message 0")])
+        self.wait_until_taken(writer)  # the writer now waits on the database
+        writer.submit([ChatHistoryWriter.row(1, "user", f"message {i}") for i in range(1, 120)])
+        make_writer.gate.set()
+
+        assert writer.flush()
+        stats = writer.stats()
+        assert stats["written"] == 120 and stats["batches"] == 4 and stats["max_batch"] == 50
+        assert [row.content for row in make_writer.rows()] == [f"message {i}" for i in range(120)]
+
+    def test_flush_user_waits_only_for_that_users_rows(self, make_writer):
+        writer = make_writer()
+        writer.submit([ChatHistoryWriter.row(1, "user", "slow write")])
+        self.wait_until_taken(writer)  # the writer now waits on the database
+        assert writer.flush_user(2, timeout=0.2)  # flush() would time out behind user 1's row
+        assert not writer.flush_user(1, timeout=0.05)
+        make_writer.gate.set()
+        assert writer.flush_user(1)
+
+    def test_bad_row_does_not_lose_its_batch(self, make_writer):
+        writer = make_writer(retry_attempts=1)
+        make_writer.gate.set()
+        bad = dict(ChatHistoryWriter.row(1, "user", "bad"), timestamp="not a timestamp")
+        writer.submit([ChatHistoryWriter.row(1, "user", "first"), bad, ChatHistoryWriter.row(1, "user", "last")])
+        assert writer.flush()
+        assert [row.content for row in make_writer.rows()] == ["first", "last"]
+        assert writer.stats()["failed"] == 1 and writer.stats()["written"] == 2
+
+    def test_full_queue_applies_backpressure_then_drops(self, make_writer):
+        writer = make_writer(max_queue=2, enqueue_timeout=0.05)
+        writer.submit([ChatHistoryWriter.row(1, "user", "taken")])
+        self.wait_until_taken(writer)
+        assert writer.submit([ChatHistoryWriter.row(1, "user", f"queued {i}") for i in range(2)])
+        assert not writer.submit([ChatHistoryWriter.row(1, "user", "dropped")])
+
+        stats = writer.stats()
+        assert stats["backpressure_waits"] == 1 and stats["dropped"] == 1 and stats["pending"] == 2
+
+    def test_stop_writes_queued_rows(self, make_writer):
+        writer = make_writer()
+        make_writer.gate.set()
+        writer.submit([ChatHistoryWriter.row(1, "user", "hi"), ChatHistoryWriter.row(1, "assistant", "hello")])
+        writer.stop()
+        assert [(row.role, row.content) for row in make_writer.rows()] == [("user", "hi"), ("assistant", "hello")]
+        assert not writer.stats()["running"]
+
+
+class TestHistoryPurger:
+    """Test clearing chat history as a watermark plus a batched background purge"""
+
+    def test_clear_hides_history_until_purged(self):
+        headers = {"Authorization": f"Bearer {user_token}"}
+        client.post("/api/chat", json={"messages": [{"role": "user", "content": "Before clearing"}]}, headers=headers)
+        response = client.delete("/api/chat/history", headers=headers)
+        assert response.status_code == 200
+        assert client.get("/api/chat/history", headers=headers).json()["history"] == []
+
+        client.post("/api/chat", json={"messages": [{"role": "user", "content": "After clearing"}]}, headers=headers)
+        history = client.get("/api/chat/history", headers=headers).json()["history"]
+        assert [msg["content"] for msg in history if msg["role"] == "user"] == ["After clearing"]
+
+    def test_purges_in_bounded_batches(self, tmp_path):
+        db_engine = create_engine(f"sqlite:///{tmp_path / 'purge.db'}")
+        Base.metadata.create_all(bind=db_engine)
+        sessions = sessionmaker(bind=db_engine)
+        now = datetime.utcnow()
+        db = sessions()
+        db.add(User(id=1, email="purge@codecampus.ai", name="Purge", hashed_password="x",
+                    history_cleared_before=now))
+        db.add_all([ChatHistory(user_id=1, role="user", content=f"old {i}", timestamp=now - timedelta(minutes=1))
+                    for i in range(25)])
+        db.add(ChatHistory(user_id=1, role="user", content="new", timestamp=now + timedelta(seconds=1)))
+        db.commit()
+        db.close()
+
+        purger = HistoryPurger(sessions, batch_size=10, pause=0)
+        purger.schedule(1)
+        deadline = time.time() + 5
+        while purger.stats()["pending_users"] and time.time() < deadline:
+            time.sleep(0.01)
+        purger.stop()
+
+        stats = purger.stats()
+        assert stats["purged"] == 25 and stats["batches"] == 3 and stats["users_done"] == 1
+        assert [row.content for row in sessions().query(ChatHistory).all()] == ["new"]
+
+    def test_restart_resumes_only_unfinished_purges(self, tmp_path):
+        db_engine = create_engine(f"sqlite:///{tmp_path / 'resume.db'}")
+        Base.metadata.create_all(bind=db_engine)
+        sessions = sessionmaker(bind=db_engine)
+        now = datetime.utcnow()
+        db = sessions()
+        db.add_all([User(id=user_id, email=f"resume{user_id}@codecampus.ai", name="Resume", hashed_password="x",
+                         history_cleared_before=now) for user_id in (1, 2)])
+        db.add(ChatHistory(user_id=1, role="user", content="old", timestamp=now - timedelta(minutes=1)))
+        db.add(ChatHistory(user_id=2, role="user", content="new", timestamp=now + timedelta(seconds=1)))
+        db.commit()
+        db.close()
+
+        purger = HistoryPurger(sessions)
+        purger._resume_pending()
+        assert purger.stats()["pending_users"] == 1
+        assert purger._pending == {1}
+
+    def test_failing_purge_is_retried_then_dropped(self, tmp_path):
+        db_engine = create_engine(f"sqlite:///{tmp_path / 'failing.db'}")
+        sessions = sessionmaker(bind=db_engine)  # no tables: every batch fails
+
+        purger = HistoryPurger(sessions, pause=0, max_retries=2, retry_backoff=0)
+        purger.schedule(1)
+        deadline = time.time() + 5
+        while purger.stats()["pending_users"] and time.time() < deadline:
+            time.sleep(0.01)
+        purger.stop()
+
+        stats = purger.stats()
+        assert stats["failed_batches"] == 3 and stats["users_dropped"] == 1 and stats["users_done"] == 0
+
+        backoff = HistoryPurger(sessions, pause=0, retry_backoff=1, max_backoff=3)
+        assert [backoff._after_batch(2, None) for _ in range(3)] == [1, 2, 3]
+
+
 # Run tests
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "--tb=short"])
-
@@ -0,0 +1,53 @@
+"""
+Startup Tests - guard worker cold-start time against heavy imports creeping back in
+Run with: pytest test_startup.py -v
+"""
+
+import os
+import subprocess
+import sys
+
+# Budget for our own import work on top of FastAPI, as a multiple of importing FastAPI itself in the
+# same process, so it scales with the speed and load of the machine (override with IMPORT_TIME_BUDGET_RATIO)
+IMPORT_TIME_BUDGET_RATIO = float(os.getenv("IMPORT_TIME_BUDGET_RATIO", "2.0"))
+
+# SDKs that must only be imported when first used
+LAZY_MODULES = ["google.generativeai", "google.oauth2", "PyPDF2", "openai", "anthropic", "langchain"]
+
+
+def import_times(module: str):
+    """Run `python -X importtime -c "import <module>"` and return {module: cumulative microseconds}"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        timeout=60
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+class TestStartup:
+    """Test that importing the app stays cheap"""
+
+    def test_heavy_sdks_are_not_imported_at_startup(self):
+        times = import_times("main")
+        loaded = [name for name in LAZY_MODULES if name in times]
+        assert loaded == []
+
+    def test_import_time_budget(self):
+        # Best of three runs, to ignore one-off stalls
+        ratios = []
+        for _ in range(3):
+            times = import_times("main")
+            ratios.append((times["main"] - times["fastapi"]) / times["fastapi"])
+        ratio = min(ratios)
+        assert ratio < IMPORT_TIME_BUDGET_RATIO, f"importing main took {ratio:.1f}x the time of FastAPI on top of it"
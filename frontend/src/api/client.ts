@@ -84,44 +84,80 @@ export const chatAPI = {
       throw new Error('Failed to connect to streaming endpoint')
     }
 
-    const reader = response.body?.getReader()
-    const decoder = new TextDecoder()
+    // Events carry ids; if the connection drops before "done", reconnect to the
+    // stream with Last-Event-ID and the server replays only what was missed
+    let streamId = ''
+    let lastEventId = ''
+    let current: Response = response
 
-    if (!reader) {
-      throw new Error('No reader available')
-    }
+    for (let attempt = 0; attempt <= 3; attempt++) {
+      const reader = current.body?.getReader()
+      const decoder = new TextDecoder()
 
-    try {
-      while (true) {
-        const { done, value } = await reader.read()
-        if (done) break
-
-        const chunk = decoder.decode(value)
-        const lines = chunk.split('\n')
-
-        for (const line of lines) {
-          if (line.startsWith('data: ')) {
-            const data = JSON.parse(line.slice(6))
-            
-            if (data.error) {
-              onError(data.error)
-              return
-            }
-            
-            if (data.done) {
-              onComplete()
-              return
-            }
-            
-            if (data.chunk) {
-              onChunk(data.chunk)
+      if (!reader) {
+        throw new Error('No reader available')
+      }
+
+      let buffer = ''
+      try {
+        while (true) {
+          const { done, value } = await reader.read()
+          if (done) break
+
+          buffer += decoder.decode(value, { stream: true })
+          const frames = buffer.split('\n\n')
+          buffer = frames.pop() ?? ''
+
+          for (const frame of frames) {
+            for (const line of frame.split('\n')) {
+              if (line.startsWith('id: ')) {
+                lastEventId = line.slice(4)
+              } else if (line.startsWith('data: ')) {
+                const data = JSON.parse(line.slice(6))
+
+                if (data.stream_id) {
+                  streamId = data.stream_id
+                }
+
+                if (data.error) {
+                  onError(data.error)
+                  return
+                }
+
+                if (data.done) {
+                  onComplete()
+                  return
+                }
+
+                if (data.chunk) {
+                  onChunk(data.chunk)
+                }
+              }
             }
           }
         }
+      } catch (error) {
+        if (!streamId) {
+          onError(error instanceof Error ? error.message : 'Streaming error')
+          return
+        }
       }
-    } catch (error) {
-      onError(error instanceof Error ? error.message : 'Streaming error')
+
+      if (!streamId) break
+      try {
+        current = await fetch(`${API_BASE_URL}/chat/stream/${streamId}`, {
+          headers: {
+            'Authorization': `Bearer ${token}`,
+            'Last-Event-ID': lastEventId
+          }
+        })
+      } catch {
+        break
+      }
+      if (!current.ok) break
     }
+
+    onError('Connection lost while streaming the response')
   },
   
   explainTopic: (data: ExplainTopicRequest) => 